@@ -0,0 +1,86 @@
+# Бенчмарк: N запросов GET /product_guide/{product_name} против одного
+# POST /product_guide/batch.
+#
+# Запуск из папки api/ при запущенном API:
+#     python benchmarks/bench_product_lookup.py --url http://localhost:8000 --count 100
+#
+# Названия продуктов берутся из product_guide (DATABASE_URL). Одиночные запросы
+# замеряются последовательно (как их делает веб-приложение) и параллельно;
+# пакетный запрос — в обоих форматах ответа. Результаты проверяются на совпадение.
+import argparse
+import asyncio
+import os
+import time
+from urllib.parse import quote
+
+import asyncpg
+import httpx
+
+
+async def product_names(count: int) -> list:
+    connection = await asyncpg.connect(os.environ["DATABASE_URL"])
+    try:
+        rows = await connection.fetch('SELECT product FROM "product_guide" ORDER BY product LIMIT $1', count)
+    finally:
+        await connection.close()
+    return [row["product"] for row in rows]
+
+
+async def timed(coro_func, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await coro_func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+async def run(args):
+    names = await product_names(args.count)
+    if not names:
+        raise SystemExit("product_guide is empty")
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        async def get_one(name):
+            response = await client.get(f"/product_guide/{quote(name, safe='')}")
+            response.raise_for_status()
+            return response.json()
+
+        async def sequential():
+            return [await get_one(name) for name in names]
+
+        async def concurrent():
+            return await asyncio.gather(*(get_one(name) for name in names))
+
+        async def batch(output):
+            response = await client.post(f"/product_guide/batch?output={output}", json={"names": names})
+            response.raise_for_status()
+            return response.json()
+
+        sequential_time, singles = await timed(sequential, args.repeat)
+        concurrent_time, _ = await timed(concurrent, args.repeat)
+        keyed_time, keyed = await timed(lambda: batch("keyed"), args.repeat)
+        columnar_time, columnar = await timed(lambda: batch("columnar"), args.repeat)
+
+    assert {p["product"]: p["id"] for p in singles} == {k: p["id"] for k, p in keyed["products"].items()}
+    assert sorted(columnar["columns"]["product"]) == sorted(names)
+
+    print(f"products: {len(names)}")
+    print(f"single, sequential: {sequential_time:8.3f} s")
+    print(f"single, concurrent: {concurrent_time:8.3f} s")
+    print(f"batch, keyed:       {keyed_time:8.3f} s")
+    print(f"batch, columnar:    {columnar_time:8.3f} s")
+    print(f"speedup vs sequential: {sequential_time / keyed_time:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# data_loader_api/app/admin.py
+# Проверка доступа к служебным эндпоинтам (профилирование и т.п.) и к эндпоинтам бота
+import hmac
+
+from fastapi import Header, HTTPException, status
+
+from .config import ADMIN_API_TOKEN, BOT_API_TOKEN
+
+
+def _tokens_equal(token: str, expected: str) -> bool:
+    # compare_digest для str принимает только ASCII, а заголовок может содержать любые
+    # байты (Starlette декодирует их как latin-1): сравниваем байты, чтобы ответить 403, а не 500
+    return hmac.compare_digest(token.encode(), expected.encode())
+
+
+def is_admin_token(token: str) -> bool:
+    return bool(ADMIN_API_TOKEN) and bool(token) and _tokens_equal(token, ADMIN_API_TOKEN)
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    """Зависимость FastAPI: запрос должен содержать X-Admin-Token, равный ADMIN_API_TOKEN."""
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin endpoints are disabled (ADMIN_API_TOKEN is not set)")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+
+def require_bot(x_bot_token: str = Header(None)):
+    """Зависимость FastAPI: запрос должен прийти от Telegram-бота (X-Bot-Token, равный BOT_API_TOKEN)."""
+    if not BOT_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Bot endpoints are disabled (BOT_API_TOKEN is not set)")
+    if not x_bot_token or not _tokens_equal(x_bot_token, BOT_API_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid bot token")
@@ -0,0 +1,194 @@
+# data_loader_api/app/admission.py
+# Допуск запросов и сброс нагрузки.
+#
+# Запросы делятся на классы маршрутов: загрузки (upload), выгрузки (export) и
+# чтение (reads). У каждого класса свой лимит одновременно выполняющихся
+# запросов и ограниченная очередь ожидающих. Если очередь полна, запрос сразу
+# получает 429, если место не освободилось за ADMISSION_QUEUE_TIMEOUT_SECONDS —
+# 503; оба ответа с Retry-After. Под перегрузкой клиенты быстро получают отказ,
+# а не ждут таймаута, и задержка допущенных запросов остаётся предсказуемой.
+# Место освобождается, когда ответ отправлен целиком (выгрузка держит
+# соединение с БД всё время передачи).
+#
+# Задачи загрузки выполняются в пуле потоков (INGEST_WORKERS) уже после ответа
+# клиенту, поэтому отдельно ограничено число задач в работе и в очереди к пулу
+# (ingest_jobs): сверх INGEST_MAX_PENDING_JOBS новая задача получает 503, а не
+# копится в памяти.
+import asyncio
+import threading
+from concurrent.futures import Executor, Future
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import ORJSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .config import (
+    ADMISSION_UPLOAD_CONCURRENCY, ADMISSION_UPLOAD_QUEUE,
+    ADMISSION_EXPORT_CONCURRENCY, ADMISSION_EXPORT_QUEUE,
+    ADMISSION_READ_CONCURRENCY, ADMISSION_READ_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT_SECONDS, ADMISSION_RETRY_AFTER_SECONDS,
+    INGEST_MAX_PENDING_JOBS, INGEST_RETRY_AFTER_SECONDS,
+)
+
+# Класс маршрута -> методы и префиксы путей. Остальные запросы (статус задач,
+# вход через бота, служебные эндпоинты) не ограничиваются
+ROUTE_CLASSES = {
+    "upload": ({"POST", "PUT"}, ("/upload_all_data/", "/uploads/", "/stream/", "/ingest/", "/snapshots/")),
+    "export": ({"GET", "HEAD"}, ("/export/", "/xlsx_reports/")),
+    "reads": ({"GET", "HEAD", "POST"}, (
+        "/product_guide/", "/submission_coverage/", "/shortages/", "/moved_progress/",
+        "/remains/", "/submissions/", "/payment/", "/divisions/",
+    )),
+}
+
+
+class RouteLimiter:
+    """Лимит одновременных запросов класса маршрутов с ограниченной очередью."""
+
+    def __init__(self, name: str, concurrency: int, queue_size: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def acquire(self, timeout: float) -> Optional[int]:
+        """None — запрос допущен, иначе код отказа: 429 (очередь полна) или 503 (не дождался места)."""
+        # locked() учитывает и ожидающих: новый запрос не обгоняет очередь
+        if self._semaphore.locked():
+            if self.waiting >= self.queue_size:
+                self.rejected_queue_full += 1
+                return status.HTTP_429_TOO_MANY_REQUESTS
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                return status.HTTP_503_SERVICE_UNAVAILABLE
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        self.admitted += 1
+        return None
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
+
+
+LIMITERS = {
+    "upload": RouteLimiter("upload", ADMISSION_UPLOAD_CONCURRENCY, ADMISSION_UPLOAD_QUEUE),
+    "export": RouteLimiter("export", ADMISSION_EXPORT_CONCURRENCY, ADMISSION_EXPORT_QUEUE),
+    "reads": RouteLimiter("reads", ADMISSION_READ_CONCURRENCY, ADMISSION_READ_QUEUE),
+}
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    for name, (methods, prefixes) in ROUTE_CLASSES.items():
+        if method in methods and path.startswith(prefixes):
+            return name
+    return None
+
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        name = route_class(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        limiter = LIMITERS[name]
+        rejected = await limiter.acquire(ADMISSION_QUEUE_TIMEOUT_SECONDS)
+        if rejected is not None:
+            detail = "Too many requests in the queue" if rejected == status.HTTP_429_TOO_MANY_REQUESTS else "Server is overloaded"
+            response = ORJSONResponse(
+                {"detail": f"{detail} ({name}), try again later"},
+                status_code=rejected,
+                headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+class JobSlots:
+    """
+    Задачи, отправленные в пул потоков: выполняются или ждут свободного потока.
+    Место занимается в обработчике запроса (reserve) и освобождается, когда
+    задача завершилась или была отменена.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        # Освобождение приходит из потока пула
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            if self.pending >= self.limit:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many ingest jobs in progress, try again later",
+                    headers={"Retry-After": str(INGEST_RETRY_AFTER_SECONDS)},
+                )
+            self.pending += 1
+
+    def release(self):
+        with self._lock:
+            self.pending -= 1
+
+    def check(self):
+        """Отказ до чтения файлов, если места для задачи сейчас нет (место не занимает)."""
+        self.reserve()
+        self.release()
+
+    def submit(self, executor: Executor, fn, *args) -> Future:
+        """Отправляет в пул задачу с уже занятым местом (reserve)."""
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self.release()
+            raise
+        self.submitted += 1
+        future.add_done_callback(lambda _: self.release())
+        return future
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "pending": self.pending, "submitted": self.submitted, "rejected": self.rejected}
+
+
+ingest_jobs = JobSlots(INGEST_MAX_PENDING_JOBS)
+
+
+def admission_stats() -> Dict[str, dict]:
+    return {
+        "routes": {name: limiter.stats() for name, limiter in LIMITERS.items()},
+        "ingest_jobs": ingest_jobs.stats(),
+    }
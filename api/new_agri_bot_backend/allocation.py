@@ -0,0 +1,94 @@
+# data_loader_api/app/allocation.py
+# Распределение складского остатка по утверждённым заявкам.
+#
+# Бот показывает только общий "вільний залишок = склад - під заявками" по продукту.
+# Здесь при загрузке данных остаток (Remains.skl) распределяется по каждой
+# утверждённой заявке с неотгруженным количеством (different > 0) в порядке
+# приоритета: период, статус доставки, доповнення. Результат пишется в таблицу
+# SubmissionCoverage, и вопрос "покрита ли моя заявка" становится простым поиском.
+# Там же строится отчёт о дефиците (Shortage): продукты, по которым спрос
+# утверждённых заявок больше складского остатка.
+import pandas as pd
+
+# Те же условия, что и в боте (bot/utils/db/get_submissions.py)
+APPROVED_STATUS = "затверджено"
+
+COVERAGE_FULL = "full"
+COVERAGE_PARTIAL = "partial"
+COVERAGE_NONE = "none"
+
+
+def approved_demand(submissions: pd.DataFrame) -> pd.DataFrame:
+    """Утверждённые заявки с неотгруженным количеством (different > 0)."""
+    return submissions.loc[
+        (submissions["document_status"] == APPROVED_STATUS) & (submissions["different"] > 0)
+    ]
+
+
+def stock_by_product(remains: pd.DataFrame) -> pd.Series:
+    """Складской остаток (skl) по id продукта."""
+    return remains.groupby("product")["skl"].sum()
+
+
+def allocate_stock(submissions: pd.DataFrame, remains: pd.DataFrame) -> pd.DataFrame:
+    """
+    Распределяет остаток по заявкам без циклов: внутри каждого продукта заявки
+    сортируются по приоритету, нарастающий итог спроса (groupby().cumsum())
+    показывает, сколько остатка уже занято заявками выше по очереди.
+    allocated = clip(stock - спрос_до_заявки, 0, спрос_заявки).
+    """
+    demand = approved_demand(submissions)[[
+        "id", "product", "manager", "client", "contract_supplement",
+        "period", "delivery_status", "different",
+    ]].copy()
+
+    # Период в отчёте — строка; сортируем по дате, если она разбирается, иначе по тексту
+    demand["_period"] = pd.to_datetime(demand["period"], errors="coerce", dayfirst=True, format="mixed")
+    demand = demand.sort_values(
+        ["product", "_period", "period", "delivery_status", "contract_supplement"],
+        kind="stable", na_position="last",
+    )
+
+    demand["stock"] = demand["product"].map(stock_by_product(remains)).fillna(0).clip(lower=0)
+    demand["demand_before"] = demand.groupby("product")["different"].cumsum() - demand["different"]
+    demand["allocated"] = (demand["stock"] - demand["demand_before"]).clip(lower=0)
+    demand["allocated"] = demand["allocated"].where(demand["allocated"] < demand["different"], demand["different"])
+    demand["shortfall"] = demand["different"] - demand["allocated"]
+    demand["priority"] = demand.groupby("product").cumcount() + 1
+
+    demand["coverage"] = COVERAGE_NONE
+    demand.loc[demand["allocated"] > 0, "coverage"] = COVERAGE_PARTIAL
+    demand.loc[demand["shortfall"] <= 0, "coverage"] = COVERAGE_FULL
+
+    coverage = demand.rename(columns={"id": "submission", "different": "demand"})[[
+        "submission", "product", "manager", "client", "contract_supplement", "period",
+        "priority", "stock", "demand", "allocated", "shortfall", "coverage",
+    ]].reset_index(drop=True)
+    return coverage
+
+
+def _join_unique(values: pd.Series) -> str:
+    return ", ".join(sorted({value.strip() for value in values if value and value.strip()}))
+
+
+def build_shortages(submissions: pd.DataFrame, remains: pd.DataFrame, product_guide: pd.DataFrame) -> pd.DataFrame:
+    """
+    Дефицит по продуктам одним group-by: спрос утверждённых заявок против
+    складского остатка, плюс менеджеры и контрагенты, чьи заявки затронуты.
+    """
+    demand = approved_demand(submissions).groupby("product").agg(
+        demand=("different", "sum"),
+        submissions_count=("different", "size"),
+        managers=("manager", _join_unique),
+        clients=("client", _join_unique),
+    )
+    demand["skl"] = stock_by_product(remains).reindex(demand.index).fillna(0)
+    demand["deficit"] = demand["demand"] - demand["skl"].clip(lower=0)
+
+    shortages = demand.loc[demand["deficit"] > 0].reset_index()
+    shortages["product_name"] = shortages["product"].map(product_guide.set_index("id")["product"])
+    shortages = shortages.sort_values("deficit", ascending=False, kind="stable")
+    return shortages[[
+        "product", "product_name", "skl", "demand", "deficit",
+        "submissions_count", "managers", "clients",
+    ]].reset_index(drop=True)
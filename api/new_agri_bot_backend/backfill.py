@@ -0,0 +1,266 @@
+# data_loader_api/app/backfill.py
+# Загрузка архивных ежедневных выгрузок 1С в историю (для анализа трендов).
+#
+# В отличие от /upload_all_data/, который заменяет текущие данные, backfill
+# дописывает очищенные наборы данных каждого дня в таблицы *History
+# с колонкой snapshot_date. Структура архива — по одному элементу на день,
+# дата берётся из имени (2025-03-14, 14.03.2025 или 20250314):
+#   archive/2025-03-14/Остатки.xlsx, Заявки.xlsx, ...   (каталог с файлами дня)
+#   archive/2025-03-15.zip                              (архив дня, как bundle_file)
+#
+# Разбор файлов идёт в пуле процессов (pandas держит GIL), запись — через COPY,
+# каждый день в одной транзакции. Загруженные дни отмечаются в HistoryLoad,
+# поэтому прерванный backfill продолжается с того же места.
+#
+#   python -m new_agri_bot_backend.backfill /path/to/archive --workers 8
+#   piccolo new_agri_bot_backend backfill_history /path/to/archive
+import argparse
+import asyncio
+import datetime
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import asyncpg
+
+from .config import DATABASE_URL, BACKFILL_WORKERS
+from .tables import (
+    RemainsHistory, SubmissionsHistory, AvailableStockHistory, PaymentHistory, MovedDataHistory,
+    HistoryLoad,
+)
+
+HISTORY_TABLES = {
+    "submissions": SubmissionsHistory,
+    "av_stock": AvailableStockHistory,
+    "remains": RemainsHistory,
+    "payment": PaymentHistory,
+    "moved_data": MovedDataHistory,
+}
+
+# Форматы даты в имени элемента архива: (шаблон, порядок групп)
+DATE_PATTERNS = [
+    (re.compile(r"(\d{4})-(\d{2})-(\d{2})"), "ymd"),
+    (re.compile(r"(\d{2})\.(\d{2})\.(\d{4})"), "dmy"),
+    (re.compile(r"(\d{4})(\d{2})(\d{2})"), "ymd"),
+]
+
+
+def snapshot_date_from_name(name: str):
+    for pattern, order in DATE_PATTERNS:
+        match = pattern.search(name)
+        if not match:
+            continue
+        parts = dict(zip(order, match.groups()))
+        try:
+            return datetime.date(int(parts["y"]), int(parts["m"]), int(parts["d"]))
+        except ValueError:
+            continue
+    return None
+
+
+def discover_days(archive_dir: str) -> list:
+    """Элементы архива с датой в имени: [(snapshot_date, path)], по возрастанию даты."""
+    days = {}
+    for name in sorted(os.listdir(archive_dir)):
+        snapshot_date = snapshot_date_from_name(name)
+        if snapshot_date is None:
+            print(f"Skipped (no date in name): {name}")
+            continue
+        if snapshot_date in days:
+            raise ValueError(f"Two archive entries for {snapshot_date}: {days[snapshot_date]} and {name}")
+        days[snapshot_date] = os.path.join(archive_dir, name)
+    return sorted(days.items())
+
+
+def read_day(path: str):
+    """Содержимое и формат файлов одного дня (каталог или архив)."""
+    from .bundles import match_dataset, read_bundle
+    from .uploads import file_format_from_name
+
+    if not os.path.isdir(path):
+        with open(path, "rb") as f:
+            contents, file_formats, _ = read_bundle(f)
+        return contents, file_formats
+
+    contents, file_formats = {}, {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            dataset = match_dataset(name)
+            if dataset is None:
+                continue
+            if dataset in contents:
+                raise ValueError(f"More than one file for {dataset} in {path}")
+            with open(os.path.join(root, name), "rb") as f:
+                contents[dataset] = f.read()
+            file_formats[dataset] = file_format_from_name(name)
+    return contents, file_formats
+
+
+def history_frame(table, frame, snapshot_date: datetime.date):
+    """Приводит очищенный набор данных к колонкам таблицы истории."""
+    import pandas as pd
+    from piccolo.columns import DoublePrecision
+
+    frame = frame.copy()
+    for column in table._meta.columns:
+        name = column._meta.db_column_name
+        if name in ("id", "snapshot_date"):
+            continue
+        if isinstance(column, DoublePrecision):
+            frame[name] = pd.to_numeric(frame[name], errors="coerce").fillna(0)
+        else:
+            frame[name] = frame[name].fillna("").astype(str)
+    frame["snapshot_date"] = snapshot_date
+    frame["id"] = [uuid.uuid4() for _ in range(len(frame))]
+    return frame
+
+
+def parse_day(snapshot_date: datetime.date, path: str) -> dict:
+    """Выполняется в процессе пула: разбор всех файлов одного дня."""
+    from .divisions import default_division, filter_remains
+    from .ingest import PROCESSORS
+
+    start = time.perf_counter()
+    try:
+        contents, file_formats = read_day(path)
+        if not contents:
+            raise ValueError("no dataset files found")
+        frames = {
+            dataset: PROCESSORS[dataset](content, file_formats[dataset])
+            for dataset, content in contents.items()
+        }
+        # Архив — выгрузки подразделения по умолчанию: остатки по его складам и направлениям
+        if "remains" in frames:
+            frames["remains"] = filter_remains(frames["remains"], default_division())
+        frames = {
+            dataset: history_frame(HISTORY_TABLES[dataset], frame, snapshot_date)
+            for dataset, frame in frames.items()
+        }
+    except Exception as e:
+        return {"snapshot_date": snapshot_date, "source": path, "error": str(getattr(e, "detail", e))}
+    return {
+        "snapshot_date": snapshot_date,
+        "source": path,
+        "frames": frames,
+        "files": len(frames),
+        "parse_seconds": time.perf_counter() - start,
+    }
+
+
+async def loaded_dates(pool: asyncpg.Pool) -> set:
+    rows = await pool.fetch(f'SELECT snapshot_date FROM "{HistoryLoad._meta.tablename}"')
+    return {row["snapshot_date"] for row in rows}
+
+
+async def copy_day(pool: asyncpg.Pool, day: dict) -> int:
+    """Записывает день в таблицы истории одной транзакцией: повтор дня заменяет его строки."""
+    from .loader import frame_records, table_columns
+
+    rows = 0
+    start = time.perf_counter()
+    async with pool.acquire() as connection:
+        async with connection.transaction():
+            for dataset, frame in day["frames"].items():
+                table = HISTORY_TABLES[dataset]
+                table_name = table._meta.tablename
+                columns = table_columns(table)
+                await connection.execute(f'DELETE FROM "{table_name}" WHERE snapshot_date = $1', day["snapshot_date"])
+                await connection.copy_records_to_table(table_name, records=frame_records(frame, columns), columns=columns)
+                rows += len(frame)
+            await connection.execute(
+                f'INSERT INTO "{HistoryLoad._meta.tablename}" '
+                '(id, snapshot_date, source, datasets, rows, seconds, loaded_at) '
+                'VALUES ($1, $2, $3, $4, $5, $6, now()) '
+                'ON CONFLICT (snapshot_date) DO UPDATE SET source = EXCLUDED.source, '
+                'datasets = EXCLUDED.datasets, rows = EXCLUDED.rows, seconds = EXCLUDED.seconds, loaded_at = now()',
+                uuid.uuid4(), day["snapshot_date"], day["source"], ",".join(sorted(day["frames"])), rows,
+                day["parse_seconds"] + time.perf_counter() - start,
+            )
+    return rows
+
+
+async def backfill(archive_dir: str, workers: int = BACKFILL_WORKERS, force: bool = False) -> dict:
+    """
+    Загружает все дни архива, которых ещё нет в HistoryLoad (force=True — все дни заново).
+    Возвращает сводку: загружено/пропущено/с ошибкой, файлы и строки в секунду.
+    """
+    days = discover_days(archive_dir)
+    pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=2)
+    try:
+        done = set() if force else await loaded_dates(pool)
+        todo = [(snapshot_date, path) for snapshot_date, path in days if snapshot_date not in done]
+        print(f"Backfill: {len(days)} days in archive, {len(days) - len(todo)} already loaded, {len(todo)} to load.")
+
+        loop = asyncio.get_running_loop()
+        stats = {"days": 0, "files": 0, "rows": 0, "failed": {}}
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Не больше двух разобранных дней на процесс ждут записи — ограничиваем память
+            pending = set()
+            queue = list(todo)
+            while queue or pending:
+                while queue and len(pending) < workers * 2:
+                    snapshot_date, path = queue.pop(0)
+                    pending.add(loop.run_in_executor(executor, parse_day, snapshot_date, path))
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in finished:
+                    day = future.result()
+                    if "error" in day:
+                        stats["failed"][str(day["snapshot_date"])] = day["error"]
+                        print(f"{day['snapshot_date']}: FAILED ({day['error']})")
+                        continue
+                    rows = await copy_day(pool, day)
+                    stats["days"] += 1
+                    stats["files"] += day["files"]
+                    stats["rows"] += rows
+                    elapsed = time.perf_counter() - start
+                    print(
+                        f"{day['snapshot_date']}: {day['files']} files, {rows} rows | "
+                        f"{stats['days']}/{len(todo)} days, "
+                        f"{stats['files'] / elapsed:.2f} files/s, {stats['rows'] / elapsed:.0f} rows/s"
+                    )
+    finally:
+        await pool.close()
+
+    elapsed = time.perf_counter() - start
+    stats["skipped"] = len(days) - len(todo)
+    stats["seconds"] = round(elapsed, 3)
+    stats["files_per_second"] = round(stats["files"] / elapsed, 2) if elapsed else None
+    stats["rows_per_second"] = round(stats["rows"] / elapsed) if elapsed else None
+    print(
+        f"Backfill done: {stats['days']} days, {stats['files']} files, {stats['rows']} rows in {stats['seconds']}s "
+        f"({stats['files_per_second']} files/s, {stats['rows_per_second']} rows/s), "
+        f"{stats['skipped']} skipped, {len(stats['failed'])} failed."
+    )
+    return stats
+
+
+# --- Команда Piccolo (см. piccolo_app.py) ---
+
+async def backfill_history(archive_dir: str, workers: int = 0, force: bool = False):
+    """
+    Загрузить архив ежедневных выгрузок 1С в таблицы истории.
+
+    :param archive_dir:
+        Каталог архива: по одному каталогу или zip/tar.zst на день, дата в имени.
+    :param workers:
+        Количество процессов для разбора файлов (0 — BACKFILL_WORKERS).
+    :param force:
+        Загрузить заново и уже загруженные дни.
+    """
+    await backfill(archive_dir, workers or BACKFILL_WORKERS, force)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load archived daily 1C exports into history tables.")
+    parser.add_argument("archive_dir")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--force", action="store_true", help="reload days that are already loaded")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.archive_dir, args.workers, args.force))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# data_loader_api/app/bundles.py
+# Приём всех наборов данных одним архивом (zip или tar.zst).
+#
+# Архив сначала сохраняется в спул на диск, затем его элементы распаковываются
+# прямо в спул-файлы (без промежуточной копии в памяти) и сопоставляются
+# с наборами данных по имени файла.
+import os
+import shutil
+import tarfile
+import unicodedata
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Tuple
+
+from fastapi import HTTPException, status
+
+from .config import DATASETS, UPLOAD_SPOOL_DIR, BUNDLE_MAX_UNCOMPRESSED_MB
+from .uploads import file_format_from_name
+
+# Имена файлов (без расширения), по которым элемент архива относится к набору данных.
+# Имя самого набора данных (например "remains.xlsx" или "remains.csv") тоже подходит.
+DATASET_FILE_NAMES = {
+    "submissions": ["Заявки"],
+    "av_stock": ["Доступность товара подразделения"],
+    "remains": ["Остатки"],
+    "payment": ["оплата"],
+    "moved_data": ["Заказано_Перемещено"],
+}
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def _normalize_name(name: str) -> str:
+    return unicodedata.normalize("NFC", name).strip().casefold()
+
+
+_NAME_TO_DATASET = {
+    _normalize_name(file_name): dataset
+    for dataset, names in DATASET_FILE_NAMES.items()
+    for file_name in names + [dataset]
+}
+
+
+def match_dataset(entry_name: str):
+    """Определяет набор данных по имени элемента архива. None — элемент не нужен."""
+    base_name = os.path.basename(entry_name.rstrip("/"))
+    stem, ext = os.path.splitext(base_name)
+    if file_format_from_name(base_name) is None:
+        return None
+    return _NAME_TO_DATASET.get(_normalize_name(stem))
+
+
+def _zip_entry_name(info: zipfile.ZipInfo) -> str:
+    # Архиватор Windows пишет кириллические имена в cp866 без флага UTF-8,
+    # а zipfile в этом случае декодирует их как cp437
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode("cp437").decode("cp866")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+def _check_missing(found: Dict[str, object]):
+    missing = [name for name in DATASETS if name not in found]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Bundle does not contain datasets: {missing}. "
+                   f"Expected file names: {DATASET_FILE_NAMES}."
+        )
+
+
+def _check_size(uncompressed_size: int):
+    # Защита от zip-бомб: размер распакованных данных ограничен
+    if uncompressed_size > BUNDLE_MAX_UNCOMPRESSED_MB * 1024 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Bundle unpacks to more than {BUNDLE_MAX_UNCOMPRESSED_MB} MB."
+        )
+
+
+def _extract_zip_entry(archive_path: str, info: zipfile.ZipInfo, target_path: str):
+    # У каждого потока свой дескриптор архива — ZipFile не потокобезопасен
+    with zipfile.ZipFile(archive_path) as archive, archive.open(info) as src, open(target_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+
+
+def _extract_zip(archive_path: str, spool_dir: str) -> Tuple[Dict[str, str], int]:
+    with zipfile.ZipFile(archive_path) as archive:
+        entries = {}
+        for info in archive.infolist():
+            dataset = match_dataset(_zip_entry_name(info))
+            if dataset is None or info.is_dir():
+                continue
+            if dataset in entries:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Bundle contains more than one file for {dataset}."
+                )
+            entries[dataset] = info
+
+    _check_missing(entries)
+    uncompressed_size = sum(info.file_size for info in entries.values())
+    _check_size(uncompressed_size)
+
+    paths = {
+        dataset: os.path.join(spool_dir, dataset + os.path.splitext(_zip_entry_name(info))[1].lower())
+        for dataset, info in entries.items()
+    }
+    # Распаковка deflate отпускает GIL, поэтому элементы распаковываются параллельно
+    with ThreadPoolExecutor(max_workers=len(entries)) as pool:
+        futures = [
+            pool.submit(_extract_zip_entry, archive_path, info, paths[dataset])
+            for dataset, info in entries.items()
+        ]
+        for future in futures:
+            future.result()
+    return paths, uncompressed_size
+
+
+def _extract_tar_zst(archive_path: str, spool_dir: str) -> Tuple[Dict[str, str], int]:
+    try:
+        import zstandard
+    except ImportError:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="tar.zst bundles are not supported: zstandard is not installed."
+        )
+
+    # tar.zst — последовательный поток, поэтому элементы распаковываются по очереди,
+    # но тоже сразу в спул, без буферизации всего архива
+    paths = {}
+    uncompressed_size = 0
+    with open(archive_path, "rb") as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f)
+        with tarfile.open(fileobj=reader, mode="r|") as archive:
+            for member in archive:
+                dataset = match_dataset(member.name)
+                if dataset is None or not member.isfile():
+                    continue
+                if dataset in paths:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Bundle contains more than one file for {dataset}."
+                    )
+                uncompressed_size += member.size
+                _check_size(uncompressed_size)
+                paths[dataset] = os.path.join(spool_dir, dataset + os.path.splitext(member.name)[1].lower())
+                with archive.extractfile(member) as src, open(paths[dataset], "wb") as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+    _check_missing(paths)
+    return paths, uncompressed_size
+
+
+def read_bundle(bundle: BinaryIO) -> Tuple[Dict[str, bytes], Dict[str, str], dict]:
+    """
+    Распаковывает архив со всеми наборами данных.
+    Возвращает содержимое и формат файлов по наборам данных и статистику передачи
+    (размер архива против размера распакованных файлов).
+    Синхронная — вызывается через executor.
+    """
+    spool_dir = os.path.join(UPLOAD_SPOOL_DIR, f"bundle_{uuid.uuid4().hex}")
+    os.makedirs(spool_dir, exist_ok=True)
+    try:
+        archive_path = os.path.join(spool_dir, "bundle")
+        with open(archive_path, "wb") as dst:
+            shutil.copyfileobj(bundle, dst, COPY_BUFFER_SIZE)
+        compressed_size = os.path.getsize(archive_path)
+
+        with open(archive_path, "rb") as f:
+            magic = f.read(len(ZSTD_MAGIC))
+
+        if zipfile.is_zipfile(archive_path):
+            paths, uncompressed_size = _extract_zip(archive_path, spool_dir)
+            bundle_format = "zip"
+        elif magic == ZSTD_MAGIC:
+            paths, uncompressed_size = _extract_tar_zst(archive_path, spool_dir)
+            bundle_format = "tar.zst"
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid bundle. Only zip or tar.zst archives are allowed."
+            )
+
+        contents = {}
+        for dataset, path in paths.items():
+            with open(path, "rb") as f:
+                contents[dataset] = f.read()
+        file_formats = {dataset: file_format_from_name(path) for dataset, path in paths.items()}
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    transfer = {
+        "format": bundle_format,
+        "compressed_bytes": compressed_size,
+        "uncompressed_bytes": uncompressed_size,
+        "ratio": round(uncompressed_size / compressed_size, 2) if compressed_size else None,
+    }
+    print(f"Bundle unpacked: {transfer}")
+    return contents, file_formats, transfer
@@ -0,0 +1,139 @@
+# data_loader_api/app/cache.py
+# Кеш результатов эндпоинтов чтения в памяти процесса.
+#
+# Запросы справочника продуктов, покрытия заявок, дефицита и прогресса
+# перемещений кешируются через alru_cache: не больше CACHE_MAXSIZE записей на
+# запрос (вытесняются давно не использованные) и не дольше CACHE_TTL_SECONDS.
+# Поколение данных (generation.py) входит в ключ, поэтому после загрузки
+# запросы идут в БД, даже если запись со старым поколением ещё не удалена.
+# Покрытие, дефицит и прогресс перемещений считаются по подразделению — код
+# подразделения тоже входит в ключ (справочник продуктов общий).
+#
+# Сброс кеша: bump_generation отправляет NOTIFY в канал GENERATION_CHANNEL,
+# каждый воркер uvicorn слушает его на отдельном соединении (listen_generation),
+# запоминает новое поколение и очищает кеши. После переподключения поколение
+# перечитывается из БД — уведомления без соединения не теряются.
+import asyncio
+
+import asyncpg
+from async_lru import alru_cache
+
+from .config import DATABASE_URL, CACHE_MAXSIZE, CACHE_TTL_SECONDS, CACHE_LISTEN_RETRY_SECONDS
+from .generation import GENERATION_CHANNEL, set_generation
+from .tables import ProductGuide, SubmissionCoverage, Shortage, MovedProgress
+
+
+@alru_cache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL_SECONDS)
+async def product_by_name(generation: int, product_name: str):
+    return await ProductGuide.select().where(ProductGuide.product == product_name).first()
+
+
+@alru_cache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL_SECONDS)
+async def coverage_by_product(generation: int, division_code: str, product_id: str):
+    return await SubmissionCoverage.select().where(
+        (SubmissionCoverage.division_code == division_code) & (SubmissionCoverage.product == product_id)
+    ).order_by(SubmissionCoverage.priority)
+
+
+@alru_cache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL_SECONDS)
+async def coverage_by_contract(generation: int, division_code: str, contract_supplement: str):
+    return await SubmissionCoverage.select().where(
+        (SubmissionCoverage.division_code == division_code)
+        & (SubmissionCoverage.contract_supplement == contract_supplement)
+    ).order_by(SubmissionCoverage.product, SubmissionCoverage.priority)
+
+
+@alru_cache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL_SECONDS)
+async def shortages_page(generation: int, division_code: str, page: int, page_size: int):
+    total = await Shortage.count().where(Shortage.division_code == division_code)
+    items = await Shortage.select().where(Shortage.division_code == division_code).order_by(
+        Shortage.deficit, ascending=False
+    ).limit(page_size).offset((page - 1) * page_size)
+    return total, items
+
+
+@alru_cache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL_SECONDS)
+async def moved_progress(generation: int, division_code: str, kind: str, key: str):
+    return await MovedProgress.select().where(
+        (MovedProgress.division_code == division_code) & (MovedProgress.kind == kind) & (MovedProgress.key == key)
+    ).first()
+
+
+CACHED_QUERIES = {
+    "product_by_name": product_by_name,
+    "coverage_by_product": coverage_by_product,
+    "coverage_by_contract": coverage_by_contract,
+    "shortages_page": shortages_page,
+    "moved_progress": moved_progress,
+}
+
+# cache_clear обнуляет счётчики alru_cache — накопленные значения храним здесь
+_totals = {name: {"hits": 0, "misses": 0} for name in CACHED_QUERIES}
+_state = {"listening": False, "invalidations": 0}
+
+
+def clear_caches():
+    for name, cached in CACHED_QUERIES.items():
+        info = cached.cache_info()
+        _totals[name]["hits"] += info.hits
+        _totals[name]["misses"] += info.misses
+        cached.cache_clear()
+    _state["invalidations"] += 1
+
+
+def cache_stats() -> dict:
+    queries = {}
+    for name, cached in CACHED_QUERIES.items():
+        info = cached.cache_info()
+        hits = _totals[name]["hits"] + info.hits
+        misses = _totals[name]["misses"] + info.misses
+        queries[name] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+        }
+    return {
+        "ttl_seconds": CACHE_TTL_SECONDS,
+        "listening": _state["listening"],
+        "invalidations": _state["invalidations"],
+        "queries": queries,
+    }
+
+
+def _on_generation(connection, pid, channel, payload):
+    set_generation(int(payload))
+    clear_caches()
+    print(f"Data generation {payload} received, caches cleared")
+
+
+async def listen_generation():
+    """
+    Слушает уведомления о новом поколении данных, пока задача не отменена
+    (запускается в lifespan приложения). При обрыве соединения переподключается.
+    """
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(DATABASE_URL)
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            await connection.add_listener(GENERATION_CHANNEL, _on_generation)
+            # Загрузки, завершившиеся, пока соединения не было
+            generation = await connection.fetchval('SELECT generation FROM "data_generation" WHERE id = 1')
+            if generation is not None:
+                set_generation(generation)
+            clear_caches()
+            _state["listening"] = True
+            await closed.wait()
+            print("Data generation listener connection lost, reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Data generation listener failed: {e}")
+        finally:
+            _state["listening"] = False
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(CACHE_LISTEN_RETRY_SECONDS)
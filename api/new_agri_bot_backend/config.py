@@ -45,4 +45,106 @@ valid_line_of_business = [
 valid_warehouse = [
     'Харківський підрозділ  ТОВ "Фірма Ерідон" с.Коротич',
     'Харківський підрозділ  ТОВ "Фірма Ерідон" м.Балаклія',
-]
\ No newline at end of file
+]
+
+# Подразделение по умолчанию (см. divisions.py): MANAGERS_ID, valid_line_of_business
+# и valid_warehouse — его начальные настройки, дальше они хранятся в таблице Division
+DEFAULT_DIVISION = "kharkiv"
+DEFAULT_DIVISION_NAME = "Харківський підрозділ"
+
+# Наборы данных, из которых состоит одна загрузка
+DATASETS = ["submissions", "av_stock", "remains", "payment", "moved_data"]
+
+# Каталог для спул-файлов возобновляемой загрузки
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "/tmp/agri_uploads")
+# Через сколько часов незавершённая сессия загрузки удаляется
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+# Максимальный размер распакованного архива с наборами данных (защита от zip-бомб)
+BUNDLE_MAX_UNCOMPRESSED_MB = int(os.getenv("BUNDLE_MAX_UNCOMPRESSED_MB", "1024"))
+# Каталог контрольных точек задач загрузки (исходные файлы, Parquet, статус этапов)
+INGEST_STATE_DIR = os.getenv("INGEST_STATE_DIR", "/tmp/agri_ingest")
+
+# Токен администратора для служебных эндпоинтов (заголовок X-Admin-Token).
+# Если не задан, служебные эндпоинты недоступны
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+# Общий секрет API и Telegram-бота (заголовок X-Bot-Token): только бот подтверждает
+# коды входа. Если не задан, подтверждение входа недоступно
+BOT_API_TOKEN = os.getenv("BOT_API_TOKEN")
+# Интервал сэмплирования профайлера загрузки и сколько мест выделения памяти сохранять
+PROFILE_SAMPLE_INTERVAL_MS = int(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_TOP_ALLOCATIONS = int(os.getenv("PROFILE_TOP_ALLOCATIONS", "25"))
+
+# Загрузка таблиц через COPY: размер пула соединений asyncpg, сколько строк
+# приходится на один поток COPY и максимум параллельных потоков на таблицу
+LOADER_POOL_SIZE = int(os.getenv("LOADER_POOL_SIZE", "8"))
+LOADER_COPY_STREAM_ROWS = int(os.getenv("LOADER_COPY_STREAM_ROWS", "50000"))
+LOADER_MAX_COPY_STREAMS = int(os.getenv("LOADER_MAX_COPY_STREAMS", "4"))
+
+# Архив снимков загруженных данных (Parquet) и сколько последних снимков хранить (0 — все)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "/tmp/agri_snapshots")
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "30"))
+
+# Загрузка архивных выгрузок в историю (backfill.py): процессов для разбора файлов
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", str(os.cpu_count() or 2)))
+
+# Потоковая загрузка NDJSON (streaming.py): строк в одной пачке COPY и максимальная длина строки
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "5000"))
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
+
+# Пул соединений API (database.py): размер и ограничение времени одного запроса в секундах
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_QUERY_TIMEOUT_SECONDS = float(os.getenv("DB_QUERY_TIMEOUT_SECONDS", "30"))
+
+# Максимум названий и id продуктов в одном запросе /product_guide/batch
+PRODUCT_BATCH_MAX = int(os.getenv("PRODUCT_BATCH_MAX", "500"))
+
+# Списки строк (listing.py): максимальный размер страницы и сколько строк курсор читает за раз
+LIST_PAGE_MAX = int(os.getenv("LIST_PAGE_MAX", "10000"))
+LIST_CURSOR_PREFETCH = int(os.getenv("LIST_CURSOR_PREFETCH", "500"))
+
+# Кеш эндпоинтов чтения (cache.py): записей на запрос, время жизни записи и пауза
+# перед переподключением слушателя уведомлений о новом поколении данных
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_LISTEN_RETRY_SECONDS = float(os.getenv("CACHE_LISTEN_RETRY_SECONDS", "5"))
+
+# Сжатие ответов (responses.py): минимальный размер тела, уровень gzip и качество brotli
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+# Выгрузки CSV/NDJSON/Arrow (exports.py): строк в одной пачке курсора
+EXPORT_CURSOR_PREFETCH = int(os.getenv("EXPORT_CURSOR_PREFETCH", "2000"))
+
+# Отчёты XLSX (xlsx_reports.py): каталог кеша по поколениям данных и процессов для построения,
+# сколько секунд каталог прошлого поколения хранится после последнего построенного в нём файла
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "/tmp/agri_reports")
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_GENERATION_GRACE_SECONDS = int(os.getenv("REPORT_GENERATION_GRACE_SECONDS", "600"))
+
+# Вход через бота (login.py): время жизни кода, шаг корзин очистки, максимум длинного
+# запроса ожидания и интервал пульса SSE
+LOGIN_TOKEN_TTL_SECONDS = int(os.getenv("LOGIN_TOKEN_TTL_SECONDS", "300"))
+LOGIN_SWEEP_SECONDS = float(os.getenv("LOGIN_SWEEP_SECONDS", "5"))
+LOGIN_WAIT_MAX_SECONDS = int(os.getenv("LOGIN_WAIT_MAX_SECONDS", "30"))
+LOGIN_SSE_HEARTBEAT_SECONDS = float(os.getenv("LOGIN_SSE_HEARTBEAT_SECONDS", "15"))
+# Максимум одновременно ожидающих кодов (защита памяти от потока запросов на создание)
+LOGIN_MAX_ACTIVE_TOKENS = int(os.getenv("LOGIN_MAX_ACTIVE_TOKENS", "10000"))
+
+# Допуск запросов (admission.py): сколько запросов класса маршрутов выполняется
+# одновременно и сколько ждёт в очереди. Сверх очереди — 429, не дождавшийся
+# места за ADMISSION_QUEUE_TIMEOUT_SECONDS — 503, оба с Retry-After
+ADMISSION_UPLOAD_CONCURRENCY = int(os.getenv("ADMISSION_UPLOAD_CONCURRENCY", "4"))
+ADMISSION_UPLOAD_QUEUE = int(os.getenv("ADMISSION_UPLOAD_QUEUE", "8"))
+ADMISSION_EXPORT_CONCURRENCY = int(os.getenv("ADMISSION_EXPORT_CONCURRENCY", "2"))
+ADMISSION_EXPORT_QUEUE = int(os.getenv("ADMISSION_EXPORT_QUEUE", "4"))
+ADMISSION_READ_CONCURRENCY = int(os.getenv("ADMISSION_READ_CONCURRENCY", "16"))
+ADMISSION_READ_QUEUE = int(os.getenv("ADMISSION_READ_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+# Пул потоков задач загрузки: потоков, максимум задач в работе и в очереди к пулу
+# и Retry-After отказа, когда очередь задач заполнена
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_MAX_PENDING_JOBS = int(os.getenv("INGEST_MAX_PENDING_JOBS", "8"))
+INGEST_RETRY_AFTER_SECONDS = int(os.getenv("INGEST_RETRY_AFTER_SECONDS", "60"))
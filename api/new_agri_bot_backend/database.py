@@ -1,19 +1,73 @@
 # data_loader_api/app/database.py
-from piccolo.engine.postgres import PostgresEngine
-from config import DATABASE_URL
-import urllib.parse
-
-# Парсим DATABASE_URL
-# urllib.parse.urlparse помогает разобрать URL на компоненты
-parsed_url = urllib.parse.urlparse(DATABASE_URL)
-
-DB_CONFIG = {
-    "host": parsed_url.hostname,
-    "database": parsed_url.path.lstrip("/"), # Убираем ведущий слэш
-    "user": parsed_url.username,
-    "password": parsed_url.password,
-    "port": parsed_url.port if parsed_url.port else 5432 # Если порт не указан, используем 5432 по умолчанию
-}
-
-# Создаем экземпляр движка Piccolo для PostgreSQL
-DB = PostgresEngine(config=DB_CONFIG)
\ No newline at end of file
+# Пул соединений с PostgreSQL для API.
+#
+# Таблицы Piccolo выполняют запросы через движок из piccolo_conf.py (engine_finder).
+# Пока у движка нет пула, каждый запрос открывает новое соединение (TCP, TLS,
+# аутентификация) и закрывает его. Пул запускается в lifespan приложения
+# (main.py) и закрывается при остановке; им же пользуются обработчики,
+# которые работают с asyncpg напрямую (acquire_connection).
+from contextlib import asynccontextmanager
+
+import asyncpg
+from piccolo.engine import engine_finder
+
+from .config import DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_QUERY_TIMEOUT_SECONDS
+
+
+def get_engine():
+    engine = engine_finder()
+    if engine is None:
+        raise RuntimeError("Piccolo engine is not configured (piccolo_conf.py)")
+    return engine
+
+
+async def start_pool():
+    """Запускает пул соединений движка Piccolo с ограничением времени запросов."""
+    engine = get_engine()
+    await engine.start_connection_pool(
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        # Клиентский таймаут asyncpg и statement_timeout на стороне сервера:
+        # зависший запрос не держит соединение пула бесконечно
+        command_timeout=DB_QUERY_TIMEOUT_SECONDS,
+        server_settings={"statement_timeout": str(int(DB_QUERY_TIMEOUT_SECONDS * 1000))},
+    )
+
+
+async def close_pool():
+    engine = get_engine()
+    if engine.pool is not None:
+        await engine.close_connection_pool()
+
+
+def pool_stats() -> dict:
+    """Состояние пула: сколько соединений открыто, свободно и занято."""
+    pool = get_engine().pool
+    if pool is None:
+        return {"started": False}
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+    return {
+        "started": True,
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+        "min_size": pool.get_min_size(),
+        "max_size": pool.get_max_size(),
+        "query_timeout_seconds": DB_QUERY_TIMEOUT_SECONDS,
+    }
+
+
+@asynccontextmanager
+async def acquire_connection():
+    """Соединение из пула приложения; вне приложения (пул не запущен) — отдельное соединение."""
+    pool = get_engine().pool
+    if pool is not None:
+        async with pool.acquire() as connection:
+            yield connection
+        return
+    connection = await asyncpg.connect(DATABASE_URL)
+    try:
+        yield connection
+    finally:
+        await connection.close()
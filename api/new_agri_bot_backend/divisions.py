@@ -0,0 +1,91 @@
+# data_loader_api/app/divisions.py
+# Подразделения компании.
+#
+# Каждое подразделение загружает свои выгрузки 1С отдельно: загрузка заменяет
+# только строки своего подразделения (колонка division_code), поэтому
+# подразделения обновляются независимо и параллельно. Общий между ними только
+# справочник ProductGuide — он дополняется (upsert), а не перезаписывается.
+#
+# Настройки подразделения (склады и направления для фильтрации остатков,
+# менеджеры для уведомлений) хранятся в таблице Division. Значения из config.py
+# (valid_warehouse, valid_line_of_business, MANAGERS_ID) — начальные настройки
+# подразделения по умолчанию, они записываются в таблицу при первом обращении.
+from typing import Dict, List
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+
+from .config import DEFAULT_DIVISION, DEFAULT_DIVISION_NAME, MANAGERS_ID, valid_line_of_business, valid_warehouse
+from .tables import Division
+
+# Код подразделения: латиница, цифры, "_" и "-" (используется в URL и в колонке division_code)
+DIVISION_CODE_PATTERN = r"^[a-z0-9_-]{1,32}$"
+
+
+class DivisionConfig(BaseModel):
+    name: str
+    # Пустой список — остатки не фильтруются по этому признаку
+    warehouses: List[str] = []
+    lines_of_business: List[str] = []
+    managers: Dict[str, int] = {}
+
+
+def default_division() -> dict:
+    """Подразделение по умолчанию с настройками из config.py."""
+    return {
+        "code": DEFAULT_DIVISION,
+        "name": DEFAULT_DIVISION_NAME,
+        "warehouses": list(valid_warehouse),
+        "lines_of_business": list(valid_line_of_business),
+        "managers": dict(MANAGERS_ID),
+    }
+
+
+def _division_columns():
+    return (Division.code, Division.name, Division.warehouses, Division.lines_of_business, Division.managers)
+
+
+async def save_division(code: str, config: DivisionConfig) -> dict:
+    """Создаёт подразделение или обновляет его настройки."""
+    values = {
+        Division.name: config.name,
+        Division.warehouses: config.warehouses,
+        Division.lines_of_business: config.lines_of_business,
+        Division.managers: config.managers,
+    }
+    if await Division.exists().where(Division.code == code):
+        await Division.update(values).where(Division.code == code)
+    else:
+        await Division.insert(Division(
+            code=code,
+            name=config.name,
+            warehouses=config.warehouses,
+            lines_of_business=config.lines_of_business,
+            managers=config.managers,
+        ))
+    return {"code": code, **config.model_dump()}
+
+
+async def get_division(code: str) -> dict:
+    """Настройки подразделения. 404, если подразделения нет."""
+    division = await Division.select(*_division_columns()).where(Division.code == code).output(load_json=True).first()
+    if division is not None:
+        return division
+    if code == DEFAULT_DIVISION:
+        default = default_division()
+        return await save_division(code, DivisionConfig(**default))
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Division not found: {code}")
+
+
+async def list_divisions() -> list:
+    await get_division(DEFAULT_DIVISION)
+    return await Division.select(*_division_columns()).order_by(Division.code).output(load_json=True)
+
+
+def filter_remains(remains, division: dict):
+    """Остатки только по складам и направлениям подразделения."""
+    if division["lines_of_business"]:
+        remains = remains.loc[remains["line_of_business"].isin(division["lines_of_business"])]
+    if division["warehouses"]:
+        remains = remains.loc[remains["warehouse"].isin(division["warehouses"])]
+    return remains
@@ -0,0 +1,169 @@
+# data_loader_api/app/exports.py
+# Выгрузка таблиц подразделения целиком или с фильтрами: CSV, NDJSON или Arrow IPC.
+#
+# Строки читаются серверным курсором asyncpg пачками по EXPORT_CURSOR_PREFETCH и
+# каждая пачка сразу кодируется и отдаётся клиенту (chunked transfer encoding),
+# поэтому память не зависит от количества строк. Заголовок CSV и схема Arrow
+# известны заранее по колонкам таблицы — они уходят клиенту до первого запроса к БД.
+#
+# pyarrow импортируется при первой выгрузке в Arrow, а не при запуске API.
+import csv
+import io
+from functools import lru_cache
+from typing import Dict, Optional
+
+import orjson
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from .config import EXPORT_CURSOR_PREFETCH
+from .database import acquire_connection
+from .listing import LISTINGS, filter_conditions
+from .loader import table_columns
+from .tables import AvailableStock, MovedData, SubmissionCoverage, Shortage, MovedProgress
+
+# Набор данных -> таблица и фильтры (параметр запроса -> колонка), как в listing.py
+EXPORTS = {
+    **LISTINGS,
+    "available_stock": {
+        "table": AvailableStock,
+        "filters": {"line_of_business": "line_of_business", "nomenclature": "nomenclature"},
+    },
+    "moved_data": {
+        "table": MovedData,
+        "filters": {"line_of_business": "line_of_business", "contract": "contract", "order": "order"},
+    },
+    "submission_coverage": {
+        "table": SubmissionCoverage,
+        "filters": {"manager": "manager", "contract_supplement": "contract_supplement", "coverage": "coverage"},
+    },
+    "shortage": {
+        "table": Shortage,
+        "filters": {},
+    },
+    "moved_progress": {
+        "table": MovedProgress,
+        "filters": {"kind": "kind"},
+    },
+}
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+
+@lru_cache(maxsize=None)
+def arrow_types() -> dict:
+    """Тип колонки Piccolo -> тип Arrow (UUID выгружаются строками)."""
+    import pyarrow as pa
+    return {
+        "UUID": pa.string(),
+        "ForeignKey": pa.string(),
+        "Varchar": pa.string(),
+        "Text": pa.string(),
+        "DoublePrecision": pa.float64(),
+        "Integer": pa.int32(),
+        "BigInt": pa.int64(),
+        "Boolean": pa.bool_(),
+        "Date": pa.date32(),
+        "Timestamptz": pa.timestamp("us", tz="UTC"),
+    }
+
+
+def arrow_schema(table):
+    import pyarrow as pa
+    types = arrow_types()
+    return pa.schema([
+        (column._meta.db_column_name, types[type(column).__name__]) for column in table._meta.columns
+    ])
+
+
+def export_query(dataset: str, division_code: str, filters: Dict[str, str]):
+    export = EXPORTS[dataset]
+    unknown = set(filters) - set(export["filters"])
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown filters for {dataset}: {sorted(unknown)}. Allowed: {sorted(export['filters'])}",
+        )
+    table = export["table"]
+    columns = ", ".join(f'"{column}"' for column in table_columns(table))
+    conditions, args = filter_conditions(export, division_code, filters)
+    # Без ORDER BY: выгрузке порядок не нужен, а первая строка приходит без сортировки всей таблицы
+    return f'SELECT {columns} FROM "{table._meta.tablename}" WHERE {" AND ".join(conditions)}', args
+
+
+async def cursor_batches(query: str, args: list):
+    """Строки запроса пачками по EXPORT_CURSOR_PREFETCH из серверного курсора."""
+    async with acquire_connection() as connection:
+        # Курсор asyncpg работает только внутри транзакции
+        async with connection.transaction(isolation="repeatable_read", readonly=True):
+            cursor = await connection.cursor(query, *args)
+            while True:
+                rows = await cursor.fetch(EXPORT_CURSOR_PREFETCH)
+                if not rows:
+                    break
+                yield rows
+
+
+async def csv_chunks(table, query: str, args: list, delimiter: str):
+    columns = table_columns(table)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator="\r\n")
+    writer.writerow(columns)
+    # BOM — чтобы Excel открыл UTF-8 с кириллицей без мастера импорта
+    yield "\ufeff".encode() + buffer.getvalue().encode()
+    async for rows in cursor_batches(query, args):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+
+async def ndjson_chunks(table, query: str, args: list):
+    async for rows in cursor_batches(query, args):
+        yield b"".join(orjson.dumps(dict(row)) + b"\n" for row in rows)
+
+
+async def arrow_chunks(table, query: str, args: list):
+    import pyarrow as pa
+    schema = arrow_schema(table)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield sink.getvalue()
+        async for rows in cursor_batches(query, args):
+            sink.seek(0)
+            sink.truncate()
+            columns = list(zip(*rows))
+            arrays = [
+                pa.array([None if value is None else str(value) for value in values], type=field.type)
+                if pa.types.is_string(field.type) else pa.array(values, type=field.type)
+                for field, values in zip(schema, columns)
+            ]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    # Маркер конца потока записывается при закрытии writer
+    yield sink.getvalue()
+
+
+def export_rows(dataset: str, export_format: str, division_code: str,
+                filters: Dict[str, str], delimiter: Optional[str] = ",") -> StreamingResponse:
+    if dataset not in EXPORTS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown dataset: {dataset}")
+    table = EXPORTS[dataset]["table"]
+    query, args = export_query(dataset, division_code, filters)
+    if export_format == "csv":
+        chunks = csv_chunks(table, query, args, delimiter)
+    elif export_format == "ndjson":
+        chunks = ndjson_chunks(table, query, args)
+    else:
+        chunks = arrow_chunks(table, query, args)
+    media_type, extension = EXPORT_FORMATS[export_format]
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{dataset}_{division_code}.{extension}"'},
+    )
@@ -0,0 +1,92 @@
+# data_loader_api/app/generation.py
+# Поколение данных и ETag для эндпоинтов чтения.
+#
+# Данные в таблицах меняются только при загрузке (задача загрузки, восстановление
+# снимка, потоковая загрузка NDJSON). После каждой завершённой загрузки счётчик в
+# data_generation увеличивается одним UPDATE, и новое значение запоминается в
+# процессе. ETag ответа чтения — поколение плюс хеш пути и параметров запроса,
+# поэтому запрос с совпадающим If-None-Match получает 304 без обращения к БД, а
+# клиенты и nginx могут хранить ответы до следующей загрузки.
+import hashlib
+from typing import Optional
+
+from starlette.requests import Request
+
+# Эндпоинты, ответы которых зависят только от загруженных данных
+GENERATION_PATH_PREFIXES = (
+    "/product_guide/",
+    "/submission_coverage/",
+    "/shortages/",
+    "/moved_progress/",
+    "/remains/",
+    "/submissions/",
+    "/payment/",
+    "/export/",
+    "/xlsx_reports/",
+)
+
+# Канал NOTIFY о новом поколении: воркеры сбрасывают кеш (cache.py)
+GENERATION_CHANNEL = "data_generation"
+
+_generation: Optional[int] = None
+
+
+def current_generation() -> Optional[int]:
+    """Поколение данных из памяти процесса; None, пока оно не прочитано из БД."""
+    return _generation
+
+
+def set_generation(generation: int):
+    """Поколение из уведомления другого процесса; поколение в памяти не уменьшается."""
+    global _generation
+    if _generation is None or generation > _generation:
+        _generation = generation
+
+
+async def load_generation(connection) -> int:
+    """Читает поколение при запуске приложения (создаёт строку счётчика, если её нет)."""
+    global _generation
+    await connection.execute(
+        'INSERT INTO "data_generation" (id, generation, updated_at) VALUES (1, 0, now()) '
+        'ON CONFLICT (id) DO NOTHING'
+    )
+    _generation = await connection.fetchval('SELECT generation FROM "data_generation" WHERE id = 1')
+    return _generation
+
+
+async def bump_generation(connection) -> int:
+    """
+    Увеличивает поколение после завершённой загрузки и уведомляет все процессы
+    API (NOTIFY). Вызывается после фиксации загрузки: поколение в памяти не
+    должно опережать данные в БД.
+    """
+    global _generation
+    _generation = await connection.fetchval(
+        'WITH bumped AS ('
+        'INSERT INTO "data_generation" (id, generation, updated_at) VALUES (1, 1, now()) '
+        'ON CONFLICT (id) DO UPDATE SET generation = "data_generation".generation + 1, updated_at = now() '
+        'RETURNING generation'
+        ') SELECT generation, pg_notify($1, generation::text) FROM bumped',
+        GENERATION_CHANNEL,
+    )
+    print(f"Data generation bumped to {_generation}")
+    return _generation
+
+
+def is_generation_path(path: str) -> bool:
+    return path.startswith(GENERATION_PATH_PREFIXES)
+
+
+def generation_etag(request: Request, generation: int) -> str:
+    """Строгий ETag: поколение данных и хеш пути с отсортированными параметрами запроса."""
+    params = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    digest = hashlib.sha256(f"{request.url.path}?{params}".encode()).hexdigest()[:16]
+    return f'"g{generation}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match сравнивается слабо: nginx с gzip превращает ETag в W/"..."
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
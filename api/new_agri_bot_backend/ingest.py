@@ -0,0 +1,705 @@
+# data_loader_api/app/ingest.py
+# Конвейер загрузки данных: разбор отчётов 1С (Pandas), подготовка таблиц
+# и запись в базу данных. Выполняется в отдельном потоке (executor).
+#
+# Этапы:
+#   1. parse_datasets — отчёты -> очищенные DataFrame по наборам данных
+#   2. build_table_frames — DataFrame -> строки таблиц БД (с UUID и ссылками на ProductGuide)
+#   3. load_tables_graph (loader.py) — замена строк подразделения через COPY, независимые таблицы параллельно
+# Результат каждого этапа сохраняется в каталог задачи (см. jobs.py),
+# чтобы после сбоя продолжить с первого незавершённого этапа.
+import asyncio
+import io
+import os
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+from .tables import ProductGuide, Remains, AvailableStock, Submissions, Payment, MovedData, SubmissionCoverage, Shortage, MovedProgress, PRODUCT_ID_NAMESPACE
+from .divisions import filter_remains
+from .allocation import allocate_stock, build_shortages
+from .progress import build_moved_progress
+from .reports import REPORT_LAYOUTS, SNIFF_SAMPLE_BYTES, detect_csv_encoding, sniff_csv_delimiter
+from .notifications import notify_managers_sync
+from .profiling import IngestProfiler
+from .loader import load_tables_graph
+from .snapshots import write_snapshot
+from .jobs import finish_job, stage_done, mark_stage_done, job_path, input_path, job_division
+
+
+# Вспомогательная функция для чтения содержимого Excel в DataFrame
+def read_excel_content(content: bytes, sheet_name=0, skip_rows: int = 0) -> pd.DataFrame:
+    # Используем io.BytesIO, чтобы Pandas мог читать из байтов в памяти
+    return pd.read_excel(io.BytesIO(content), sheet_name=sheet_name, header=None, skiprows=skip_rows)
+
+
+# Вспомогательная функция для чтения содержимого CSV/TSV в DataFrame
+def read_csv_content(content: bytes, skip_rows: int = 0, width: int = None) -> pd.DataFrame:
+    """
+    Читает CSV многопоточным парсером pyarrow. Все колонки читаются как строки
+    (числа приводятся в process_* функциях, как и для Excel), колонки нумеруются
+    по позиции — так же, как read_excel_content с header=None.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    encoding = detect_csv_encoding(content)
+    sample = content[:SNIFF_SAMPLE_BYTES].decode(encoding, errors="ignore")
+    delimiter = sniff_csv_delimiter(sample)
+    if width is None:
+        width = max(line.count(delimiter) for line in sample.splitlines()[skip_rows:skip_rows + 20] or [""]) + 1
+
+    column_names = [str(i) for i in range(width)]
+    table = pa_csv.read_csv(
+        pa.py_buffer(content),
+        read_options=pa_csv.ReadOptions(
+            use_threads=True,
+            skip_rows=skip_rows,
+            column_names=column_names,
+            encoding=encoding,
+        ),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in column_names},
+            strings_can_be_null=True,
+        ),
+    )
+    frame = table.to_pandas()
+    frame.columns = range(width)
+    return frame
+
+
+def read_report(content: bytes, dataset: str, file_format: str = "xlsx") -> pd.DataFrame:
+    """Читает отчёт 1С и оставляет только строки данных и нужные колонки (по позиции)."""
+    layout = REPORT_LAYOUTS[dataset]
+    if file_format == "csv":
+        frame = read_csv_content(content, skip_rows=layout["skip_rows"], width=layout["width"])
+    else:
+        frame = read_excel_content(content, sheet_name=layout.get("sheet_name", 0), skip_rows=layout["skip_rows"])
+
+    if layout["footer"]:
+        # Удаляем итоговую строку
+        frame = frame.iloc[:-1]
+    frame = frame.drop(columns=frame.columns[layout["drop_columns"]])
+    return frame.reset_index(drop=True)
+
+
+def to_number(series: pd.Series) -> pd.Series:
+    """
+    pd.to_numeric с поддержкой чисел из CSV 1С: "1 234,5" (неразрывный пробел
+    как разделитель тысяч и запятая как десятичный разделитель).
+    """
+    if series.dtype == object:
+        series = (series.astype(str)
+                  .str.replace("\u00a0", "", regex=False)
+                  .str.replace(" ", "", regex=False)
+                  .str.replace(",", ".", regex=False))
+    return pd.to_numeric(series, errors="coerce").fillna(0)
+
+# --- Функции для обработки каждого типа Excel-файла ---
+# Эти функции принимают 'bytes' (сырое содержимое файла)
+# и возвращают очищенный Pandas DataFrame.
+
+def process_submissions(content: bytes, file_format: str = "xlsx") -> pd.DataFrame:
+    # Ненужные строки шапки, итоговая строка и колонки удаляются по REPORT_LAYOUTS
+    submissions = read_report(content, "submissions", file_format)
+
+    # Задаём правильные имена колонок
+    submissions_col_names = [
+        "division", "manager", "company_group", "client", "contract_supplement",
+        "parent_element", "manufacturer", "active_ingredient", "nomenclature",
+        "party_sign", "buying_season", "line_of_business", "period",
+        "shipping_warehouse", "document_status", "delivery_status",
+        "shipping_address", "transport", "plan", "fact", "different",
+    ]
+    submissions.columns = submissions_col_names
+
+    # Преобразуем числовые колонки
+    for col in ["plan", "fact", "different"]:
+        submissions[col] = to_number(submissions[col])
+
+    # Преобразуем текстовые колонки
+    text_columns = [
+        "division", "manager", "company_group", "client", "contract_supplement",
+        "parent_element", "manufacturer", "active_ingredient", "nomenclature",
+        "party_sign", "buying_season", "line_of_business",
+        "shipping_warehouse", "document_status", "delivery_status",
+        "shipping_address", "transport"
+    ]
+
+    for col in text_columns:
+        submissions[col] = submissions[col].fillna("").astype(str)
+
+    # Обновляем значения в колонке "party_sign"
+    submissions.loc[
+        submissions["party_sign"] == "Закупівля поточного сезону", "party_sign"
+    ] = " "
+
+    # Формируем колонку product
+    submissions["product"] = submissions.apply(
+        lambda
+            row: f"{str(row['nomenclature']).rstrip()} {str(row['party_sign']).rstrip()} {str(row['buying_season']).rstrip()}",
+        axis=1,
+    )
+
+    # Обрезаем contract_supplement
+    submissions["contract_supplement"] = submissions[
+        "contract_supplement"].str.slice(23, 34)
+
+    return submissions
+    # submissions.drop(axis=0, labels=[0, 1, 2, 3, 4, 5, 6, 7], inplace=True)
+    # submissions.drop(axis=0, labels=submissions.tail(1).index, inplace=True)
+    # submissions.drop(
+    #     axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 6"], inplace=True
+    # )
+
+    # submissions_col_names = [
+    #     "division", "manager", "company_group", "client", "contract_supplement",
+    #     "parent_element", "manufacturer", "active_ingredient", "nomenclature",
+    #     "party_sign", "buying_season", "line_of_business", "period",
+    #     "shipping_warehouse", "document_status", "delivery_status",
+    #     "shipping_address", "transport", "plan", "fact", "different",
+    # ]
+    # submissions.columns = submissions_col_names
+    # submissions["plan"]=submissions["plan"].fillna(0)
+    # submissions["fact"]=submissions["fact"].fillna(0)
+    # submissions["different"]=submissions["different"].fillna(0)
+    # submissions.fillna("", inplace=True)
+    # submissions.loc[
+    #     (submissions["party_sign"] == "Закупівля поточного сезону"), "party_sign"
+    # ] = " "
+    # submissions["product"] = submissions.apply(
+    #     lambda row: str(row["nomenclature"]).rstrip()
+    #                 + " "
+    #                 + str(row["party_sign"]).rstrip()
+    #                 + " "
+    #                 + str(row["buying_season"]).rstrip(),
+    #     axis=1,
+    # )
+    # submissions["contract_supplement"] = submissions["contract_supplement"].astype(str).str.slice(23, 34)
+    return submissions
+
+def process_av_stock(content: bytes, file_format: str = "xlsx") -> pd.DataFrame:
+    # Ненужные строки и колонки удаляются по REPORT_LAYOUTS
+    av_stock = read_report(content, "av_stock", file_format)
+
+    # Новые имена колонок
+    av_col_names = [
+        "nomenclature", "party_sign", "buying_season", "division",
+        "line_of_business", "active_substance", "available",
+    ]
+    av_stock.columns = av_col_names
+
+    # Обработка текстовых колонок
+    text_columns = [
+        "nomenclature", "party_sign", "buying_season", "division",
+        "line_of_business", "active_substance"
+    ]
+
+    for col in text_columns:
+        av_stock[col] = av_stock[col].fillna("").astype(str)
+
+    # Обработка числовой колонки (если она числовая)
+    av_stock["available"] = to_number(av_stock["available"])
+
+    # Формируем колонку product
+    av_stock["product"] = av_stock.apply(
+        lambda
+            row: f"{row['nomenclature'].rstrip()} {row['party_sign'].rstrip()} {row['buying_season'].rstrip()}",
+        axis=1
+    )
+
+    return av_stock
+    # av_stock.drop(axis=0, labels=[0, 1, 2, 3, 4, 5, 6], inplace=True)
+    # av_stock.drop(
+    #     axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 4"], inplace=True
+    # )
+    # av_col_names = [
+    #     "nomenclature", "party_sign", "buying_season", "division",
+    #     "line_of_business", "active_substance", "available",
+    # ]
+    # av_stock.columns = av_col_names
+    # av_stock.fillna("", inplace=True)
+    # av_stock["product"] = av_stock.apply(
+    #     lambda row: str(row["nomenclature"]).rstrip()
+    #                 + " "
+    #                 + str(row["party_sign"]).rstrip()
+    #                 + " "
+    #                 + str(row["buying_season"]).rstrip(),
+    #     axis=1,
+    # )
+    # return av_stock
+
+def process_remains_reg(content: bytes, file_format: str = "xlsx") -> pd.DataFrame:
+    # Ненужные строки, итоговая строка и колонки удаляются по REPORT_LAYOUTS
+    remains = read_report(content, "remains", file_format)
+
+    # Новые имена колонок
+    remains_col_name = [
+        "line_of_business", "warehouse", "parent_element", "nomenclature",
+        "party_sign",
+        "buying_season", "nomenclature_series", "mtn", "origin_country",
+        "germination",
+        "crop_year", "quantity_per_pallet", "active_substance", "certificate",
+        "certificate_start_date", "certificate_end_date", "buh", "skl",
+        "weight", "storage",
+    ]
+    remains.columns = remains_col_name
+    # Удаляем столбец 'storage'
+    remains.drop(columns=["storage"], inplace=True)
+
+    # Обрабатываем числовые колонки
+    for col in ["buh", "skl", "weight", "quantity_per_pallet"]:
+        remains[col] = to_number(remains[col])
+
+    # Обрабатываем текстовые колонки
+    text_columns = [
+        "line_of_business", "warehouse", "parent_element", "nomenclature",
+        "party_sign",
+        "buying_season", "nomenclature_series", "mtn", "origin_country",
+        "germination", "crop_year", "active_substance", "certificate",
+        "certificate_start_date", "certificate_end_date",
+    ]
+    for col in text_columns:
+        remains[col] = remains[col].fillna("").astype(str)
+
+    # Формируем колонку product
+    remains["product"] = remains.apply(
+        lambda
+            row: f"{row['nomenclature'].rstrip()} {row['party_sign'].rstrip()} {row['buying_season'].rstrip()}",
+        axis=1
+    )
+
+    # Фильтр по складам и направлениям подразделения — в build_table_frames (divisions.filter_remains)
+    return remains
+    # remains.drop(axis=0, labels=[0, 1, 2, 3, 4], inplace=True)
+    # remains.drop(
+    #     axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 4"], inplace=True
+    # )
+    # remains.drop(axis=0, labels=remains.tail(1).index, inplace=True)
+    # remains_col_name = [
+    #     "line_of_business", "warehouse", "parent_element", "nomenclature", "party_sign",
+    #     "buying_season", "nomenclature_series", "mtn", "origin_country", "germination",
+    #     "crop_year", "quantity_per_pallet", "active_substance", "certificate",
+    #     "certificate_start_date", "certificate_end_date", "buh", "skl", "weight", "storage",
+    # ]
+    # remains.columns = remains_col_name
+    # remains["buh"]=remains["buh"].fillna(0)
+    # remains["skl"]=remains["skl"].fillna(0)
+    # remains.fillna("", inplace=True)
+    # remains["product"] = remains.apply(
+    #     lambda row: str(row["nomenclature"]).rstrip()
+    #                 + " "
+    #                 + str(row["party_sign"]).rstrip()
+    #                 + " "
+    #                 + str(row["buying_season"]).rstrip(),
+    #     axis=1,
+    # )
+    # remains = remains.loc[remains["line_of_business"].isin(valid_line_of_business)]
+    # remains = remains.loc[remains["warehouse"].isin(valid_warehouse)]
+    # return remains
+
+def process_payment(content: bytes, file_format: str = "xlsx") -> pd.DataFrame:
+    # Ненужные строки, итоговая строка и колонки удаляются по REPORT_LAYOUTS
+    payment = read_report(content, "payment", file_format)
+
+    # Новые имена колонок
+    payment_col_name = [
+        "contract_supplement", "contract_type", "prepayment_amount",
+        "amount_of_credit", "prepayment_percentage", "loan_percentage",
+        "planned_amount", "planned_amount_excluding_vat", "actual_sale_amount",
+        "actual_payment_amount",
+    ]
+    payment.columns = payment_col_name
+
+    # Приведение к нужным типам
+    numeric_columns = [
+        "prepayment_amount", "amount_of_credit", "prepayment_percentage",
+        "loan_percentage", "planned_amount", "planned_amount_excluding_vat",
+        "actual_sale_amount", "actual_payment_amount",
+    ]
+
+    for col in numeric_columns:
+        payment[col] = to_number(payment[col])
+
+    # contract_supplement и contract_type — текстовые
+    payment["contract_supplement"] = payment["contract_supplement"].astype(
+        str).fillna("")
+    payment["contract_type"] = payment["contract_type"].astype(str).fillna("")
+
+    return payment
+    # payment.drop(axis=0, labels=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9], inplace=True)
+    # payment.drop(
+    #     axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 7"], inplace=True
+    # )
+    # payment.drop(axis=0, labels=payment.tail(1).index, inplace=True)
+    # payment_col_name = [
+    #     "contract_supplement", "contract_type", "prepayment_amount",
+    #     "amount_of_credit", "prepayment_percentage", "loan_percentage",
+    #     "planned_amount", "planned_amount_excluding_vat", "actual_sale_amount",
+    #     "actual_payment_amount",
+    # ]
+    # payment.columns = payment_col_name
+    # payment.fillna(0, inplace=True)
+    # return payment
+
+def process_moved_data(content: bytes, file_format: str = "xlsx") -> pd.DataFrame:
+    # Лист "Данные", первая строка — заголовки (см. REPORT_LAYOUTS)
+    moved = read_report(content, "moved_data", file_format)
+    # Задаём имена колонок
+    moved_col_names = [
+        "order", "date", "line_of_business", "product", "qt_order",
+        "qt_moved", "party_sign", "period", "contract",
+    ]
+    moved.columns = moved_col_names
+
+    # Приводим числовые колонки
+    for col in ["qt_order", "qt_moved"]:
+        moved[col] = to_number(moved[col])
+
+    # Остальные колонки - текстовые
+    text_columns = ["order", "date", "line_of_business", "product",
+                    "party_sign", "period", "contract"]
+    for col in text_columns:
+        moved[col] = moved[col].astype(str).fillna("")
+
+    # Убираем лишние строки, если есть (по аналогии с другими файлами)
+    moved = moved.dropna(how="all")  # Удаляет полностью пустые строки
+    moved = moved.reset_index(drop=True)
+
+    return moved
+    # moved_col_names = [
+    #     "order", "date", "line_of_business", "product", "qt_order",
+    #     "qt_moved", "party_sign", "period", "contract",
+    # ]
+    # moved.columns = moved_col_names
+    # return moved
+
+
+# Обработчик для каждого набора данных
+PROCESSORS = {
+    "submissions": process_submissions,
+    "av_stock": process_av_stock,
+    "remains": process_remains_reg,
+    "payment": process_payment,
+    "moved_data": process_moved_data,
+}
+
+# Таблицы БД по именам. Порядок загрузки задаёт граф LOAD_DEPENDENCIES (loader.py):
+# ProductGuide первой, таблицы со ссылкой на неё — после
+TABLES = {
+    "product_guide": ProductGuide,
+    "remains": Remains,
+    "available_stock": AvailableStock,
+    "submissions": Submissions,
+    "payment": Payment,
+    "moved_data": MovedData,
+    "submission_coverage": SubmissionCoverage,
+    "shortage": Shortage,
+    "moved_progress": MovedProgress,
+}
+
+@contextmanager
+def timed_stage(timings: dict, name: str, profiler: IngestProfiler = None):
+    """
+    Записывает длительность этапа (в секундах) в timings[name].
+    Если передан profiler, этап дополнительно профилируется (см. profiling.py).
+    """
+    start = time.perf_counter()
+    try:
+        with profiler.stage(name) if profiler else nullcontext():
+            yield
+    finally:
+        timings[name] = round(time.perf_counter() - start, 3)
+
+
+def parse_datasets(contents: dict, file_formats: dict = None, timings: dict = None) -> dict:
+    """Разбирает отчёты всех наборов данных в очищенные DataFrame."""
+    file_formats = file_formats or {}
+    timings = {} if timings is None else timings
+    frames = {}
+    for dataset, processor in PROCESSORS.items():
+        with timed_stage(timings, f"parse_{dataset}"):
+            frames[dataset] = processor(contents[dataset], file_formats.get(dataset, "xlsx"))
+    print("Pandas processing complete.")
+    return frames
+
+
+def _new_ids(frame: pd.DataFrame) -> list:
+    return [uuid.uuid4() for _ in range(len(frame))]
+
+
+def product_ids(products: pd.Series) -> list:
+    return [uuid.uuid5(PRODUCT_ID_NAMESPACE, product) for product in products]
+
+
+def build_table_frames(frames: dict, division: dict) -> dict:
+    """
+    Готовит строки для каждой таблицы БД: справочник продуктов (id по названию
+    продукта) и строки подразделения со ссылкой на него (колонка product = id
+    из ProductGuide) и с кодом подразделения в колонке division_code.
+    """
+    av_stock = frames["av_stock"].copy()
+    remains = filter_remains(frames["remains"], division).copy()
+    submissions = frames["submissions"].copy()
+    payment = frames["payment"].copy()
+    moved = frames["moved_data"].copy()
+
+    # --- PRODUCT GUIDE ---
+    av_stock_tmp = av_stock[["product", "line_of_business", "active_substance"]].copy()
+    remains_tmp = remains[["product", "line_of_business", "active_substance"]].copy()
+    submissions_tmp = submissions[["product", "line_of_business", "active_ingredient"]].copy().rename(columns={"active_ingredient": "active_substance"})
+
+    pr = pd.concat([av_stock_tmp, submissions_tmp, remains_tmp], ignore_index=True)
+    pr["product"] = pr["product"].astype(str).str.rstrip()
+    product_guide = pr.drop_duplicates(["product"]).reset_index(drop=True)
+    product_guide["id"] = product_ids(product_guide["product"])
+    product_guide = product_guide[['id', 'product', 'line_of_business', 'active_substance']]
+
+    # --- REMAINS ---
+    remains["product"] = remains["product"].astype(str).str.rstrip()
+    remains_sql = pd.merge(remains, product_guide, on="product", suffixes=("", "_guide"))
+    remains_sql = remains_sql[[
+        "line_of_business", "warehouse", "parent_element", "nomenclature", "party_sign",
+        "buying_season", "nomenclature_series", "mtn", "origin_country", "germination",
+        "crop_year", "quantity_per_pallet", "active_substance", "certificate",
+        "certificate_start_date", "certificate_end_date", "buh", "skl", "weight",
+        "id"
+    ]].copy()
+    remains_sql.rename(columns={"id": "product"}, inplace=True)
+    remains_sql["weight"] = remains_sql["weight"].astype(str)
+    remains_sql["quantity_per_pallet"] = remains_sql["quantity_per_pallet"].astype(str)
+    remains_sql.insert(0, "id", _new_ids(remains_sql))
+
+    # --- AVAILABLE STOCK ---
+    av_stock["product"] = av_stock["product"].astype(str).str.rstrip()
+    available_stock_sql = pd.merge(av_stock, product_guide, on="product",
+                                   suffixes=("", "_guide"))
+    available_stock_sql = available_stock_sql[
+        [
+            "nomenclature", "party_sign", "buying_season", "division",
+            "line_of_business", "available", "id"
+        ]
+    ].copy()
+    available_stock_sql.rename(columns={"id": "product"}, inplace=True)
+    available_stock_sql['available'] = pd.to_numeric(
+        available_stock_sql['available'], errors='coerce').fillna(0)
+    available_stock_sql.insert(0, "id", _new_ids(available_stock_sql))
+
+    # --- SUBMISSIONS ---
+    submissions['product'] = submissions['product'].astype(str).str.rstrip()
+    submissions_sql = pd.merge(submissions, product_guide, on="product",
+                               suffixes=("", "_guide"))
+    submissions_sql = submissions_sql[[
+        "division", "manager", "company_group", "client",
+        "contract_supplement",
+        "parent_element", "manufacturer", "active_ingredient",
+        "nomenclature",
+        "party_sign", "buying_season", "line_of_business", "period",
+        "shipping_warehouse", "document_status", "delivery_status",
+        "shipping_address", "transport", "plan", "fact", "different",
+        "id"
+    ]].copy()
+    submissions_sql.rename(columns={"id": "product"}, inplace=True)
+    submissions_sql.insert(0, "id", _new_ids(submissions_sql))
+    # Приводим всё к строке, кроме числовых и ссылок
+    for col in submissions_sql.columns:
+        if col not in ["id", "product", "plan", "fact", "different"]:
+            submissions_sql[col] = submissions_sql[col].astype(str)
+
+    for col in ["plan", "fact", "different"]:
+        submissions_sql[col] = pd.to_numeric(submissions_sql[col], errors='coerce').fillna(0)
+
+    # --- PAYMENT ---
+    for col in ["prepayment_amount", "amount_of_credit", "prepayment_percentage",
+                "loan_percentage", "planned_amount", "planned_amount_excluding_vat",
+                "actual_sale_amount", "actual_payment_amount"]:
+        payment[col] = pd.to_numeric(payment[col], errors='coerce').fillna(0)
+    payment.insert(0, "id", _new_ids(payment))
+
+    # --- MOVED PROGRESS ---
+    # Свёртка по заказам и договорам строится до приведения количеств к строкам
+    moved_progress = build_moved_progress(moved)
+    moved_progress.insert(0, "id", _new_ids(moved_progress))
+
+    # --- MOVED DATA ---
+    # Преобразование даты
+    moved['date'] = pd.to_datetime(moved['date'], errors='coerce').dt.date
+
+    # Преобразование всех остальных колонок, кроме 'date', в строки
+    for col in moved.columns:
+        if col != 'date':
+            moved[col] = moved[col].astype(str).str.strip()
+    moved.insert(0, "id", _new_ids(moved))
+
+    # --- SUBMISSION COVERAGE ---
+    # Распределение складского остатка по утверждённым заявкам (allocation.py)
+    coverage = allocate_stock(submissions_sql, remains_sql)
+    coverage.insert(0, "id", _new_ids(coverage))
+
+    # --- SHORTAGE ---
+    shortage = build_shortages(submissions_sql, remains_sql, product_guide)
+    shortage.insert(0, "id", _new_ids(shortage))
+
+    table_frames = {
+        "product_guide": product_guide,
+        "remains": remains_sql,
+        "available_stock": available_stock_sql,
+        "submissions": submissions_sql,
+        "payment": payment,
+        "moved_data": moved,
+        "submission_coverage": coverage,
+        "shortage": shortage,
+        "moved_progress": moved_progress,
+    }
+    for name, frame in table_frames.items():
+        if name != "product_guide":
+            frame.insert(1, "division_code", division["code"])
+    return table_frames
+
+
+def write_frame(frame: pd.DataFrame, path: str):
+    """
+    Сохраняет DataFrame контрольной точки в Parquet.
+    Колонки со смешанными типами (UUID, текст вперемешку с числами)
+    Arrow сохранить не может — их приводим к строке, как это всё равно
+    делается перед записью в БД.
+    """
+    frame = frame.copy()
+    for col in frame.columns:
+        if frame[col].dtype == object and pd.api.types.infer_dtype(frame[col], skipna=True) not in ("string", "empty", "date"):
+            frame[col] = frame[col].astype(str)
+    tmp_path = path + ".tmp"
+    # zstd: эти же файлы копируются в архив снимков (snapshots.py)
+    frame.to_parquet(tmp_path, index=False, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+def read_frame(path: str) -> pd.DataFrame:
+    return pd.read_parquet(path)
+
+
+# Синхронная функция для обработки и сохранения данных в базу данных
+# Она будет запускаться в отдельном потоке (executor)
+def save_processed_data_to_db_sync(job: dict, profile: bool = False):
+    """
+    Выполняет задачу загрузки (см. jobs.py) с контрольными точками.
+    Каждый этап сохраняет результат и отметку о завершении, поэтому повторный
+    запуск той же задачи продолжает с первого незавершённого этапа:
+    уже разобранные отчёты не разбираются заново, уже загруженные таблицы
+    не перезагружаются.
+    job — задача, уже помеченная выполняемой (jobs.start_job в обработчике
+    запроса, чтобы 409 для занятого подразделения получил клиент). Любая ошибка
+    записывается в задачу (finish_job), а не теряется в потоке executor.
+    profile=True — выполнить этапы под профайлером (профиль в каталоге задачи).
+    """
+    job_id = job["job_id"]
+    timings = {}
+    try:
+        division = job_division(job)
+        os.makedirs(job_path(job_id, "datasets"), exist_ok=True)
+        os.makedirs(job_path(job_id, "tables"), exist_ok=True)
+        profiler = IngestProfiler(job_path(job_id, "profile")) if profile else None
+    except Exception as e:
+        return _fail_job(job, e)
+    with profiler or nullcontext():
+        try:
+            # 1. Обработка файлов Pandas — очищенные DataFrame по наборам данных
+            for dataset, processor in PROCESSORS.items():
+                stage = f"parse_{dataset}"
+                if stage_done(job, stage):
+                    continue
+                with timed_stage(timings, stage, profiler):
+                    with open(input_path(job, dataset), "rb") as f:
+                        frame = processor(f.read(), job["file_formats"][dataset])
+                    write_frame(frame, job_path(job_id, "datasets", f"{dataset}.parquet"))
+                mark_stage_done(job, stage, timings[stage], rows=len(frame))
+
+            # 2. Подготовка строк таблиц (UUID и ссылки на ProductGuide).
+            # UUID генерируются один раз: таблицы, загруженные до сбоя,
+            # ссылаются на те же id, что и таблицы, загружаемые при повторе
+            if not stage_done(job, "build_tables"):
+                with timed_stage(timings, "build_tables", profiler):
+                    frames = {
+                        dataset: read_frame(job_path(job_id, "datasets", f"{dataset}.parquet"))
+                        for dataset in PROCESSORS
+                    }
+                    table_frames = build_table_frames(frames, division)
+                    for name, frame in table_frames.items():
+                        write_frame(frame, job_path(job_id, "tables", f"{name}.parquet"))
+                mark_stage_done(job, "build_tables", timings["build_tables"])
+
+            # 3. Замена строк подразделения через COPY по графу зависимостей (loader.py).
+            # Каждая загруженная таблица отмечается сразу, поэтому при сбое
+            # повтор загружает только оставшиеся таблицы
+            loaded = {name for name in TABLES if stage_done(job, f"load_{name}")}
+            if len(loaded) < len(TABLES):
+                with timed_stage(timings, "load_tables", profiler):
+                    report = asyncio.run(load_tables_graph(
+                        TABLES,
+                        lambda name: read_frame(job_path(job_id, "tables", f"{name}.parquet")),
+                        skip=loaded,
+                        on_table_done=lambda name, info: mark_stage_done(
+                            job, f"load_{name}", info["seconds"], rows=info["rows"], streams=info["streams"]
+                        ),
+                        division_code=division["code"],
+                    ))
+                timings["load_critical_path"] = report["critical_path_seconds"]
+                mark_stage_done(
+                    job, "load_tables", timings["load_tables"],
+                    critical_path=report["critical_path"],
+                    critical_path_seconds=report["critical_path_seconds"],
+                )
+            print(f"Ingest timings: {timings}")
+
+            # Снимок очищенных данных для отката и повторной загрузки без Excel (snapshots.py).
+            # Данные уже загружены, поэтому ошибка записи снимка задачу не роняет
+            try:
+                write_snapshot(job)
+            except Exception as e:
+                print(f"Snapshot was not written for job {job_id}: {e}")
+
+            # Отправка уведомления после успешной загрузки всех данных
+            notify_managers_sync(division)
+
+            finish_job(job)
+            return {"status": "success", "message": "All data processed and saved successfully."}
+
+        except Exception as e:
+            return _fail_job(job, e)
+
+
+def _fail_job(job: dict, e: Exception) -> dict:
+    print(f"Error in save_processed_data_to_db_sync (job {job['job_id']}): {e}")
+    finish_job(job, error=str(e))
+    return {"status": "error", "message": f"Failed to process data: {str(e)}"}
+
+
+def dry_run_sync(contents: dict, file_formats: dict, division: dict) -> dict:
+    """
+    Полный разбор и подготовка таблиц без обращения к базе данных.
+    Возвращает количество строк на каждом этапе и длительности этапов.
+    """
+    timings = {}
+    frames = parse_datasets(contents, file_formats, timings)
+    with timed_stage(timings, "build_tables"):
+        table_frames = build_table_frames(frames, division)
+
+    datasets = {name: len(frame) for name, frame in frames.items()}
+    tables = {name: len(frame) for name, frame in table_frames.items()}
+    # Строки, не попавшие в таблицы: остатки вне складов и направлений подразделения
+    # и строки, не сопоставленные со справочником продуктов
+    dropped = {
+        "remains": datasets["remains"] - tables["remains"],
+        "available_stock": datasets["av_stock"] - tables["available_stock"],
+        "submissions": datasets["submissions"] - tables["submissions"],
+    }
+    return {
+        "status": "ok",
+        "datasets": datasets,
+        "tables": tables,
+        "dropped_rows": dropped,
+        "timings": timings,
+    }
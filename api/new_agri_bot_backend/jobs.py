@@ -0,0 +1,200 @@
+# data_loader_api/app/jobs.py
+# Задачи загрузки данных с контрольными точками.
+#
+# Каждая загрузка — это задача с каталогом в INGEST_STATE_DIR:
+#   job.json          — статус задачи и отметки о завершённых этапах
+#   inputs/           — исходные файлы (чтобы повторить задачу без повторной загрузки)
+#   datasets/*.parquet — очищенные DataFrame после разбора отчётов
+#   tables/*.parquet   — подготовленные строки таблиц БД
+# Идентификатор задачи — хеш содержимого файлов и кода подразделения, поэтому
+# повторная отправка тех же файлов продолжает упавшую задачу с первого
+# незавершённого этапа. Настройки подразделения сохраняются в job.json на момент
+# создания задачи — повтор задачи использует те же настройки.
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from fastapi import HTTPException, status
+
+from .config import DATASETS, INGEST_STATE_DIR
+from .divisions import default_division
+
+JOB_FILE = "job.json"
+
+# Задачи, которые выполняются в этом процессе прямо сейчас: id задачи -> код подразделения
+# (и восстановления снимков и потоковые загрузки, см. claim_division). Статус "running" в job.json без записи
+# здесь означает, что процесс был прерван.
+_active_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def job_dir(job_id: str) -> str:
+    return os.path.join(INGEST_STATE_DIR, job_id)
+
+
+def job_path(job_id: str, *parts: str) -> str:
+    return os.path.join(job_dir(job_id), *parts)
+
+
+def compute_job_id(contents: Dict[str, bytes], file_formats: Dict[str, str], division_code: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(division_code.encode())
+    for dataset in DATASETS:
+        digest.update(dataset.encode())
+        digest.update(file_formats.get(dataset, "xlsx").encode())
+        digest.update(hashlib.sha256(contents[dataset]).digest())
+    return digest.hexdigest()[:32]
+
+
+def _write_job(job: dict):
+    path = job_path(job["job_id"], JOB_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_job(job_id: str) -> dict:
+    if not job_id.isalnum():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingest job not found")
+    try:
+        with open(job_path(job_id, JOB_FILE), encoding="utf-8") as f:
+            job = json.load(f)
+    except OSError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingest job not found")
+    if job["status"] == "running" and job_id not in _active_jobs:
+        job["status"] = "interrupted"
+    return job
+
+
+def input_path(job: dict, dataset: str) -> str:
+    return job_path(job["job_id"], "inputs", f"{dataset}.{job['file_formats'][dataset]}")
+
+
+def job_division(job: dict) -> dict:
+    """Настройки подразделения задачи (у задач, созданных до разделения, — подразделение по умолчанию)."""
+    return job.get("division") or default_division()
+
+
+def create_job(contents: Dict[str, bytes], file_formats: Dict[str, str], division: dict) -> dict:
+    """
+    Создаёт задачу подразделения для набора файлов или возвращает существующую
+    задачу с теми же файлами (тогда она продолжится с места остановки).
+    """
+    file_formats = {dataset: file_formats.get(dataset, "xlsx") for dataset in DATASETS}
+    job_id = compute_job_id(contents, file_formats, division["code"])
+    with _jobs_lock:
+        if os.path.exists(job_path(job_id, JOB_FILE)):
+            return load_job(job_id)
+
+        os.makedirs(job_path(job_id, "inputs"), exist_ok=True)
+        job = {
+            "job_id": job_id,
+            "created_at": time.time(),
+            "file_formats": file_formats,
+            "division": division,
+            "status": "pending",
+            "error": None,
+            "attempts": 0,
+            "stages": {},
+        }
+        for dataset in DATASETS:
+            with open(input_path(job, dataset), "wb") as f:
+                f.write(contents[dataset])
+        _write_job(job)
+        return job
+
+
+def start_job(job_id: str) -> dict:
+    """
+    Помечает задачу как выполняемую. 409, если она уже выполняется или если
+    выполняется другая задача того же подразделения (они заменяют одни и те же строки).
+    Задачи разных подразделений выполняются параллельно.
+    """
+    with _jobs_lock:
+        job = load_job(job_id)
+        if job_id in _active_jobs:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ingest job is already running")
+        division_code = job_division(job)["code"]
+        if division_code in _active_jobs.values():
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Another ingest job of division {division_code} is running",
+            )
+        _active_jobs[job_id] = division_code
+        job["status"] = "running"
+        job["error"] = None
+        job["attempts"] += 1
+        _write_job(job)
+        return job
+
+
+def claim_division(owner: str, division_code: str):
+    """
+    Занимает подразделение для замены его строк вне задачи загрузки (восстановление
+    снимка, потоковая загрузка). 409, если строки подразделения сейчас заменяет
+    другая задача. Освобождается release_division.
+    """
+    with _jobs_lock:
+        if division_code in _active_jobs.values():
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Another ingest job of division {division_code} is running",
+            )
+        _active_jobs[owner] = division_code
+
+
+def release_division(owner: str):
+    with _jobs_lock:
+        _active_jobs.pop(owner, None)
+
+
+@contextmanager
+def division_lock(owner: str, division_code: str):
+    """claim_division на время блока with."""
+    claim_division(owner, division_code)
+    try:
+        yield
+    finally:
+        release_division(owner)
+
+
+def stage_done(job: dict, stage: str) -> bool:
+    return job["stages"].get(stage, {}).get("done", False)
+
+
+def mark_stage_done(job: dict, stage: str, seconds: float, **info):
+    job["stages"][stage] = {"done": True, "seconds": round(seconds, 3), **info}
+    _write_job(job)
+
+
+def finish_job(job: dict, error: str = None):
+    with _jobs_lock:
+        _active_jobs.pop(job["job_id"], None)
+        if error is None:
+            job["status"] = "success"
+            job["finished_at"] = time.time()
+            _write_job(job)
+            # Контрольные точки больше не нужны: следующая загрузка тех же
+            # файлов должна выполниться заново, а не пропустить все этапы
+            for name in ("inputs", "datasets", "tables"):
+                shutil.rmtree(job_path(job["job_id"], name), ignore_errors=True)
+            os.replace(job_path(job["job_id"], JOB_FILE), job_path(job["job_id"], "job.success.json"))
+        else:
+            job["status"] = "failed"
+            job["error"] = error
+            _write_job(job)
+
+
+def job_status(job_id: str) -> dict:
+    """Статус задачи, в том числе завершённой успешно (её контрольные точки уже удалены)."""
+    success_path = job_path(job_id, "job.success.json")
+    if job_id.isalnum() and os.path.exists(success_path) and not os.path.exists(job_path(job_id, JOB_FILE)):
+        with open(success_path, encoding="utf-8") as f:
+            return json.load(f)
+    return load_job(job_id)
@@ -0,0 +1,111 @@
+# data_loader_api/app/listing.py
+# Списки строк Remains, Submissions и Payment для веб-приложения.
+#
+# Пагинация по ключу (keyset): страница — это строки подразделения с фильтрами,
+# у которых id больше id последней строки предыдущей страницы (cursor). В отличие
+# от OFFSET, Postgres не перебирает пропущенные строки: каждая страница — поиск по
+# составному индексу (division_code, колонка фильтра, id), и время ответа не
+# зависит от номера страницы.
+#
+# Страница читается серверным курсором asyncpg и отдаётся клиенту частями по мере
+# чтения (пачка строк — один вызов orjson), без сборки всего списка в памяти:
+#   {"items": [...], "next_cursor": "<id последней строки>" | null}
+import uuid
+from typing import Dict, Optional
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+from .database import acquire_connection
+from .loader import table_columns
+from .responses import encode_rows
+from .tables import Remains, Submissions, Payment
+from .config import LIST_CURSOR_PREFETCH
+
+# Набор данных -> таблица и фильтры: параметр запроса -> колонка таблицы
+LISTINGS = {
+    "remains": {
+        "table": Remains,
+        "filters": {
+            "line_of_business": "line_of_business",
+            "warehouse": "warehouse",
+        },
+    },
+    "submissions": {
+        "table": Submissions,
+        "filters": {
+            "line_of_business": "line_of_business",
+            "warehouse": "shipping_warehouse",
+            "manager": "manager",
+            "document_status": "document_status",
+        },
+    },
+    "payment": {
+        "table": Payment,
+        "filters": {
+            "contract_supplement": "contract_supplement",
+            "contract_type": "contract_type",
+        },
+    },
+}
+
+
+def filter_conditions(listing: dict, division_code: str, filters: Dict[str, Optional[str]]):
+    """Условия WHERE и параметры: строки подразделения с равенством по заданным фильтрам."""
+    conditions = ['"division_code" = $1']
+    args = [division_code]
+    for name, value in filters.items():
+        if value is None:
+            continue
+        args.append(value.strip())
+        conditions.append(f'"{listing["filters"][name]}" = ${len(args)}')
+    return conditions, args
+
+
+def page_query(dataset: str, division_code: str, filters: Dict[str, Optional[str]],
+               after: Optional[uuid.UUID], limit: int):
+    """SQL и параметры одной страницы: равенство по фильтрам, id > cursor, ORDER BY id."""
+    listing = LISTINGS[dataset]
+    table = listing["table"]
+    columns = ", ".join(f'"{column}"' for column in table_columns(table))
+    conditions, args = filter_conditions(listing, division_code, filters)
+    if after is not None:
+        args.append(after)
+        conditions.append(f'"id" > ${len(args)}')
+    args.append(limit)
+    query = (
+        f'SELECT {columns} FROM "{table._meta.tablename}" '
+        f'WHERE {" AND ".join(conditions)} ORDER BY "id" LIMIT ${len(args)}'
+    )
+    return query, args
+
+
+async def page_chunks(query: str, args: list, limit: int):
+    """Страница в виде частей JSON: строки читаются курсором по LIST_CURSOR_PREFETCH."""
+    async with acquire_connection() as connection:
+        # Курсор asyncpg работает только внутри транзакции
+        async with connection.transaction(isolation="repeatable_read", readonly=True):
+            yield b'{"items":['
+            rows = []
+            count = 0
+            last_id = None
+            async for row in connection.cursor(query, *args, prefetch=LIST_CURSOR_PREFETCH):
+                rows.append(row)
+                if len(rows) >= LIST_CURSOR_PREFETCH:
+                    yield (b"," if count else b"") + encode_rows(rows)
+                    count += len(rows)
+                    last_id = rows[-1]["id"]
+                    rows = []
+            if rows:
+                yield (b"," if count else b"") + encode_rows(rows)
+                count += len(rows)
+                last_id = rows[-1]["id"]
+    # Неполная страница — последняя
+    next_cursor = str(last_id) if count == limit else None
+    yield b'],"next_cursor":' + orjson.dumps(next_cursor) + b"}"
+
+
+def list_rows(dataset: str, division_code: str, filters: Dict[str, Optional[str]],
+              after: Optional[uuid.UUID], limit: int) -> StreamingResponse:
+    query, args = page_query(dataset, division_code, filters, after, limit)
+    return StreamingResponse(page_chunks(query, args, limit), media_type="application/json")
@@ -0,0 +1,266 @@
+# data_loader_api/app/loader.py
+# Загрузка подготовленных таблиц в PostgreSQL через COPY.
+#
+# Таблицы загружаются как небольшой граф зависимостей: ProductGuide первой,
+# затем Remains, AvailableStock и Submissions (ссылаются на ProductGuide).
+# Payment и MovedData ни от чего не зависят и загружаются сразу, параллельно
+# с ProductGuide. SubmissionCoverage загружается после Submissions (ссылается на её строки).
+# Каждая таблица загружается через своё соединение из пула asyncpg,
+# большие таблицы (Submissions) делятся на несколько параллельных потоков COPY.
+#
+# Загрузка подразделения заменяет только его строки (DELETE ... WHERE division_code),
+# строки других подразделений не затрагиваются. ProductGuide общий для всех
+# подразделений: новые продукты добавляются, существующие обновляются (upsert).
+import asyncio
+import math
+import time
+import uuid
+from typing import TYPE_CHECKING, Callable, Dict
+
+import asyncpg
+
+# pandas нужен только для аннотаций: модуль импортируют и эндпоинты чтения (table_columns)
+if TYPE_CHECKING:
+    import pandas as pd
+
+from .generation import bump_generation
+from .config import DATABASE_URL, LOADER_POOL_SIZE, LOADER_COPY_STREAM_ROWS, LOADER_MAX_COPY_STREAMS
+
+# От каких таблиц зависит загрузка каждой таблицы
+LOAD_DEPENDENCIES = {
+    "product_guide": [],
+    "remains": ["product_guide"],
+    "available_stock": ["product_guide"],
+    "submissions": ["product_guide"],
+    "payment": [],
+    "moved_data": [],
+    "submission_coverage": ["submissions"],
+    "shortage": ["product_guide"],
+    "moved_progress": [],
+}
+
+# Таблицы, которые не заменяются, а дополняются: имя -> уникальная колонка
+UPSERT_KEYS = {
+    "product_guide": "product",
+}
+
+
+def table_columns(table) -> list:
+    return [column._meta.db_column_name for column in table._meta.columns]
+
+
+def frame_records(frame: "pd.DataFrame", columns: list) -> list:
+    """
+    Строки DataFrame в кортежи для COPY. Series.tolist() превращает скаляры numpy
+    в обычные типы Python, которые понимают кодеки asyncpg.
+    """
+    frame = frame.astype(object).where(frame.notna(), None)
+    return list(zip(*[frame[column].tolist() for column in columns]))
+
+
+def copy_stream_count(rows: int) -> int:
+    """Сколько параллельных потоков COPY использовать для таблицы с rows строками."""
+    return max(1, min(LOADER_MAX_COPY_STREAMS, math.ceil(rows / LOADER_COPY_STREAM_ROWS)))
+
+
+async def _copy_part(pool: asyncpg.Pool, table_name: str, columns: list, records: list):
+    async with pool.acquire() as connection:
+        await connection.copy_records_to_table(table_name, records=records, columns=columns)
+
+
+def _delete_query(table_name: str, division_code: str = None) -> tuple:
+    if division_code is None:
+        return (f'DELETE FROM "{table_name}"',)
+    return (f'DELETE FROM "{table_name}" WHERE division_code = $1', division_code)
+
+
+async def copy_table(pool: asyncpg.Pool, table, frame: "pd.DataFrame", division_code: str = None) -> dict:
+    """
+    Заменяет строки таблицы через COPY (одним или несколькими потоками):
+    все строки или, если передан division_code, только строки подразделения.
+    Замена атомарна: до COMMIT читатели видят старые строки, при ошибке таблица не меняется.
+    """
+    table_name = table._meta.tablename
+    columns = [column for column in table_columns(table) if column in frame.columns]
+    records = frame_records(frame, columns)
+    streams = copy_stream_count(len(records))
+    delete = _delete_query(table_name, division_code)
+
+    if streams == 1:
+        # Одна транзакция: до COMMIT читатели видят старые данные
+        async with pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute(*delete)
+                await connection.copy_records_to_table(table_name, records=records, columns=columns)
+    else:
+        # Несколько соединений не могут разделить одну транзакцию: части пишутся
+        # параллельно в промежуточную таблицу без индексов и внешних ключей,
+        # затем строки заменяются одной транзакцией (DELETE + INSERT ... SELECT)
+        stage_name = f"{table_name}_stage_{uuid.uuid4().hex[:8]}"
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        async with pool.acquire() as connection:
+            await connection.execute(f'CREATE UNLOGGED TABLE "{stage_name}" (LIKE "{table_name}" INCLUDING DEFAULTS)')
+        try:
+            size = math.ceil(len(records) / streams)
+            await asyncio.gather(*[
+                _copy_part(pool, stage_name, columns, records[i:i + size])
+                for i in range(0, len(records), size)
+            ])
+            async with pool.acquire() as connection:
+                async with connection.transaction():
+                    await connection.execute(*delete)
+                    await connection.execute(
+                        f'INSERT INTO "{table_name}" ({column_list}) SELECT {column_list} FROM "{stage_name}"'
+                    )
+        finally:
+            async with pool.acquire() as connection:
+                await connection.execute(f'DROP TABLE IF EXISTS "{stage_name}"')
+
+    print(f"{table.__name__} copied: {len(records)} records in {streams} stream(s).")
+    return {"rows": len(records), "streams": streams}
+
+
+def _upsert_clause(table_name: str, columns: list, key: str) -> str:
+    """ON CONFLICT (key) DO UPDATE, который обновляет только изменившиеся строки."""
+    updated = [column for column in columns if column != key]
+    return (
+        f'ON CONFLICT ("{key}") DO UPDATE SET '
+        + ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in updated)
+        + " WHERE (" + ", ".join(f'"{table_name}"."{column}"' for column in updated) + ")"
+        + " IS DISTINCT FROM (" + ", ".join(f'EXCLUDED."{column}"' for column in updated) + ")"
+    )
+
+
+async def upsert_records(connection: asyncpg.Connection, table, columns: list, records: list, key: str):
+    """
+    Дополняет таблицу небольшим набором строк (кортежи в порядке columns)
+    на уже открытом соединении — например, внутри транзакции потоковой загрузки.
+    """
+    table_name = table._meta.tablename
+    key_index = columns.index(key)
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    placeholders = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+    await connection.executemany(
+        f'INSERT INTO "{table_name}" ({column_list}) VALUES ({placeholders}) '
+        + _upsert_clause(table_name, columns, key),
+        sorted(records, key=lambda record: record[key_index]),
+    )
+
+
+async def upsert_table(pool: asyncpg.Pool, table, frame: "pd.DataFrame", key: str) -> dict:
+    """
+    Дополняет таблицу строками frame: COPY во временную таблицу, затем
+    INSERT ... ON CONFLICT (key) DO UPDATE. Строки вставляются в порядке key,
+    поэтому параллельные загрузки подразделений блокируют строки в одном
+    порядке и не попадают во взаимную блокировку.
+    """
+    table_name = table._meta.tablename
+    tmp_name = f"{table_name}_upsert"
+    columns = [column for column in table_columns(table) if column in frame.columns]
+    records = frame_records(frame, columns)
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    async with pool.acquire() as connection:
+        async with connection.transaction():
+            await connection.execute(
+                f'CREATE TEMP TABLE "{tmp_name}" (LIKE "{table_name}" INCLUDING DEFAULTS) ON COMMIT DROP'
+            )
+            await connection.copy_records_to_table(tmp_name, records=records, columns=columns)
+            # Обновляем только изменившиеся строки. Смена id каскадно обновляет
+            # ссылки (ON UPDATE CASCADE) в строках других подразделений
+            await connection.execute(
+                f'INSERT INTO "{table_name}" ({column_list}) '
+                f'SELECT {column_list} FROM "{tmp_name}" ORDER BY "{key}" '
+                + _upsert_clause(table_name, columns, key)
+            )
+    print(f"{table.__name__} upserted: {len(records)} records.")
+    return {"rows": len(records), "streams": 1}
+
+
+def critical_path(durations: Dict[str, float], dependencies: Dict[str, list]) -> tuple:
+    """Самая длинная по времени цепочка зависимостей: (список таблиц, секунды)."""
+    longest = {}
+
+    def visit(name):
+        if name not in longest:
+            best = max((visit(dep) for dep in dependencies[name] if dep in durations), default=([], 0.0), key=lambda p: p[1])
+            longest[name] = (best[0] + [name], best[1] + durations[name])
+        return longest[name]
+
+    if not durations:
+        return [], 0.0
+    path, seconds = max((visit(name) for name in durations), key=lambda p: p[1])
+    return path, round(seconds, 3)
+
+
+async def load_tables_graph(
+    tables: Dict[str, type],
+    frame_loader: Callable[[str], "pd.DataFrame"],
+    skip: set = frozenset(),
+    on_table_done: Callable[[str, dict], None] = None,
+    division_code: str = None,
+) -> dict:
+    """
+    Загружает таблицы по графу LOAD_DEPENDENCIES: каждая таблица стартует,
+    как только загружены таблицы, от которых она зависит.
+    frame_loader(name) возвращает строки таблицы, skip — уже загруженные таблицы
+    (например, при продолжении задачи), on_table_done(name, info) вызывается
+    после загрузки каждой таблицы. division_code — заменяются только строки
+    этого подразделения, таблицы из UPSERT_KEYS дополняются.
+    Возвращает длительность каждой таблицы, общее время и критический путь.
+    """
+    pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=LOADER_POOL_SIZE)
+    done_events = {name: asyncio.Event() for name in tables}
+    for name in skip:
+        done_events[name].set()
+    results = {}
+    start = time.perf_counter()
+
+    async def load(name):
+        for dep in LOAD_DEPENDENCIES.get(name, []):
+            if dep in done_events:
+                await done_events[dep].wait()
+        table_start = time.perf_counter()
+        frame = await asyncio.to_thread(frame_loader, name)
+        if name in UPSERT_KEYS:
+            info = await upsert_table(pool, tables[name], frame, UPSERT_KEYS[name])
+        else:
+            info = await copy_table(pool, tables[name], frame, division_code)
+        info["seconds"] = round(time.perf_counter() - table_start, 3)
+        info["started_at"] = round(table_start - start, 3)
+        results[name] = info
+        if on_table_done is not None:
+            on_table_done(name, info)
+        done_events[name].set()
+
+    try:
+        tasks = [asyncio.create_task(load(name)) for name in tables if name not in skip]
+        try:
+            await asyncio.gather(*tasks)
+        except Exception:
+            # Зависимые таблицы ждут события, которое уже не наступит — отменяем их
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    finally:
+        try:
+            # Новое поколение данных (ETag эндпоинтов чтения, кеш cache.py), если
+            # заменена хотя бы одна таблица: каждая коммитится отдельно, и после
+            # частичной ошибки читатели иначе получали бы старые данные до повтора
+            if results:
+                async with pool.acquire() as connection:
+                    await bump_generation(connection)
+        finally:
+            await pool.close()
+
+    path, path_seconds = critical_path(
+        {name: info["seconds"] for name, info in results.items()}, LOAD_DEPENDENCIES
+    )
+    report = {
+        "tables": results,
+        "wall_seconds": round(time.perf_counter() - start, 3),
+        "critical_path": path,
+        "critical_path_seconds": path_seconds,
+    }
+    print(f"Tables loaded in {report['wall_seconds']}s, critical path {path} = {path_seconds}s")
+    return report
@@ -0,0 +1,177 @@
+# data_loader_api/app/login.py
+# Вход в веб-приложение через Telegram-бота.
+#
+# 1. Браузер создаёт токен входа (POST /auth/login-token): 6-значный код для бота
+#    (вводится вручную или приходит в ссылке /start weblogin_<код>) и секрет,
+#    известный только этому браузеру.
+# 2. Браузер ждёт подтверждения длинным запросом или SSE (с секретом).
+# 3. Бот подтверждает код (POST /auth/confirm-login-token с общим секретом
+#    X-Bot-Token, см. admin.require_bot) — ожидающий запрос завершается сразу,
+#    без опроса БД.
+#
+# Токены хранятся в памяти процесса API (один воркер uvicorn, см. Dockerfile).
+# Токены раскладываются по корзинам по времени истечения (LOGIN_SWEEP_SECONDS на
+# корзину); очистка снимает только истёкшие корзины — время очистки зависит от
+# числа истёкших токенов, а не от числа всех токенов.
+import asyncio
+import secrets
+import time
+from typing import Dict, Optional, Set
+
+import orjson
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+
+from .config import LOGIN_TOKEN_TTL_SECONDS, LOGIN_SWEEP_SECONDS, LOGIN_SSE_HEARTBEAT_SECONDS, LOGIN_MAX_ACTIVE_TOKENS
+from .tables import Users
+
+
+class ConfirmLoginRequest(BaseModel):
+    token: str
+    telegram_id: int
+
+
+# код -> {"secret", "expires_at", "user", "event"}
+_tokens: Dict[str, dict] = {}
+# номер корзины (expires_at // LOGIN_SWEEP_SECONDS) -> коды
+_buckets: Dict[int, Set[str]] = {}
+_swept_until = int(time.monotonic() // LOGIN_SWEEP_SECONDS)
+
+
+def _bucket(expires_at: float) -> int:
+    return int(expires_at // LOGIN_SWEEP_SECONDS)
+
+
+def _expire(code: str):
+    entry = _tokens.pop(code, None)
+    if entry is not None:
+        # Ожидающие запросы просыпаются и отвечают, что токен истёк
+        entry["event"].set()
+
+
+def sweep_expired() -> int:
+    """Удаляет токены из корзин, которые целиком истекли. Возвращает число удалённых."""
+    global _swept_until
+    now_bucket = _bucket(time.monotonic())
+    removed = 0
+    # Корзина now_bucket ещё содержит неистёкшие токены
+    for bucket in range(_swept_until, now_bucket):
+        for code in _buckets.pop(bucket, ()):
+            if code in _tokens:
+                _expire(code)
+                removed += 1
+    _swept_until = max(_swept_until, now_bucket)
+    return removed
+
+
+async def sweep_login_tokens():
+    """Фоновая очистка истёкших токенов (запускается в lifespan приложения)."""
+    while True:
+        await asyncio.sleep(LOGIN_SWEEP_SECONDS)
+        removed = sweep_expired()
+        if removed:
+            print(f"Login tokens expired: {removed}, active: {len(_tokens)}")
+
+
+def create_login_token() -> dict:
+    if len(_tokens) >= LOGIN_MAX_ACTIVE_TOKENS:
+        sweep_expired()
+        if len(_tokens) >= LOGIN_MAX_ACTIVE_TOKENS:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many pending logins, try again later")
+    code = f"{secrets.randbelow(10 ** 6):06d}"
+    while code in _tokens:
+        code = f"{secrets.randbelow(10 ** 6):06d}"
+    expires_at = time.monotonic() + LOGIN_TOKEN_TTL_SECONDS
+    _tokens[code] = {
+        "secret": secrets.token_urlsafe(24),
+        "expires_at": expires_at,
+        "user": None,
+        "event": asyncio.Event(),
+    }
+    # Корзина после истечения: токен из середины корзины не удаляется раньше срока
+    _buckets.setdefault(_bucket(expires_at) + 1, set()).add(code)
+    return {
+        "token": code,
+        "secret": _tokens[code]["secret"],
+        "deep_link_payload": f"weblogin_{code}",
+        "expires_in": LOGIN_TOKEN_TTL_SECONDS,
+    }
+
+
+def _active_entry(code: str) -> Optional[dict]:
+    entry = _tokens.get(code)
+    if entry is not None and entry["expires_at"] <= time.monotonic():
+        _expire(code)
+        return None
+    return entry
+
+
+async def confirm_login_token(request: ConfirmLoginRequest) -> dict:
+    """Подтверждение кода ботом: 404 для неизвестного или истёкшего кода, 403 для пользователя без доступа."""
+    entry = _active_entry(request.token.strip())
+    if entry is None or entry["user"] is not None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Login token not found or expired")
+    user = await Users.select(
+        Users.telegram_id, Users.username, Users.first_name, Users.last_name, Users.is_allowed
+    ).where(Users.telegram_id == request.telegram_id).first()
+    if not user or not user["is_allowed"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not allowed to log in")
+    # Код мог истечь, пока шёл запрос к БД
+    if _active_entry(request.token.strip()) is not entry:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Login token not found or expired")
+    user.pop("is_allowed")
+    entry["user"] = user
+    entry["event"].set()
+    return {"success": True}
+
+
+def _waiting_entry(code: str, secret: str) -> dict:
+    entry = _tokens.get(code)
+    # Сравниваем байты: compare_digest для str с не-ASCII символами бросает TypeError
+    if entry is None or not secrets.compare_digest(entry["secret"].encode(), (secret or "").encode()):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Login token not found or expired")
+    return entry
+
+
+def _result(code: str, entry: dict) -> dict:
+    if entry["user"] is not None:
+        # Подтверждение выдаётся один раз
+        _tokens.pop(code, None)
+        return {"status": "confirmed", "user": entry["user"]}
+    if _active_entry(code) is None:
+        return {"status": "expired"}
+    return {"status": "pending"}
+
+
+async def wait_login_token(code: str, secret: str, timeout: float) -> dict:
+    """Длинный запрос: ответ сразу после подтверждения или {"status": "pending"} по таймауту."""
+    entry = _waiting_entry(code, secret)
+    remaining = entry["expires_at"] - time.monotonic()
+    try:
+        await asyncio.wait_for(entry["event"].wait(), timeout=max(0.0, min(timeout, remaining)))
+    except asyncio.TimeoutError:
+        pass
+    return _result(code, entry)
+
+
+def login_token_events(code: str, secret: str):
+    """
+    Поток SSE: событие confirmed или expired; комментарии-пульс не дают прокси
+    закрыть соединение. Код и секрет проверяются до начала потока (404 обычным ответом).
+    """
+    return _events(code, _waiting_entry(code, secret))
+
+
+async def _events(code: str, entry: dict):
+    while True:
+        remaining = entry["expires_at"] - time.monotonic()
+        try:
+            await asyncio.wait_for(entry["event"].wait(), timeout=max(0.0, min(LOGIN_SSE_HEARTBEAT_SECONDS, remaining)))
+        except asyncio.TimeoutError:
+            pass
+        result = _result(code, entry)
+        if result["status"] == "pending":
+            yield b": ping\n\n"
+            continue
+        yield b"event: " + result["status"].encode() + b"\ndata: " + orjson.dumps(result) + b"\n\n"
+        return
@@ -1,654 +1,276 @@
 # data_loader_api/app/main.py
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, HTTPException, status, BackgroundTasks
-from fastapi.responses import JSONResponse
-import pandas as pd
-import io
+from fastapi import FastAPI, UploadFile, File, HTTPException, status, BackgroundTasks, Request, Depends, Header, Query, Path
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, ORJSONResponse, FileResponse, StreamingResponse
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime, timedelta
 import uuid
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-# Импорты Piccolo и конфига
-# from database import DB
-from .tables import ProductGuide, Remains, AvailableStock, Submissions, Payment, MovedData
-from .config import TELEGRAM_BOT_TOKEN, MANAGERS_ID, valid_line_of_business, valid_warehouse
-import math
-from datetime import datetime, date
+# Импорты Piccolo и конфига.
+# Стек загрузки (ingest.py: pandas, разбор Excel) и aiogram при импорте не
+# загружаются: ingest импортируется первой задачей загрузки, Bot создаётся в lifespan
+from .reports import check_reports
+from .uploads import (
+    UploadSessionCreate, UploadFinalize, create_session, load_session,
+    session_status, append_chunk, finalize_session, delete_session, remove_session,
+    file_format_from_name,
+)
+from .bundles import read_bundle
+from .jobs import create_job, start_job, finish_job, job_status, job_path, claim_division, release_division
+from .admin import require_admin, require_bot
+from .profiling import load_profile_summary, profile_stages
+from .snapshots import list_snapshot_manifests, restore_snapshot_sync
+from .divisions import DivisionConfig, DIVISION_CODE_PATTERN, get_division, list_divisions, save_division
+from .streaming import STREAM_DATASETS, stream_dataset, refresh_derived_tables
+from .database import start_pool, close_pool, pool_stats, acquire_connection
+from .generation import load_generation, current_generation, is_generation_path, generation_etag, etag_matches
+from .products import ProductBatchRequest, lookup_products
+from .listing import list_rows
+from .exports import export_rows
+from .xlsx_reports import get_report_file, shutdown_report_pool
+from .login import (
+    ConfirmLoginRequest, create_login_token, confirm_login_token, wait_login_token, login_token_events,
+    sweep_login_tokens,
+)
+from .notifications import start_bot, close_bot
+from .admission import AdmissionMiddleware, ingest_jobs, admission_stats
+from .responses import CompressionMiddleware
+from .cache import (
+    product_by_name, coverage_by_product, coverage_by_contract, shortages_page, moved_progress,
+    listen_generation, cache_stats,
+)
+from .config import DEFAULT_DIVISION, LIST_PAGE_MAX, LOGIN_WAIT_MAX_SECONDS, INGEST_WORKERS
 
 # Инициализация FastAPI приложения
 # Определяем контекстный менеджер для жизненного цикла приложения
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Код, который выполняется при запуске приложения
-    print("Piccolo database engine initialized. Connections will be managed automatically.")
-    # Здесь вы можете выполнить любые инициализационные задачи,
-    # например, создать таблицы, если они не существуют, или проверить подключение.
+    # Пул соединений движка Piccolo: запросы к таблицам берут готовое соединение
+    # из пула, а не открывают новое на каждый запрос (см. database.py)
+    await start_pool()
+    print(f"Database connection pool started: {pool_stats()}")
+    # Поколение данных для ETag эндпоинтов чтения (см. generation.py)
+    async with acquire_connection() as connection:
+        print(f"Data generation: {await load_generation(connection)}")
+    # Сброс кеша эндпоинтов чтения по NOTIFY после загрузки (см. cache.py)
+    generation_listener = asyncio.create_task(listen_generation())
+    # Очистка истёкших кодов входа (см. login.py)
+    login_sweeper = asyncio.create_task(sweep_login_tokens())
+    # Telegram Bot создаётся в фоне: приложение не ждёт импорта aiogram (см. notifications.py)
+    start_bot()
+    # Пул потоков для выполнения синхронных операций (Pandas обработка)
+    # Это нужно, чтобы не блокировать основной асинхронный поток FastAPI,
+    # пока Pandas выполняет тяжелые вычисления. Очередь задач к пулу ограничена (см. admission.py)
+    app.state.executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS)
 
     yield # <-- Приложение запускается и обрабатывает запросы
 
-    # Код, который выполняется при завершении работы приложения
-    print("Piccolo database engine shutdown. Connections are closed automatically.")
-    # Здесь вы можете выполнить любые задачи по очистке ресурсов,
-    # например, закрыть файлы или другие соединения.
+    generation_listener.cancel()
+    login_sweeper.cancel()
+    await asyncio.gather(generation_listener, login_sweeper, return_exceptions=True)
+    # Выполняющиеся задачи загрузки дорабатывают, ещё не начатые можно повторить (/ingest/{job_id}/retry)
+    app.state.executor.shutdown(wait=False, cancel_futures=True)
+    await close_bot()
+    shutdown_report_pool()
+    await close_pool()
+    print("Database connection pool closed.")
 
 # Инициализация FastAPI приложения с lifespan
 app = FastAPI(
     title="Data Loader API for Agri-Bot",
     description="API for loading and processing various Excel data into PostgreSQL.",
     version="1.0.0",
-    lifespan=lifespan # <-- Передаем lifespan
+    lifespan=lifespan, # <-- Передаем lifespan
+    # orjson вместо json.dumps для всех ответов (см. responses.py)
+    default_response_class=ORJSONResponse,
 )
 
-# Инициализация Telegram Bot
-from aiogram import Bot
-bot = Bot(TELEGRAM_BOT_TOKEN)
-
-# Пул потоков для выполнения синхронных операций (Pandas обработка)
-# Это нужно, чтобы не блокировать основной асинхронный поток FastAPI,
-# пока Pandas выполняет тяжелые вычисления.
-executor = ThreadPoolExecutor(max_workers=4) # Можно настроить количество рабочих потоков
-
-
-
-# Вспомогательная функция для чтения содержимого Excel в DataFrame
-def read_excel_content(content: bytes, sheet_name=0) -> pd.DataFrame:
-    # Используем io.BytesIO, чтобы Pandas мог читать из байтов в памяти
-    return pd.read_excel(io.BytesIO(content), sheet_name=sheet_name)
-
-# --- Функции для обработки каждого типа Excel-файла ---
-# Эти функции принимают 'bytes' (сырое содержимое файла)
-# и возвращают очищенный Pandas DataFrame.
-
-def process_submissions(content: bytes) -> pd.DataFrame:
-    submissions = read_excel_content(content)
-
-    # Удаляем ненужные строки
-    submissions.drop(axis=0, labels=[0, 1, 2, 3, 4, 5, 6, 7], inplace=True)
-    submissions.drop(axis=0, labels=submissions.tail(1).index, inplace=True)
-
-    # Удаляем ненужные колонки
-    submissions.drop(axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 6"],
-                     inplace=True)
-
-    # Задаём правильные имена колонок
-    submissions_col_names = [
-        "division", "manager", "company_group", "client", "contract_supplement",
-        "parent_element", "manufacturer", "active_ingredient", "nomenclature",
-        "party_sign", "buying_season", "line_of_business", "period",
-        "shipping_warehouse", "document_status", "delivery_status",
-        "shipping_address", "transport", "plan", "fact", "different",
-    ]
-    submissions.columns = submissions_col_names
-
-    # Преобразуем числовые колонки
-    for col in ["plan", "fact", "different"]:
-        submissions[col] = pd.to_numeric(submissions[col],
-                                         errors="coerce").fillna(0)
-
-    # Преобразуем текстовые колонки
-    text_columns = [
-        "division", "manager", "company_group", "client", "contract_supplement",
-        "parent_element", "manufacturer", "active_ingredient", "nomenclature",
-        "party_sign", "buying_season", "line_of_business",
-        "shipping_warehouse", "document_status", "delivery_status",
-        "shipping_address", "transport"
-    ]
-
-    for col in text_columns:
-        submissions[col] = submissions[col].fillna("").astype(str)
-
-    # Обновляем значения в колонке "party_sign"
-    submissions.loc[
-        submissions["party_sign"] == "Закупівля поточного сезону", "party_sign"
-    ] = " "
-
-    # Формируем колонку product
-    submissions["product"] = submissions.apply(
-        lambda
-            row: f"{str(row['nomenclature']).rstrip()} {str(row['party_sign']).rstrip()} {str(row['buying_season']).rstrip()}",
-        axis=1,
-    )
 
-    # Обрезаем contract_supplement
-    submissions["contract_supplement"] = submissions[
-        "contract_supplement"].str.slice(23, 34)
-
-    return submissions
-    # submissions.drop(axis=0, labels=[0, 1, 2, 3, 4, 5, 6, 7], inplace=True)
-    # submissions.drop(axis=0, labels=submissions.tail(1).index, inplace=True)
-    # submissions.drop(
-    #     axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 6"], inplace=True
-    # )
-
-    # submissions_col_names = [
-    #     "division", "manager", "company_group", "client", "contract_supplement",
-    #     "parent_element", "manufacturer", "active_ingredient", "nomenclature",
-    #     "party_sign", "buying_season", "line_of_business", "period",
-    #     "shipping_warehouse", "document_status", "delivery_status",
-    #     "shipping_address", "transport", "plan", "fact", "different",
-    # ]
-    # submissions.columns = submissions_col_names
-    # submissions["plan"]=submissions["plan"].fillna(0)
-    # submissions["fact"]=submissions["fact"].fillna(0)
-    # submissions["different"]=submissions["different"].fillna(0)
-    # submissions.fillna("", inplace=True)
-    # submissions.loc[
-    #     (submissions["party_sign"] == "Закупівля поточного сезону"), "party_sign"
-    # ] = " "
-    # submissions["product"] = submissions.apply(
-    #     lambda row: str(row["nomenclature"]).rstrip()
-    #                 + " "
-    #                 + str(row["party_sign"]).rstrip()
-    #                 + " "
-    #                 + str(row["buying_season"]).rstrip(),
-    #     axis=1,
-    # )
-    # submissions["contract_supplement"] = submissions["contract_supplement"].astype(str).str.slice(23, 34)
-    return submissions
-
-def process_av_stock(content: bytes) -> pd.DataFrame:
-    av_stock = read_excel_content(content)
-    # Удаляем ненужные строки и колонки
-    av_stock.drop(axis=0, labels=[0, 1, 2, 3, 4, 5, 6], inplace=True)
-    av_stock.drop(axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 4"],
-                  inplace=True)
-
-    # Новые имена колонок
-    av_col_names = [
-        "nomenclature", "party_sign", "buying_season", "division",
-        "line_of_business", "active_substance", "available",
-    ]
-    av_stock.columns = av_col_names
-
-    # Обработка текстовых колонок
-    text_columns = [
-        "nomenclature", "party_sign", "buying_season", "division",
-        "line_of_business", "active_substance"
-    ]
-
-    for col in text_columns:
-        av_stock[col] = av_stock[col].fillna("").astype(str)
-
-    # Обработка числовой колонки (если она числовая)
-    av_stock["available"] = pd.to_numeric(av_stock["available"],
-                                          errors="coerce").fillna(0)
-
-    # Формируем колонку product
-    av_stock["product"] = av_stock.apply(
-        lambda
-            row: f"{row['nomenclature'].rstrip()} {row['party_sign'].rstrip()} {row['buying_season'].rstrip()}",
-        axis=1
-    )
+# Лимиты одновременных запросов по классам маршрутов (см. admission.py).
+# Добавляется до ETag-middleware, чтобы быть внутренним: ответы 304 не занимают место
+app.add_middleware(AdmissionMiddleware)
 
-    return av_stock
-    # av_stock.drop(axis=0, labels=[0, 1, 2, 3, 4, 5, 6], inplace=True)
-    # av_stock.drop(
-    #     axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 4"], inplace=True
-    # )
-    # av_col_names = [
-    #     "nomenclature", "party_sign", "buying_season", "division",
-    #     "line_of_business", "active_substance", "available",
-    # ]
-    # av_stock.columns = av_col_names
-    # av_stock.fillna("", inplace=True)
-    # av_stock["product"] = av_stock.apply(
-    #     lambda row: str(row["nomenclature"]).rstrip()
-    #                 + " "
-    #                 + str(row["party_sign"]).rstrip()
-    #                 + " "
-    #                 + str(row["buying_season"]).rstrip(),
-    #     axis=1,
-    # )
-    # return av_stock
-
-def process_remains_reg(content: bytes) -> pd.DataFrame:
-    remains = read_excel_content(content)
-    # Удаляем ненужные строки и колонки
-    remains.drop(axis=0, labels=[0, 1, 2, 3, 4], inplace=True)
-    remains.drop(axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 4"],
-                 inplace=True)
-    remains.drop(axis=0, labels=remains.tail(1).index, inplace=True)
-
-    # Новые имена колонок
-    remains_col_name = [
-        "line_of_business", "warehouse", "parent_element", "nomenclature",
-        "party_sign",
-        "buying_season", "nomenclature_series", "mtn", "origin_country",
-        "germination",
-        "crop_year", "quantity_per_pallet", "active_substance", "certificate",
-        "certificate_start_date", "certificate_end_date", "buh", "skl",
-        "weight", "storage",
-    ]
-    remains.columns = remains_col_name
-    # Удаляем столбец 'storage'
-    remains.drop(columns=["storage"], inplace=True)
-
-    # Обрабатываем числовые колонки
-    for col in ["buh", "skl", "weight", "quantity_per_pallet"]:
-        remains[col] = pd.to_numeric(remains[col], errors="coerce").fillna(0)
-
-    # Обрабатываем текстовые колонки
-    text_columns = [
-        "line_of_business", "warehouse", "parent_element", "nomenclature",
-        "party_sign",
-        "buying_season", "nomenclature_series", "mtn", "origin_country",
-        "germination", "crop_year", "active_substance", "certificate",
-        "certificate_start_date", "certificate_end_date",
-    ]
-    for col in text_columns:
-        remains[col] = remains[col].fillna("").astype(str)
-
-    # Формируем колонку product
-    remains["product"] = remains.apply(
-        lambda
-            row: f"{row['nomenclature'].rstrip()} {row['party_sign'].rstrip()} {row['buying_season'].rstrip()}",
-        axis=1
-    )
 
-    # Фильтруем по валидным значениям (предполагаю, что valid_line_of_business и valid_warehouse заданы где-то выше)
-    remains = remains.loc[
-        remains["line_of_business"].isin(valid_line_of_business)]
-    remains = remains.loc[remains["warehouse"].isin(valid_warehouse)]
-
-    return remains
-    # remains.drop(axis=0, labels=[0, 1, 2, 3, 4], inplace=True)
-    # remains.drop(
-    #     axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 4"], inplace=True
-    # )
-    # remains.drop(axis=0, labels=remains.tail(1).index, inplace=True)
-    # remains_col_name = [
-    #     "line_of_business", "warehouse", "parent_element", "nomenclature", "party_sign",
-    #     "buying_season", "nomenclature_series", "mtn", "origin_country", "germination",
-    #     "crop_year", "quantity_per_pallet", "active_substance", "certificate",
-    #     "certificate_start_date", "certificate_end_date", "buh", "skl", "weight", "storage",
-    # ]
-    # remains.columns = remains_col_name
-    # remains["buh"]=remains["buh"].fillna(0)
-    # remains["skl"]=remains["skl"].fillna(0)
-    # remains.fillna("", inplace=True)
-    # remains["product"] = remains.apply(
-    #     lambda row: str(row["nomenclature"]).rstrip()
-    #                 + " "
-    #                 + str(row["party_sign"]).rstrip()
-    #                 + " "
-    #                 + str(row["buying_season"]).rstrip(),
-    #     axis=1,
-    # )
-    # remains = remains.loc[remains["line_of_business"].isin(valid_line_of_business)]
-    # remains = remains.loc[remains["warehouse"].isin(valid_warehouse)]
-    # return remains
-
-def process_payment(content: bytes) -> pd.DataFrame:
-    payment = read_excel_content(content)
-    # Удаляем ненужные строки и колонки
-    payment.drop(axis=0, labels=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9], inplace=True)
-    payment.drop(axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 7"],
-                 inplace=True)
-    payment.drop(axis=0, labels=payment.tail(1).index, inplace=True)
-
-    # Новые имена колонок
-    payment_col_name = [
-        "contract_supplement", "contract_type", "prepayment_amount",
-        "amount_of_credit", "prepayment_percentage", "loan_percentage",
-        "planned_amount", "planned_amount_excluding_vat", "actual_sale_amount",
-        "actual_payment_amount",
-    ]
-    payment.columns = payment_col_name
-
-    # Приведение к нужным типам
-    numeric_columns = [
-        "prepayment_amount", "amount_of_credit", "prepayment_percentage",
-        "loan_percentage", "planned_amount", "planned_amount_excluding_vat",
-        "actual_sale_amount", "actual_payment_amount",
-    ]
-
-    for col in numeric_columns:
-        payment[col] = pd.to_numeric(payment[col], errors="coerce").fillna(0)
-
-    # contract_supplement и contract_type — текстовые
-    payment["contract_supplement"] = payment["contract_supplement"].astype(
-        str).fillna("")
-    payment["contract_type"] = payment["contract_type"].astype(str).fillna("")
-
-    return payment
-    # payment.drop(axis=0, labels=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9], inplace=True)
-    # payment.drop(
-    #     axis=1, labels=["Unnamed: 1", "Unnamed: 2", "Unnamed: 7"], inplace=True
-    # )
-    # payment.drop(axis=0, labels=payment.tail(1).index, inplace=True)
-    # payment_col_name = [
-    #     "contract_supplement", "contract_type", "prepayment_amount",
-    #     "amount_of_credit", "prepayment_percentage", "loan_percentage",
-    #     "planned_amount", "planned_amount_excluding_vat", "actual_sale_amount",
-    #     "actual_payment_amount",
-    # ]
-    # payment.columns = payment_col_name
-    # payment.fillna(0, inplace=True)
-    # return payment
-
-def process_moved_data(content: bytes) -> pd.DataFrame:
-    moved = read_excel_content(content, sheet_name="Данные")
-    # Задаём имена колонок
-    moved_col_names = [
-        "order", "date", "line_of_business", "product", "qt_order",
-        "qt_moved", "party_sign", "period", "contract",
-    ]
-    moved.columns = moved_col_names
-
-    # Приводим числовые колонки
-    for col in ["qt_order", "qt_moved"]:
-        moved[col] = pd.to_numeric(moved[col], errors="coerce").fillna(0)
-
-    # Остальные колонки - текстовые
-    text_columns = ["order", "date", "line_of_business", "product",
-                    "party_sign", "period", "contract"]
-    for col in text_columns:
-        moved[col] = moved[col].astype(str).fillna("")
-
-    # Убираем лишние строки, если есть (по аналогии с другими файлами)
-    moved = moved.dropna(how="all")  # Удаляет полностью пустые строки
-    moved = moved.reset_index(drop=True)
-
-    return moved
-    # moved_col_names = [
-    #     "order", "date", "line_of_business", "product", "qt_order",
-    #     "qt_moved", "party_sign", "period", "contract",
-    # ]
-    # moved.columns = moved_col_names
-    # return moved
-
-# Асинхронная функция для отправки сообщений менеджерам
-async def send_message_to_managers():
-    """Отправляет сообщение всем менеджерам в Telegram."""
-    user_tg_id = MANAGERS_ID.values()
-    now = datetime.now() + timedelta(hours=3) # Убедитесь, что это правильное смещение часового пояса
-    time_format = "%d-%m-%Y %H:%M:%S"
-    message_text = f"Дані в боті оновлені.{chr(10)}І вони актуальні станом на… {now:{time_format}}"
-
-    for i in user_tg_id:
+# ETag по поколению данных: данные меняются только при загрузке, поэтому
+# повторный запрос с If-None-Match отвечает 304 без обращения к БД
+@app.middleware("http")
+async def generation_etag_middleware(request: Request, call_next):
+    generation = current_generation()
+    if request.method not in ("GET", "HEAD") or generation is None or not is_generation_path(request.url.path):
+        return await call_next(request)
+    etag = generation_etag(request, generation)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response = await call_next(request)
+    if response.status_code == status.HTTP_200_OK:
+        response.headers.update(headers)
+    return response
+
+
+# Сжатие brotli/gzip по Accept-Encoding. Добавляется после ETag-middleware,
+# чтобы быть внешним и видеть итоговые заголовки ответа
+app.add_middleware(CompressionMiddleware)
+
+
+def run_ingest_job(job: dict, profile: bool = False):
+    """Задача загрузки в потоке executor; ingest.py импортируется при первой задаче."""
+    from .ingest import save_processed_data_to_db_sync
+    return save_processed_data_to_db_sync(job, profile)
+
+
+def _log_ingest_future(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Ingest job crashed in executor: {future.exception()!r}")
+
+
+def queue_ingest_job(job: dict, profile: bool):
+    """
+    Фоновая задача ответа: отправляет уже начатую задачу (start_job) в пул потоков.
+    Если пул уже остановлен, ошибка записывается в задачу.
+    """
+    try:
+        future = ingest_jobs.submit(app.state.executor, run_ingest_job, job, profile)
+    except Exception as e:
+        finish_job(job, error=f"Ingest job was not started: {e}")
+        return
+    future.add_done_callback(_log_ingest_future)
+
+
+async def read_upload_contents(files: dict, bundle_file: UploadFile):
+    """
+    Читает содержимое загруженных файлов (или одного архива со всеми файлами).
+    Возвращает содержимое и формат по наборам данных и статистику передачи архива.
+    """
+    loop = asyncio.get_running_loop()
+    transfer = None
+
+    if bundle_file is not None:
+        # Один архив вместо пяти файлов: распаковываем его в спул вне event loop
+        contents, file_formats, transfer = await loop.run_in_executor(None, read_bundle, bundle_file.file)
+    else:
+        # Проверяем, что переданы все файлы, и их расширения
+        for name, file in files.items():
+            if file is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Missing file for {name}. Send all five files or a single bundle_file archive."
+                )
+            if file_format_from_name(file.filename) is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid file type for {name}. Only .xlsx, .xls, .csv or .tsv files are allowed."
+                )
+        file_formats = {name: file_format_from_name(file.filename) for name, file in files.items()}
+
         try:
-            await bot.send_message(chat_id=i, text=message_text)
-            print(f"Sent message to manager ID: {i}")
+            # Читаем содержимое файлов в байты
+            contents = {name: await file.read() for name, file in files.items()}
         except Exception as e:
-            print(f"Failed to send message to manager ID {i}: {e}")
-
-# Синхронная функция для обработки и сохранения данных в базу данных
-# Она будет запускаться в отдельном потоке (executor)
-def save_processed_data_to_db_sync(
-    av_stock_content: bytes,
-    remains_content: bytes,
-    submissions_content: bytes,
-    payment_content: bytes,
-    moved_content: bytes
-):
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to read file contents: {e}")
+
+    # Быстрая проверка "подписи" каждого файла (первые строки в read-only режиме):
+    # перепутанные файлы отклоняются сразу, а не в фоне после очистки таблиц
+    await loop.run_in_executor(None, check_reports, contents, file_formats)
+    return contents, file_formats, transfer
+
+
+async def submit_ingest_job(
+    background_tasks: BackgroundTasks, contents: dict, file_formats: dict, division: dict, profile: bool = False
+) -> dict:
     """
-    Синхронная функция для обработки и сохранения данных в базу данных.
-    Выполняется в отдельном потоке, чтобы не блокировать FastAPI.
+    Создаёт задачу загрузки подразделения (или находит упавшую задачу с теми же
+    файлами) и запускает её в отдельном потоке. Повторная отправка тех же файлов
+    продолжает задачу с первого незавершённого этапа. Задачи разных
+    подразделений выполняются параллельно.
+    profile=True — задача выполняется под профайлером (только для администратора).
     """
+    loop = asyncio.get_running_loop()
+    # Место в очереди задач: при заполненной очереди — 503 до записи файлов
+    ingest_jobs.reserve()
     try:
-        # 1. Обработка файлов Pandas
-        av_stock = process_av_stock(av_stock_content)
-        remains = process_remains_reg(remains_content)
-        submissions = process_submissions(submissions_content)
-        payment = process_payment(payment_content)
-        moved = process_moved_data(moved_content)
-
-        print("Pandas processing complete.")
-
-        # 2. Подготовка и сохранение данных через Piccolo ORM
-        # --- PRODUCT GUIDE ---
-        av_stock_tmp = av_stock[["product", "line_of_business", "active_substance"]].copy()
-        remains_tmp = remains[["product", "line_of_business", "active_substance"]].copy()
-        submissions_tmp = submissions[["product", "line_of_business", "active_ingredient"]].copy().rename(columns={"active_ingredient": "active_substance"})
-
-        pr = pd.concat([av_stock_tmp, submissions_tmp, remains_tmp], ignore_index=True)
-        pr["product"] = pr["product"].astype(str).str.rstrip()
-        product_guide = pr.drop_duplicates(["product"]).reset_index(drop=True)
-
-        # Выполняем асинхронные операции Piccolo ORM с помощью asyncio.run()
-        # Это безопасно, так как мы находимся в отдельном потоке
-        asyncio.run(ProductGuide.delete(force=True).run()) # Очищаем таблицу перед вставкой
-        product_guide["id"] = product_guide.apply(lambda _: uuid.uuid4(), axis=1) # Генерируем UUID
-        product_guide_dicts = product_guide[['id', 'product', 'line_of_business', 'active_substance']].to_dict(orient='records')
-        asyncio.run(ProductGuide.insert(*[ProductGuide(**d) for d in product_guide_dicts]).run())
-        print(f"ProductGuide inserted: {len(product_guide_dicts)} records.")
-
-        # --- REMAINS ---
-        remains["product"] = remains["product"].astype(str).str.rstrip()
-        remains_sql = pd.merge(remains, product_guide, on="product", suffixes=("", "_guide"))
-        remains_sql = remains_sql[[
-            "line_of_business", "warehouse", "parent_element", "nomenclature", "party_sign",
-            "buying_season", "nomenclature_series", "mtn", "origin_country", "germination",
-            "crop_year", "quantity_per_pallet", "active_substance", "certificate",
-            "certificate_start_date", "certificate_end_date", "buh", "skl", "weight",
-            "id"
-        ]].copy()
-        remains_sql.rename(columns={"id": "product"}, inplace=True)
-        remains_sql["weight"] = remains_sql["weight"].astype(str)
-        remains_sql["quantity_per_pallet"] = remains_sql[
-            "quantity_per_pallet"].astype(str)
-        remains_sql.insert(0, "id", remains_sql.apply(lambda _: uuid.uuid4(), axis=1))
-
-        asyncio.run(Remains.delete(force=True).run())
-        remains_dicts = remains_sql.to_dict(orient='records')
-        asyncio.run(Remains.insert(*[Remains(**d) for d in remains_dicts]).run())
-        print(f"Remains inserted: {len(remains_dicts)} records.")
-
-        # # --- AVAILABLE STOCK ---
-        # av_stock["product"] = av_stock["product"].astype(str).str.rstrip()
-        # available_stock_sql = pd.merge(av_stock, product_guide, on="product", suffixes=("", "_guide"))
-        # available_stock_sql = available_stock_sql[[
-        #     "nomenclature", "party_sign", "buying_season", "division",
-        #     "line_of_business", "available", "id"
-        # ]].copy()
-        # available_stock_sql.rename(columns={"id": "product"}, inplace=True)
-        # available_stock_sql['available'] = pd.to_numeric(available_stock_sql['available'], errors='coerce').fillna(0)
-        # available_stock_sql.insert(0, "id", available_stock_sql.apply(lambda _: uuid.uuid4(), axis=1))
-        #
-        # asyncio.run(AvailableStock.delete(force=True).run())
-        # available_stock_dicts = available_stock_sql.to_dict(orient='records')
-        # asyncio.run(AvailableStock.insert(*[AvailableStock(**d) for d in available_stock_dicts]).run())
-        # print(f"AvailableStock inserted: {len(available_stock_dicts)} records.")
-        # --- AVAILABLE STOCK ---
-        av_stock["product"] = av_stock["product"].astype(str).str.rstrip()
-        available_stock_sql = pd.merge(av_stock, product_guide, on="product",
-                                       suffixes=("", "_guide"))
-        available_stock_sql = available_stock_sql[
-            [
-                "nomenclature", "party_sign", "buying_season", "division",
-                "line_of_business", "available", "id"
-            ]
-        ].copy()
-        available_stock_sql.rename(columns={"id": "product"}, inplace=True)
-        available_stock_sql['available'] = pd.to_numeric(
-            available_stock_sql['available'], errors='coerce').fillna(0)
-        available_stock_sql.insert(0, "id", available_stock_sql.apply(
-            lambda _: uuid.uuid4(), axis=1))
-
-        asyncio.run(AvailableStock.delete(force=True).run())
-
-        available_stock_dicts = available_stock_sql.to_dict(orient='records')
-
-        # --- Разбивка на чанки ---
-        CHUNK_SIZE = 1000  # Подбери размер чанка под свою задачу
-
-        for i in range(0, len(available_stock_dicts), CHUNK_SIZE):
-            chunk = available_stock_dicts[i:i + CHUNK_SIZE]
-            asyncio.run(AvailableStock.insert(
-                *[AvailableStock(**d) for d in chunk]).run())
-            print(
-                f"Inserted chunk {i // CHUNK_SIZE + 1} with {len(chunk)} records.")
-
-        print(f"AvailableStock inserted: {len(available_stock_dicts)} records.")
-
-        # # --- SUBMISSIONS ---
-        # submissions['product'] = submissions['product'].astype(str).str.rstrip()
-        # submissions_sql = pd.merge(submissions, product_guide, on="product", suffixes=("", "_guide"))
-        # submissions_sql = submissions_sql[[
-        #     "division", "manager", "company_group", "client", "contract_supplement",
-        #     "parent_element", "manufacturer", "active_ingredient", "nomenclature",
-        #     "party_sign", "buying_season", "line_of_business", "period",
-        #     "shipping_warehouse", "document_status", "delivery_status",
-        #     "shipping_address", "transport", "plan", "fact", "different",
-        #     "id"
-        # ]].copy()
-        # submissions_sql.rename(columns={"id": "product"}, inplace=True)
-        # submissions_sql.insert(0, "id", submissions_sql.apply(lambda _: uuid.uuid4(), axis=1))
-        #
-        # submissions_sql['plan'] = pd.to_numeric(submissions_sql['plan'], errors='coerce').fillna(0)
-        # submissions_sql['fact'] = pd.to_numeric(submissions_sql['fact'], errors='coerce').fillna(0)
-        # submissions_sql['different'] = pd.to_numeric(submissions_sql['different'], errors='coerce').fillna(0)
-        #
-        # asyncio.run(Submissions.delete(force=True).run())
-        # submissions_dicts = submissions_sql.to_dict(orient='records')
-        # asyncio.run(Submissions.insert(*[Submissions(**d) for d in submissions_dicts]).run())
-        # print(f"Submissions inserted: {len(submissions_dicts)} records.")
-        # --- SUBMISSIONS ---
-        submissions['product'] = submissions['product'].astype(str).str.rstrip()
-        submissions_sql = pd.merge(submissions, product_guide, on="product",
-                                   suffixes=("", "_guide"))
-        submissions_sql = submissions_sql[[
-            "division", "manager", "company_group", "client",
-            "contract_supplement",
-            "parent_element", "manufacturer", "active_ingredient",
-            "nomenclature",
-            "party_sign", "buying_season", "line_of_business", "period",
-            "shipping_warehouse", "document_status", "delivery_status",
-            "shipping_address", "transport", "plan", "fact", "different",
-            "id"
-        ]].copy()
-        submissions_sql.rename(columns={"id": "product"}, inplace=True)
-        submissions_sql.insert(0, "id",
-                               submissions_sql.apply(lambda _: uuid.uuid4(),
-                                                     axis=1))
-        # Приводим всё к строке, кроме числовых
-        for col in submissions_sql.columns:
-            if col not in ["plan", "fact", "different"]:
-                submissions_sql[col] = submissions_sql[col].astype(str)
-
-        submissions_sql['plan'] = pd.to_numeric(submissions_sql['plan'],
-                                                errors='coerce').fillna(0)
-        submissions_sql['fact'] = pd.to_numeric(submissions_sql['fact'],
-                                                errors='coerce').fillna(0)
-        submissions_sql['different'] = pd.to_numeric(
-            submissions_sql['different'], errors='coerce').fillna(0)
-
-        asyncio.run(Submissions.delete(force=True).run())
-        submissions_dicts = submissions_sql.to_dict(orient='records')
-
-        # --- Вставка чанками ---
-        chunk_size = 1000  # Можешь подкорректировать, например, 500 или 2000
-        total_chunks = math.ceil(len(submissions_dicts) / chunk_size)
-
-        for i in range(total_chunks):
-            chunk = submissions_dicts[i * chunk_size: (i + 1) * chunk_size]
-            asyncio.run(
-                Submissions.insert(*[Submissions(**d) for d in chunk]).run())
-            print(
-                f"Inserted chunk {i + 1}/{total_chunks} ({len(chunk)} records)")
-
-        print(f"Submissions inserted: {len(submissions_dicts)} records.")
-        # --- PAYMENT ---
-        for col in ["prepayment_amount", "amount_of_credit", "prepayment_percentage",
-                    "loan_percentage", "planned_amount", "planned_amount_excluding_vat",
-                    "actual_sale_amount", "actual_payment_amount"]:
-            payment[col] = pd.to_numeric(payment[col], errors='coerce').fillna(0)
-
-        payment.insert(0, "id", payment.apply(lambda _: uuid.uuid4(), axis=1))
-
-        asyncio.run(Payment.delete(force=True).run())
-        payment_dicts = payment.to_dict(orient='records')
-        asyncio.run(Payment.insert(*[Payment(**d) for d in payment_dicts]).run())
-        print(f"Payment inserted: {len(payment_dicts)} records.")
-
-        # # --- MOVED DATA ---
-        # moved['qt_order'] = pd.to_numeric(moved['qt_order'], errors='coerce').fillna(0)
-        # moved['qt_moved'] = pd.to_numeric(moved['qt_moved'], errors='coerce').fillna(0)
-        #
-        # moved.insert(0, "id", moved.apply(lambda _: uuid.uuid4(), axis=1))
-        #
-        # asyncio.run(MovedData.delete(force=True).run())
-        # moved_dicts = moved.to_dict(orient='records')
-        # asyncio.run(MovedData.insert(*[MovedData(**d) for d in moved_dicts]).run())
-        # print(f"MovedData inserted: {len(moved_dicts)} records.")
-        # # --- MOVED DATA ---
-        # moved['qt_order'] = pd.to_numeric(moved['qt_order'],
-        #                                   errors='coerce').fillna(0)
-        # moved['qt_moved'] = pd.to_numeric(moved['qt_moved'],
-        #                                   errors='coerce').fillna(0)
-        #
-        # moved.insert(0, "id", moved.apply(lambda _: uuid.uuid4(), axis=1))
-        #
-        # asyncio.run(MovedData.delete(force=True).run())
-        # moved_dicts = moved.to_dict(orient='records')
-        #
-        # # --- Вставка чанками ---
-        # chunk_size = 1000  # Можешь изменить, если нужно
-        # total_chunks = math.ceil(len(moved_dicts) / chunk_size)
-        #
-        # for i in range(total_chunks):
-        #     chunk = moved_dicts[i * chunk_size: (i + 1) * chunk_size]
-        #     asyncio.run(
-        #         MovedData.insert(*[MovedData(**d) for d in chunk]).run())
-        #     print(
-        #         f"Inserted chunk {i + 1}/{total_chunks} ({len(chunk)} records)")
-        #
-        # print(f"MovedData inserted: {len(moved_dicts)} records.")
-        # --- MOVED DATA ---
-
-        # Преобразование даты
-        moved['date'] = pd.to_datetime(moved['date'], errors='coerce').dt.date
-
-        # Преобразование всех остальных колонок, кроме 'date', в строки
-        for col in moved.columns:
-            if col != 'date':
-                moved[col] = moved[col].astype(str).str.strip()
-
-        # Вставляем id
-        moved.insert(0, "id", moved.apply(lambda _: uuid.uuid4(), axis=1))
-
-        # Очистка таблицы и вставка чанками
-        asyncio.run(MovedData.delete(force=True).run())
-        moved_dicts = moved.to_dict(orient='records')
-
-        # --- Вставка чанками ---
-        chunk_size = 1000  # Можешь изменить, если нужно
-        total_chunks = math.ceil(len(moved_dicts) / chunk_size)
-
-        for i in range(total_chunks):
-            chunk = moved_dicts[i * chunk_size: (i + 1) * chunk_size]
-            asyncio.run(
-                MovedData.insert(*[MovedData(**d) for d in chunk]).run())
-            print(
-                f"Inserted chunk {i + 1}/{total_chunks} ({len(chunk)} records)")
-
-        print(f"MovedData inserted: {len(moved_dicts)} records.")
-
-        # Отправка уведомления после успешной загрузки всех данных
-        asyncio.run(send_message_to_managers())
-
-        return {"status": "success", "message": "All data processed and saved successfully."}
+        # Запись исходных файлов в каталог задачи — блокирующая операция
+        job = await loop.run_in_executor(None, create_job, contents, file_formats, division)
+        if job["status"] == "running":
+            # Задача с этими файлами уже выполняется — второй раз не запускаем
+            ingest_jobs.release()
+            return job
+        # Задача и подразделение занимаются до ответа: если подразделение уже
+        # загружается, клиент сразу получает 409, а не 202 с задачей, которая не начнётся
+        job = await loop.run_in_executor(None, start_job, job["job_id"])
+    except BaseException:
+        ingest_jobs.release()
+        raise
+
+    # Запускаем синхронную функцию обработки данных в отдельном потоке,
+    # используя ThreadPoolExecutor (место в очереди освобождается по завершении задачи).
+    background_tasks.add_task(queue_ingest_job, job, profile)
+    return job
 
-    except Exception as e:
-        print(f"Error in save_processed_data_to_db_sync: {e}")
-        return {"status": "error", "message": f"Failed to process data: {str(e)}"}
 
 # Эндпоинт FastAPI для загрузки всех файлов
 @app.post("/upload_all_data/", summary="Upload all Excel files and process data")
 async def upload_all_data(
     background_tasks: BackgroundTasks, # FastAPI будет управлять фоновыми задачами
-    submissions_file: UploadFile = File(..., description="Excel file for Submissions (Заявки.xlsx)"),
-    av_stock_file: UploadFile = File(..., description="Excel file for Available Stock (Доступность товара подразделения.xlsx)"),
-    remains_file: UploadFile = File(..., description="Excel file for Remains (Остатки.xlsx)"),
-    payment_file: UploadFile = File(..., description="Excel file for Payment (оплата.xlsx)"),
-    moved_data_file: UploadFile = File(..., description="Excel file for Moved Data (Заказано_Перемещено.xlsx)"),
+    submissions_file: UploadFile = File(None, description="Excel or CSV file for Submissions (Заявки.xlsx)"),
+    av_stock_file: UploadFile = File(None, description="Excel or CSV file for Available Stock (Доступность товара подразделения.xlsx)"),
+    remains_file: UploadFile = File(None, description="Excel or CSV file for Remains (Остатки.xlsx)"),
+    payment_file: UploadFile = File(None, description="Excel or CSV file for Payment (оплата.xlsx)"),
+    moved_data_file: UploadFile = File(None, description="Excel or CSV file for Moved Data (Заказано_Перемещено.xlsx)"),
+    bundle_file: UploadFile = File(None, description="Single zip or tar.zst archive with all Excel/CSV files instead of the five parts"),
+    division: str = Query(DEFAULT_DIVISION, description="Division code: only this division's rows are replaced"),
+    profile: bool = Query(False, description="Run the ingest job under the profiler (admin only, X-Admin-Token)"),
+    x_admin_token: str = Header(None),
 ):
     """
-    Принимает несколько Excel-файлов, обрабатывает их с помощью Pandas,
-    и сохраняет данные в базу данных PostgreSQL.
+    Принимает несколько Excel/CSV-файлов (или один архив со всеми файлами),
+    обрабатывает их с помощью Pandas и сохраняет данные в базу данных PostgreSQL.
     Эта операция выполняется в фоновом потоке, чтобы не блокировать API.
     """
+    if profile:
+        require_admin(x_admin_token)
+    # Очередь задач заполнена — отказ до чтения и проверки файлов
+    ingest_jobs.check()
+    division_config = await get_division(division)
+    files = {
+        "submissions": submissions_file,
+        "av_stock": av_stock_file,
+        "remains": remains_file,
+        "payment": payment_file,
+        "moved_data": moved_data_file,
+    }
+    contents, file_formats, transfer = await read_upload_contents(files, bundle_file)
+
+    job = await submit_ingest_job(background_tasks, contents, file_formats, division_config, profile)
+
+    response = {
+        "message": "Data processing started in the background. You will be notified by Telegram when complete.",
+        "job_id": job["job_id"],
+    }
+    if transfer is not None:
+        response["transfer"] = transfer
+    return JSONResponse(
+        content=response,
+        status_code=status.HTTP_202_ACCEPTED
+    )
+
+
+@app.post("/upload_all_data/dry_run", summary="Parse and validate all files without touching the database")
+async def upload_all_data_dry_run(
+    submissions_file: UploadFile = File(None, description="Excel or CSV file for Submissions (Заявки.xlsx)"),
+    av_stock_file: UploadFile = File(None, description="Excel or CSV file for Available Stock (Доступность товара подразделения.xlsx)"),
+    remains_file: UploadFile = File(None, description="Excel or CSV file for Remains (Остатки.xlsx)"),
+    payment_file: UploadFile = File(None, description="Excel or CSV file for Payment (оплата.xlsx)"),
+    moved_data_file: UploadFile = File(None, description="Excel or CSV file for Moved Data (Заказано_Перемещено.xlsx)"),
+    bundle_file: UploadFile = File(None, description="Single zip or tar.zst archive with all Excel/CSV files instead of the five parts"),
+    division: str = Query(DEFAULT_DIVISION, description="Division code: only this division's rows are replaced"),
+):
+    """
+    Выполняет полный разбор и подготовку таблиц так же, как /upload_all_data/,
+    но ничего не пишет в базу данных. Возвращает количество строк и длительность этапов.
+    """
+    division_config = await get_division(division)
     files = {
         "submissions": submissions_file,
         "av_stock": av_stock_file,
@@ -656,47 +278,414 @@ async def upload_all_data(
         "payment": payment_file,
         "moved_data": moved_data_file,
     }
+    contents, file_formats, transfer = await read_upload_contents(files, bundle_file)
 
-    # Проверяем расширения файлов
-    for name, file in files.items():
-        if not file.filename.endswith(('.xlsx', '.xls')):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid file type for {name}. Only .xlsx or .xls files are allowed."
-            )
+    from .ingest import dry_run_sync
 
+    # Пробный разбор занимает поток пула наравне с задачами загрузки
+    ingest_jobs.reserve()
+    future = ingest_jobs.submit(app.state.executor, dry_run_sync, contents, file_formats, division_config)
     try:
-        # Читаем содержимое файлов в байты
-        submissions_content = await submissions_file.read()
-        av_stock_content = await av_stock_file.read()
-        remains_content = await remains_file.read()
-        payment_content = await payment_file.read()
-        moved_data_content = await moved_data_file.read()
+        result = await asyncio.wrap_future(future)
     except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to read file contents: {e}")
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Failed to process data: {e}")
 
-    # Запускаем синхронную функцию обработки данных в отдельном потоке,
-    # используя ThreadPoolExecutor.
-    background_tasks.add_task(
-        executor.submit, # Используем executor.submit для запуска синхронной функции в отдельном потоке
-        save_processed_data_to_db_sync,
-        av_stock_content, remains_content,submissions_content,  payment_content, moved_data_content
+    if transfer is not None:
+        result["transfer"] = transfer
+    return result
+
+
+# --- Возобновляемая загрузка (см. uploads.py) ---
+@app.post("/uploads/", summary="Create a resumable upload session", status_code=status.HTTP_201_CREATED)
+async def create_upload_session(request: UploadSessionCreate):
+    manifest = create_session(request)
+    return session_status(manifest)
+
+
+@app.get("/uploads/{upload_id}", summary="Get received byte offsets of an upload session")
+async def get_upload_session(upload_id: str):
+    return session_status(load_session(upload_id))
+
+
+@app.put("/uploads/{upload_id}/{dataset}", summary="Append a chunk of a dataset file at the given offset")
+async def put_upload_chunk(upload_id: str, dataset: str, offset: int, request: Request):
+    # Тело запроса читаем потоком и сразу пишем в спул, не держа кусок целиком в памяти
+    return await append_chunk(upload_id, dataset, offset, request.stream())
+
+
+@app.post("/uploads/{upload_id}/finalize", summary="Verify hashes and start processing of a completed upload")
+async def finalize_upload_session(
+    upload_id: str,
+    request: UploadFinalize,
+    background_tasks: BackgroundTasks,
+    division: str = Query(DEFAULT_DIVISION, description="Division code: only this division's rows are replaced"),
+    profile: bool = Query(False, description="Run the ingest job under the profiler (admin only, X-Admin-Token)"),
+    x_admin_token: str = Header(None),
+):
+    if profile:
+        require_admin(x_admin_token)
+    ingest_jobs.check()
+    division_config = await get_division(division)
+    loop = asyncio.get_running_loop()
+    contents, file_formats = await finalize_session(upload_id, request.sha256)
+    await loop.run_in_executor(None, check_reports, contents, file_formats)
+
+    job = await submit_ingest_job(background_tasks, contents, file_formats, division_config, profile)
+    # Файлы сохранены во входных данных задачи; до этого момента после отказа
+    # (проверка отчётов, очередь задач) finalize можно повторить без повторной загрузки
+    await loop.run_in_executor(None, remove_session, upload_id)
+
+    return JSONResponse(
+        content={
+            "message": "Data processing started in the background. You will be notified by Telegram when complete.",
+            "job_id": job["job_id"],
+        },
+        status_code=status.HTTP_202_ACCEPTED
     )
 
+
+@app.delete("/uploads/{upload_id}", summary="Cancel an upload session and remove its spool files")
+async def delete_upload_session(upload_id: str):
+    delete_session(upload_id)
+    return {"upload_id": upload_id, "deleted": True}
+
+
+# --- Потоковая загрузка строк из 1С в формате NDJSON (см. streaming.py) ---
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json")
+
+
+@app.post("/stream/{dataset}", summary="Replace a division's dataset rows with a streamed NDJSON body")
+async def stream_dataset_rows(
+    dataset: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    division: str = Query(DEFAULT_DIVISION, description="Division code: only this division's rows are replaced"),
+):
+    """
+    Тело запроса — NDJSON, по одной строке отчёта на строку с именами колонок
+    из process_* (ingest.py). Строки пишутся в БД пачками по мере получения тела,
+    вся загрузка — одна транзакция.
+    """
+    if dataset not in STREAM_DATASETS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown dataset: {dataset}")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type and content_type not in NDJSON_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Only NDJSON bodies are supported (Content-Type: application/x-ndjson)",
+        )
+    division_config = await get_division(division)
+    # Подразделение занято, пока строки набора не заменены и производные таблицы не
+    # пересчитаны: задача загрузки, восстановление снимка или другой поток того же
+    # подразделения в это время получают 409
+    owner = f"stream_{dataset}_{division_config['code']}"
+    claim_division(owner, division_config["code"])
+    try:
+        result = await stream_dataset(dataset, division_config, request.stream())
+    except BaseException:
+        release_division(owner)
+        raise
+    # Покрытие заявок, дефицит и прогресс перемещений пересчитываются после ответа
+    background_tasks.add_task(refresh_stream_derived_tables, dataset, division_config["code"], owner)
+    return result
+
+
+async def refresh_stream_derived_tables(dataset: str, division_code: str, owner: str):
+    try:
+        await refresh_derived_tables(dataset, division_code)
+    finally:
+        release_division(owner)
+
+
+# --- Задачи загрузки с контрольными точками (см. jobs.py) ---
+@app.get("/ingest/{job_id}", summary="Get status and completed stages of an ingest job")
+async def get_ingest_job(job_id: str):
+    return job_status(job_id)
+
+
+@app.post("/ingest/{job_id}/retry", summary="Resume a failed ingest job from the first incomplete stage")
+async def retry_ingest_job(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    profile: bool = Query(False, description="Run the ingest job under the profiler (admin only, X-Admin-Token)"),
+    x_admin_token: str = Header(None),
+):
+    if profile:
+        require_admin(x_admin_token)
+    job = job_status(job_id)
+    if job["status"] == "running":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ingest job is already running")
+    if job["status"] == "success":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ingest job has already completed")
+
+    ingest_jobs.reserve()
+    try:
+        job = await asyncio.get_running_loop().run_in_executor(None, start_job, job_id)
+    except BaseException:
+        ingest_jobs.release()
+        raise
+    background_tasks.add_task(queue_ingest_job, job, profile)
+    completed = [stage for stage, info in job["stages"].items() if info.get("done")]
     return JSONResponse(
-        content={"message": "Data processing started in the background. You will be notified by Telegram when complete."},
+        content={"message": "Ingest job resumed in the background.", "job_id": job_id, "completed_stages": completed},
         status_code=status.HTTP_202_ACCEPTED
     )
 
+
+@app.get("/ingest/{job_id}/profile", summary="Get per-stage profile summary of an ingest job",
+         dependencies=[Depends(require_admin)])
+async def get_ingest_profile(job_id: str):
+    job_status(job_id)
+    summary = load_profile_summary(job_path(job_id, "profile"))
+    if summary is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingest job was not profiled")
+    summary["flamegraphs"] = {
+        stage: f"/ingest/{job_id}/profile/{stage}" for stage in profile_stages(job_path(job_id, "profile"))
+    }
+    return summary
+
+
+@app.get("/ingest/{job_id}/profile/{stage}", summary="Get folded stacks of an ingest stage (flamegraph.pl / speedscope)",
+         dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def get_ingest_stage_profile(job_id: str, stage: str):
+    job_status(job_id)
+    if stage not in profile_stages(job_path(job_id, "profile")):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stage was not profiled")
+    with open(job_path(job_id, "profile", f"{stage}.folded"), encoding="utf-8") as f:
+        return PlainTextResponse(f.read())
+
+
+# --- Подразделения (см. divisions.py) ---
+@app.get("/divisions/", summary="List divisions and their ingest settings")
+async def get_divisions():
+    return await list_divisions()
+
+
+@app.get("/divisions/{code}", summary="Get ingest settings of a division")
+async def get_division_settings(code: str):
+    return await get_division(code)
+
+
+@app.put("/divisions/{code}", summary="Create or update a division (warehouses, lines of business, managers)",
+         dependencies=[Depends(require_admin)])
+async def put_division(config: DivisionConfig, code: str = Path(..., pattern=DIVISION_CODE_PATTERN)):
+    return await save_division(code, config)
+
+
+# --- Состояние пула соединений (см. database.py) ---
+@app.get("/db/pool", summary="Get database connection pool statistics", dependencies=[Depends(require_admin)])
+async def get_pool_stats():
+    return pool_stats()
+
+
+# --- Допуск запросов и очередь задач загрузки (см. admission.py) ---
+@app.get("/admission/stats", summary="Get per-route-class concurrency, queue and rejection counters",
+         dependencies=[Depends(require_admin)])
+async def get_admission_stats():
+    return admission_stats()
+
+
+@app.get("/cache/stats", summary="Get read cache hit/miss counters and sizes", dependencies=[Depends(require_admin)])
+async def get_cache_stats():
+    return {"generation": current_generation(), **cache_stats()}
+
+
+# --- Архив снимков загруженных данных (см. snapshots.py) ---
+@app.get("/snapshots/", summary="List Parquet snapshots of successful ingests", dependencies=[Depends(require_admin)])
+async def get_snapshots():
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, list_snapshot_manifests)
+
+
+@app.post("/snapshots/{snapshot}/restore", summary="Reload a snapshot into the database without Excel parsing",
+          dependencies=[Depends(require_admin)])
+async def post_restore_snapshot(snapshot: str):
+    ingest_jobs.reserve()
+    return await asyncio.wrap_future(ingest_jobs.submit(app.state.executor, restore_snapshot_sync, snapshot))
+
+
+# Подразделение эндпоинтов чтения: покрытие, дефицит, прогресс, списки и выгрузки
+LIST_DIVISION = Query(DEFAULT_DIVISION, pattern=DIVISION_CODE_PATTERN, description="Division code")
+
+
 # Пример эндпоинта для получения данных из ProductGuide
 @app.get("/product_guide/{product_name}", summary="Get ProductGuide details by product name")
 async def get_product_guide(product_name: str):
     product_name_cleaned = product_name.strip()
-    # Ищем продукт по имени
-    product = await ProductGuide.objects().where(ProductGuide.product == product_name_cleaned).first()
+    # Ищем продукт по имени (кеш до следующей загрузки, см. cache.py)
+    product = await product_by_name(current_generation(), product_name_cleaned)
     if not product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found in guide")
-    return product.to_dict()
+    return ORJSONResponse(product)
+
+
+@app.post("/product_guide/batch", summary="Resolve many products by name or id in one query")
+async def get_product_guide_batch(
+    request: ProductBatchRequest,
+    output: str = Query("keyed", pattern="^(keyed|columnar)$", description="keyed: by requested name/id; columnar: column arrays"),
+):
+    return ORJSONResponse(await lookup_products(request, output))
+
+
+# Покрытие утверждённых заявок складским остатком (считается при загрузке, см. allocation.py)
+@app.get("/submission_coverage/product/{product_id}", summary="Get stock coverage of approved submissions for a product")
+async def get_product_coverage(product_id: str, division: str = LIST_DIVISION):
+    return ORJSONResponse(await coverage_by_product(current_generation(), division, product_id))
+
+
+@app.get("/submission_coverage/contract/{contract_supplement}", summary="Get stock coverage of submissions by contract supplement")
+async def get_contract_coverage(contract_supplement: str, division: str = LIST_DIVISION):
+    coverage = await coverage_by_contract(current_generation(), division, contract_supplement.strip())
+    if not coverage:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No approved submissions for this contract supplement")
+    return ORJSONResponse(coverage)
+
+
+
+# Отчёт о дефиците (считается при загрузке, см. allocation.py)
+@app.get("/shortages/", summary="Get products where approved submissions exceed stock, sorted by deficit")
+async def get_shortages(
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500),
+    division: str = LIST_DIVISION,
+):
+    total, items = await shortages_page(current_generation(), division, page, page_size)
+    return ORJSONResponse({
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "pages": (total + page_size - 1) // page_size,
+        "items": items,
+    })
+
+
+
+# Прогресс перемещения по заказу или договору (свёртка MovedData при загрузке, см. progress.py)
+@app.get("/moved_progress/order/{order}", summary="Get movement progress of an order")
+async def get_order_progress(order: str, division: str = LIST_DIVISION):
+    progress = await moved_progress(current_generation(), division, "order", order.strip())
+    if not progress:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    return ORJSONResponse(progress)
+
+
+@app.get("/moved_progress/contract/{contract}", summary="Get movement progress of a contract")
+async def get_contract_progress(contract: str, division: str = LIST_DIVISION):
+    progress = await moved_progress(current_generation(), division, "contract", contract.strip())
+    if not progress:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contract not found")
+    return ORJSONResponse(progress)
+
+
+# Списки строк с пагинацией по ключу (см. listing.py)
+LIST_AFTER = Query(None, description="next_cursor of the previous page")
+LIST_LIMIT = Query(100, ge=1, le=LIST_PAGE_MAX, description="Page size")
+
+
+@app.get("/remains/", summary="List a division's remains, keyset-paginated by id")
+async def get_remains(
+    division: str = LIST_DIVISION,
+    line_of_business: Optional[str] = None,
+    warehouse: Optional[str] = None,
+    after: Optional[uuid.UUID] = LIST_AFTER,
+    limit: int = LIST_LIMIT,
+):
+    filters = {"line_of_business": line_of_business, "warehouse": warehouse}
+    return list_rows("remains", division, filters, after, limit)
+
+
+@app.get("/submissions/", summary="List a division's submissions, keyset-paginated by id")
+async def get_submissions(
+    division: str = LIST_DIVISION,
+    line_of_business: Optional[str] = None,
+    warehouse: Optional[str] = Query(None, description="Shipping warehouse"),
+    manager: Optional[str] = None,
+    document_status: Optional[str] = None,
+    after: Optional[uuid.UUID] = LIST_AFTER,
+    limit: int = LIST_LIMIT,
+):
+    filters = {
+        "line_of_business": line_of_business,
+        "warehouse": warehouse,
+        "manager": manager,
+        "document_status": document_status,
+    }
+    return list_rows("submissions", division, filters, after, limit)
+
+
+@app.get("/payment/", summary="List a division's payments, keyset-paginated by id")
+async def get_payment(
+    division: str = LIST_DIVISION,
+    contract_supplement: Optional[str] = None,
+    contract_type: Optional[str] = None,
+    after: Optional[uuid.UUID] = LIST_AFTER,
+    limit: int = LIST_LIMIT,
+):
+    filters = {"contract_supplement": contract_supplement, "contract_type": contract_type}
+    return list_rows("payment", division, filters, after, limit)
+
+
+# Выгрузка таблиц подразделения в CSV, NDJSON или Arrow (см. exports.py)
+EXPORT_RESERVED_PARAMS = {"format", "division", "delimiter"}
+
+
+@app.get("/export/{dataset}", summary="Stream a division's table as CSV, NDJSON or Arrow IPC")
+async def export_dataset(
+    dataset: str,
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson|arrow)$"),
+    division: str = LIST_DIVISION,
+    delimiter: str = Query(",", pattern="^[,;\t]$", description="CSV delimiter"),
+):
+    """
+    Остальные параметры запроса — фильтры по колонкам набора данных
+    (например, /export/submissions?manager=...&document_status=...).
+    """
+    filters = {key: value for key, value in request.query_params.items() if key not in EXPORT_RESERVED_PARAMS}
+    return export_rows(dataset, format, division, filters, delimiter)
+
+
+# Отчёты XLSX с кешем по поколению данных (см. xlsx_reports.py)
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+@app.get("/xlsx_reports/{report}", summary="Download an XLSX report (submissions per manager, remains per warehouse, shortages)")
+async def get_xlsx_report(report: str, request: Request, division: str = LIST_DIVISION):
+    """Остальные параметры запроса — фильтры отчёта (например, ?manager=... для submissions_by_manager)."""
+    params = {key: value for key, value in request.query_params.items() if key != "division"}
+    path = await get_report_file(report, division, params, current_generation())
+    return FileResponse(path, media_type=XLSX_MEDIA_TYPE, filename=f"{report}_{division}.xlsx")
+
+
+# Вход в веб-приложение через Telegram-бота (см. login.py)
+@app.post("/auth/login-token", summary="Create a login code for the Telegram bot", status_code=status.HTTP_201_CREATED)
+async def post_login_token():
+    return create_login_token()
+
+
+@app.post("/auth/confirm-login-token", summary="Confirm a login code (called by the Telegram bot, X-Bot-Token)",
+          dependencies=[Depends(require_bot)])
+async def post_confirm_login_token(request: ConfirmLoginRequest):
+    return await confirm_login_token(request)
+
+
+@app.get("/auth/login-token/{token}/wait", summary="Long-poll until the login code is confirmed or expires")
+async def get_login_token_wait(
+    token: str,
+    secret: str = Query(..., description="secret returned when the login code was created"),
+    timeout: float = Query(LOGIN_WAIT_MAX_SECONDS, gt=0, le=LOGIN_WAIT_MAX_SECONDS),
+):
+    return await wait_login_token(token, secret, timeout)
+
+
+@app.get("/auth/login-token/{token}/events", summary="Server-sent events: confirmed or expired")
+async def get_login_token_events(token: str, secret: str = Query(...)):
+    return StreamingResponse(
+        login_token_events(token, secret),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
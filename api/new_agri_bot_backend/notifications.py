@@ -0,0 +1,89 @@
+# data_loader_api/app/notifications.py
+# Уведомления менеджерам в Telegram.
+#
+# Импорт aiogram занимает около двух секунд, поэтому ни aiogram, ни Bot не
+# создаются при импорте модуля: Bot создаётся в lifespan приложения (start_bot)
+# фоновой задачей — aiogram импортируется в потоке, пока API уже отвечает на
+# запросы, — и закрывается при остановке (close_bot).
+#
+# Задача загрузки выполняется в потоке executor и отправляет уведомление через
+# notify_managers_sync: сообщение уходит в цикле событий приложения, где создана
+# сессия Bot. Вне приложения (скрипты) создаётся временный Bot.
+import asyncio
+import importlib
+from datetime import datetime, timedelta
+
+from .config import TELEGRAM_BOT_TOKEN, DEFAULT_DIVISION
+
+# Сколько поток загрузки ждёт отправки уведомлений в цикле событий приложения
+NOTIFY_TIMEOUT_SECONDS = 120
+
+_bot_task: asyncio.Task = None
+_bot_loop: asyncio.AbstractEventLoop = None
+
+
+async def _create_bot():
+    # Импорт в потоке: цикл событий в это время обслуживает запросы
+    aiogram = await asyncio.to_thread(importlib.import_module, "aiogram")
+    return aiogram.Bot(TELEGRAM_BOT_TOKEN)
+
+
+def start_bot():
+    """Запускает создание Bot в фоне (вызывается в lifespan приложения)."""
+    global _bot_task, _bot_loop
+    _bot_loop = asyncio.get_running_loop()
+    _bot_task = asyncio.create_task(_create_bot())
+
+
+async def close_bot():
+    global _bot_task, _bot_loop
+    task, _bot_task, _bot_loop = _bot_task, None, None
+    if task is None:
+        return
+    try:
+        bot = await task
+    except Exception:
+        return
+    await bot.session.close()
+
+
+# Асинхронная функция для отправки сообщений менеджерам
+async def send_message_to_managers(division: dict, bot=None):
+    """Отправляет сообщение менеджерам подразделения в Telegram."""
+    if bot is None:
+        try:
+            bot = await asyncio.shield(_bot_task)
+        except Exception as e:
+            print(f"Telegram bot is not available, managers were not notified: {e}")
+            return
+    user_tg_id = division["managers"].values()
+    now = datetime.now() + timedelta(hours=3) # Убедитесь, что это правильное смещение часового пояса
+    time_format = "%d-%m-%Y %H:%M:%S"
+    # Для подразделения по умолчанию текст прежний, для остальных — с названием подразделения
+    updated = "Дані в боті оновлені." if division["code"] == DEFAULT_DIVISION else f"Дані підрозділу «{division['name']}» в боті оновлені."
+    message_text = f"{updated}{chr(10)}І вони актуальні станом на… {now:{time_format}}"
+
+    for i in user_tg_id:
+        try:
+            await bot.send_message(chat_id=i, text=message_text)
+            print(f"Sent message to manager ID: {i}")
+        except Exception as e:
+            print(f"Failed to send message to manager ID {i}: {e}")
+
+
+async def _send_with_temporary_bot(division: dict):
+    bot = await _create_bot()
+    try:
+        await send_message_to_managers(division, bot)
+    finally:
+        await bot.session.close()
+
+
+def notify_managers_sync(division: dict):
+    """Отправка уведомления из потока задачи загрузки (синхронная)."""
+    loop = _bot_loop
+    if loop is not None and _bot_task is not None and loop.is_running():
+        future = asyncio.run_coroutine_threadsafe(send_message_to_managers(division), loop)
+        future.result(timeout=NOTIFY_TIMEOUT_SECONDS)
+    else:
+        asyncio.run(_send_with_temporary_bot(division))
@@ -5,7 +5,10 @@ the APP_CONFIG.
 
 import os
 
-from piccolo.conf.apps import AppConfig, table_finder, get_package
+from piccolo.conf.apps import AppConfig, Command, table_finder, get_package
+
+from .backfill import backfill_history
+from .snapshots import list_snapshots, restore_snapshot
 
 
 CURRENT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
@@ -22,5 +25,9 @@ APP_CONFIG = AppConfig(
         exclude_imported=True,
     ),
     migration_dependencies=[],
-    commands=[],
+    commands=[
+        Command(list_snapshots),
+        Command(restore_snapshot),
+        Command(backfill_history),
+    ],
 )
@@ -0,0 +1,65 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.columns.indexes import IndexMethod
+from piccolo.table import Table
+
+
+class RawTable(Table):
+    pass
+
+
+ID = "2026-10-19T21:52:31:604117"
+VERSION = "1.26.1"
+DESCRIPTION = "Keyset pagination indexes"
+
+
+async def forwards():
+    manager = MigrationManager(
+        migration_id=ID, app_name="new_agri_bot_backend", description=DESCRIPTION
+    )
+
+    async def remains_keyset_indexes():
+        await RawTable.raw(
+            "CREATE INDEX IF NOT EXISTS remains_division_code_id ON remains (division_code, id)"
+        ).run()
+        await RawTable.raw(
+            "CREATE INDEX IF NOT EXISTS remains_division_code_line_of_business_id ON remains (division_code, line_of_business, id)"
+        ).run()
+        await RawTable.raw(
+            "CREATE INDEX IF NOT EXISTS remains_division_code_warehouse_id ON remains (division_code, warehouse, id)"
+        ).run()
+
+    manager.add_raw(remains_keyset_indexes)
+
+    async def submissions_keyset_indexes():
+        await RawTable.raw(
+            "CREATE INDEX IF NOT EXISTS submissions_division_code_id ON submissions (division_code, id)"
+        ).run()
+        await RawTable.raw(
+            "CREATE INDEX IF NOT EXISTS submissions_division_code_line_of_business_id ON submissions (division_code, line_of_business, id)"
+        ).run()
+        await RawTable.raw(
+            "CREATE INDEX IF NOT EXISTS submissions_division_code_shipping_warehouse_id ON submissions (division_code, shipping_warehouse, id)"
+        ).run()
+        await RawTable.raw(
+            "CREATE INDEX IF NOT EXISTS submissions_division_code_manager_id ON submissions (division_code, manager, id)"
+        ).run()
+        await RawTable.raw(
+            "CREATE INDEX IF NOT EXISTS submissions_division_code_document_status_id ON submissions (division_code, document_status, id)"
+        ).run()
+
+    manager.add_raw(submissions_keyset_indexes)
+
+    async def payment_keyset_indexes():
+        await RawTable.raw(
+            "CREATE INDEX IF NOT EXISTS payment_division_code_id ON payment (division_code, id)"
+        ).run()
+        await RawTable.raw(
+            "CREATE INDEX IF NOT EXISTS payment_division_code_contract_supplement_id ON payment (division_code, contract_supplement, id)"
+        ).run()
+        await RawTable.raw(
+            "CREATE INDEX IF NOT EXISTS payment_division_code_contract_type_id ON payment (division_code, contract_type, id)"
+        ).run()
+
+    manager.add_raw(payment_keyset_indexes)
+
+    return manager
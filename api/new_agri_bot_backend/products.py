@@ -0,0 +1,66 @@
+# data_loader_api/app/products.py
+# Пакетный поиск продуктов в ProductGuide.
+#
+# /product_guide/{product_name} находит один продукт за HTTP-запрос, а веб-приложение
+# показывает десятки продуктов на странице. Пакетный поиск разрешает до
+# PRODUCT_BATCH_MAX названий и id одним запросом с = ANY($1): один и тот же
+# подготовленный запрос независимо от количества продуктов.
+import uuid
+from typing import List
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+
+from .config import PRODUCT_BATCH_MAX
+from .database import acquire_connection
+
+PRODUCT_COLUMNS = ["id", "product", "line_of_business", "active_substance"]
+
+
+class ProductBatchRequest(BaseModel):
+    names: List[str] = []
+    ids: List[uuid.UUID] = []
+
+
+async def lookup_products(request: ProductBatchRequest, output: str = "keyed") -> dict:
+    """
+    Продукты по названиям и id.
+    output="keyed" — {"products": {запрошенное название или id: продукт}, "missing": [...]},
+    output="columnar" — {"columns": {колонка: [значения]}, "missing": [...]}.
+    """
+    names = list(dict.fromkeys(name.strip() for name in request.names))
+    ids = list(dict.fromkeys(request.ids))
+    if len(names) + len(ids) > PRODUCT_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {PRODUCT_BATCH_MAX} product names and ids per request",
+        )
+
+    async with acquire_connection() as connection:
+        rows = await connection.fetch(
+            'SELECT id, product, line_of_business, active_substance FROM "product_guide" '
+            'WHERE product = ANY($1::varchar[]) OR id = ANY($2::uuid[])',
+            names, ids,
+        )
+
+    by_name = {row["product"]: row for row in rows}
+    by_id = {row["id"]: row for row in rows}
+    found = {name: by_name[name] for name in names if name in by_name}
+    found.update({str(product_id): by_id[product_id] for product_id in ids if product_id in by_id})
+    missing = [name for name in names if name not in by_name] + [str(i) for i in ids if i not in by_id]
+
+    if output == "columnar":
+        return {
+            "columns": {
+                column: [str(row[column]) if column == "id" else row[column] for row in rows]
+                for column in PRODUCT_COLUMNS
+            },
+            "missing": missing,
+        }
+    return {
+        "products": {
+            key: {column: str(row[column]) if column == "id" else row[column] for column in PRODUCT_COLUMNS}
+            for key, row in found.items()
+        },
+        "missing": missing,
+    }
@@ -0,0 +1,169 @@
+# data_loader_api/app/profiling.py
+# Профилирование задачи загрузки по запросу администратора.
+#
+# Сэмплирующий профайлер: отдельный поток каждые PROFILE_SAMPLE_INTERVAL_MS
+# снимает стек потока загрузки (sys._current_frames) и считает одинаковые стеки.
+# Результат по каждому этапу сохраняется в формате "folded stacks"
+# (одна строка "f1;f2;f3 N"), который понимают flamegraph.pl и speedscope.
+# Дополнительно tracemalloc показывает, какие строки кода больше всего
+# выделили памяти на каждом этапе.
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from .config import PROFILE_SAMPLE_INTERVAL_MS, PROFILE_TOP_ALLOCATIONS
+
+SUMMARY_FILE = "summary.json"
+
+# tracemalloc глобален для процесса, поэтому одновременно профилируется одна задача
+_profiling_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class IngestProfiler:
+    """
+    Профайлер задачи загрузки. Использование:
+
+        with IngestProfiler(profile_dir) as profiler:
+            with profiler.stage("parse_submissions"):
+                ...
+    """
+
+    def __init__(self, profile_dir: str):
+        self.profile_dir = profile_dir
+        self.thread_id = None
+        self.enabled = False
+        self._stage = None
+        self._samples = {}
+        # Этап начинается и заканчивается в потоке загрузки, а сэмплы пишет поток
+        # профайлера: без блокировки сэмпл мог попасть в уже удалённый счётчик этапа
+        self._samples_lock = threading.Lock()
+        # Повторный запуск задачи дописывает этапы к профилю предыдущей попытки
+        self._summary = load_profile_summary(profile_dir) or {"stages": {}}
+        self._summary["interval_ms"] = PROFILE_SAMPLE_INTERVAL_MS
+        self._summary.pop("skipped", None)
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def __enter__(self):
+        if not _profiling_lock.acquire(blocking=False):
+            print("Profiling skipped: another ingest job is being profiled.")
+            self._summary["skipped"] = "another ingest job is being profiled"
+            self._write_summary()
+            return self
+        self.enabled = True
+        self.thread_id = threading.get_ident()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        tracemalloc.start()
+        self._sampler = threading.Thread(target=self._sample_loop, name="ingest-profiler", daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.enabled:
+            return False
+        self._stop.set()
+        self._sampler.join()
+        tracemalloc.stop()
+        self.enabled = False
+        _profiling_lock.release()
+        return False
+
+    def _sample_loop(self):
+        interval = PROFILE_SAMPLE_INTERVAL_MS / 1000
+        while not self._stop.wait(interval):
+            stage = self._stage
+            frame = sys._current_frames().get(self.thread_id)
+            if stage is None or frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            with self._samples_lock:
+                # Этап мог закончиться, пока снимался стек
+                samples = self._samples.get(stage)
+                if samples is not None:
+                    samples[";".join(reversed(stack))] += 1
+
+    @contextmanager
+    def stage(self, name: str):
+        """Профилирует один этап: сэмплы стеков и прирост памяти по строкам кода."""
+        if not self.enabled:
+            yield
+            return
+
+        with self._samples_lock:
+            self._samples[name] = Counter()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        self._stage = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stage = None
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            self._save_stage(name, seconds, peak, after.compare_to(before, "lineno"))
+
+    def _save_stage(self, name: str, seconds: float, peak: int, diff):
+        with self._samples_lock:
+            samples = self._samples.pop(name)
+        with open(os.path.join(self.profile_dir, f"{name}.folded"), "w", encoding="utf-8") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        allocations = []
+        for stat in diff:
+            if len(allocations) >= PROFILE_TOP_ALLOCATIONS:
+                break
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            allocations.append({
+                "file": frame.filename,
+                "line": frame.lineno,
+                "size_kb": round(stat.size_diff / 1024, 1),
+                "count": stat.count_diff,
+            })
+
+        self._summary["stages"][name] = {
+            "seconds": round(seconds, 3),
+            "samples": sum(samples.values()),
+            "peak_memory_mb": round(peak / 1024 / 1024, 1),
+            "top_allocations": allocations,
+        }
+        # Сохраняем после каждого этапа, чтобы профиль упавшей задачи тоже был доступен
+        self._write_summary()
+
+    def _write_summary(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, SUMMARY_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._summary, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+def load_profile_summary(profile_dir: str) -> dict:
+    try:
+        with open(os.path.join(profile_dir, SUMMARY_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except OSError:
+        return None
+
+
+def profile_stages(profile_dir: str) -> list:
+    if not os.path.isdir(profile_dir):
+        return []
+    return sorted(name[:-len(".folded")] for name in os.listdir(profile_dir) if name.endswith(".folded"))
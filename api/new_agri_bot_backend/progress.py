@@ -0,0 +1,50 @@
+# data_loader_api/app/progress.py
+# Прогресс перемещения заказов (MovedData).
+#
+# В MovedData qt_order и qt_moved хранятся строками по каждой строке заказа,
+# поэтому вопрос "сколько по заказу X уже перемещено" требует приведения
+# и суммирования при каждом запросе. При загрузке данных строится свёртка
+# MovedProgress: по каждому заказу и по каждому договору — заказано,
+# перемещено, процент и дата последнего перемещения.
+import pandas as pd
+
+PROGRESS_ORDER = "order"
+PROGRESS_CONTRACT = "contract"
+
+
+def _rollup(moved: pd.DataFrame, key: str) -> pd.DataFrame:
+    moved = moved.loc[moved[key] != ""]
+    rollup = moved.groupby(moved[key].rename("key")).agg(
+        contract=("contract", "first"),
+        lines=("qt_order", "size"),
+        ordered=("qt_order", "sum"),
+        moved=("qt_moved", "sum"),
+        last_move_date=("move_date", "max"),
+    ).reset_index()
+    rollup.insert(0, "kind", key)
+    return rollup
+
+
+def build_moved_progress(moved: pd.DataFrame) -> pd.DataFrame:
+    """
+    Свёртка MovedData по заказам и договорам. Принимает очищенный набор данных
+    moved_data (process_moved_data уже привела количества к числам).
+    """
+    moved = moved[["order", "contract", "date", "qt_order", "qt_moved"]].copy()
+    for col in ["order", "contract"]:
+        moved[col] = moved[col].fillna("").astype(str).str.strip().replace("nan", "")
+    for col in ["qt_order", "qt_moved"]:
+        moved[col] = pd.to_numeric(moved[col], errors="coerce").fillna(0)
+    # Дата последнего перемещения — только по строкам, где что-то перемещено
+    moved["move_date"] = pd.to_datetime(moved["date"], errors="coerce", format="mixed").where(moved["qt_moved"] > 0)
+
+    progress = pd.concat(
+        [_rollup(moved, PROGRESS_ORDER), _rollup(moved, PROGRESS_CONTRACT)],
+        ignore_index=True,
+    )
+    progress["percent"] = (
+        progress["moved"] / progress["ordered"].where(progress["ordered"] > 0) * 100
+    ).round(2).fillna(0)
+    progress["last_move_date"] = progress["last_move_date"].dt.date
+    progress["last_move_date"] = progress["last_move_date"].astype(object).where(progress["last_move_date"].notna(), None)
+    return progress[["kind", "key", "contract", "lines", "ordered", "moved", "percent", "last_move_date"]]
@@ -0,0 +1,146 @@
+# data_loader_api/app/reports.py
+# Описание отчётов 1С и быстрая предварительная проверка файлов.
+#
+# Модуль намеренно не импортирует pandas: проверка файлов выполняется
+# синхронно в обработчике запроса и должна занимать миллисекунды.
+import codecs
+import io
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, status
+
+# Разметка отчётов 1С: сколько строк пропустить сверху (шапка отчёта вместе
+# со строкой заголовков), какие колонки удалить (по позиции) и есть ли
+# итоговая строка внизу. Одинакова для Excel и CSV выгрузок одного отчёта.
+# width — полное количество колонок в отчёте, по нему же отчёты различаются.
+REPORT_LAYOUTS = {
+    "submissions": {"skip_rows": 9, "drop_columns": [1, 2, 6], "footer": True, "width": 24},
+    "av_stock": {"skip_rows": 8, "drop_columns": [1, 2, 4], "footer": False, "width": 10},
+    "remains": {"skip_rows": 6, "drop_columns": [1, 2, 4], "footer": True, "width": 23},
+    "payment": {"skip_rows": 11, "drop_columns": [1, 2, 7], "footer": True, "width": 13},
+    "moved_data": {"skip_rows": 1, "drop_columns": [], "footer": False, "width": 9, "sheet_name": "Данные"},
+}
+
+# Сколько строк данных после шапки читать при проверке
+SNIFF_DATA_ROWS = 10
+SNIFF_SAMPLE_BYTES = 65536
+
+
+def detect_csv_encoding(content: bytes) -> str:
+    """UTF-8/UTF-16 по BOM, иначе UTF-8 если байты корректны, иначе cp1251 (выгрузки 1С)."""
+    if content.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if content.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        # final=False: образец может обрываться посреди многобайтного символа
+        codecs.getincrementaldecoder("utf-8")().decode(content[:SNIFF_SAMPLE_BYTES], final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1251"
+
+
+def sniff_csv_delimiter(sample: str) -> str:
+    lines = [line for line in sample.splitlines()[:20] if line.strip()]
+    counts = {d: sum(line.count(d) for line in lines) for d in (";", "\t", ",")}
+    return max(counts, key=counts.get)
+
+
+def _xlsx_row_widths(content: bytes) -> Dict[Optional[str], List[int]]:
+    """
+    Ширина (индекс последней непустой ячейки + 1) первых строк каждого нужного листа.
+    Ключ None — первый лист книги. Книга открывается в read-only режиме,
+    читаются только первые строки.
+    """
+    from openpyxl import load_workbook
+
+    max_rows = max(layout["skip_rows"] for layout in REPORT_LAYOUTS.values()) + SNIFF_DATA_ROWS
+    sheet_names = {layout.get("sheet_name") for layout in REPORT_LAYOUTS.values()}
+
+    workbook = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    try:
+        widths = {}
+        for sheet_name in sheet_names:
+            if sheet_name is None:
+                sheet = workbook.worksheets[0]
+            elif sheet_name in workbook.sheetnames:
+                sheet = workbook[sheet_name]
+            else:
+                continue
+            row_widths = []
+            for row in sheet.iter_rows(max_row=max_rows, values_only=True):
+                filled = [i for i, value in enumerate(row) if value is not None]
+                row_widths.append(filled[-1] + 1 if filled else 0)
+            widths[sheet_name] = row_widths
+        return widths
+    finally:
+        workbook.close()
+
+
+def _csv_row_widths(content: bytes) -> Dict[Optional[str], List[int]]:
+    sample = content[:SNIFF_SAMPLE_BYTES].decode(detect_csv_encoding(content), errors="ignore")
+    delimiter = sniff_csv_delimiter(sample)
+    lines = sample.splitlines()
+    # Последняя строка образца может быть обрезана
+    if len(content) > SNIFF_SAMPLE_BYTES:
+        lines = lines[:-1]
+    row_widths = [line.count(delimiter) + 1 if line.strip() else 0 for line in lines]
+    # В CSV нет листов — подходит под разметку любого отчёта
+    return {layout.get("sheet_name"): row_widths for layout in REPORT_LAYOUTS.values()}
+
+
+def detect_reports(content: bytes, file_format: str) -> Optional[List[str]]:
+    """
+    Определяет, на какие отчёты похож файл, по "подписи": нужный лист и
+    количество колонок в первых строках. None — формат проверить нельзя (.xls).
+    """
+    if file_format == "csv":
+        row_widths = _csv_row_widths(content)
+    else:
+        try:
+            row_widths = _xlsx_row_widths(content)
+        except Exception as e:
+            # Старый формат .xls openpyxl не читает — такой файл проверяется только при разборе
+            if content[:4] == b"\xd0\xcf\x11\xe0":
+                return None
+            raise ValueError(f"cannot read workbook: {e}")
+
+    matches = []
+    for dataset, layout in REPORT_LAYOUTS.items():
+        widths = row_widths.get(layout.get("sheet_name"))
+        if not widths:
+            continue
+        if max(widths[:layout["skip_rows"] + SNIFF_DATA_ROWS]) == layout["width"]:
+            matches.append(dataset)
+    return matches
+
+
+def check_reports(contents: Dict[str, bytes], file_formats: Dict[str, str]):
+    """
+    Быстрая проверка перед запуском обработки: каждый файл должен быть похож
+    на свой отчёт. Иначе — 422 со списком проблем (например, перепутанные файлы),
+    до того как фоновая задача очистит таблицы.
+    """
+    problems = {}
+    for dataset, content in contents.items():
+        try:
+            matches = detect_reports(content, file_formats.get(dataset, "xlsx"))
+        except ValueError as e:
+            problems[dataset] = str(e)
+            continue
+        if matches is None or dataset in matches:
+            continue
+        layout = REPORT_LAYOUTS[dataset]
+        expected = f"{layout['width']} columns"
+        if layout.get("sheet_name"):
+            expected += f" on sheet '{layout['sheet_name']}'"
+        message = f"file does not look like the {dataset} report (expected {expected})"
+        if matches:
+            message += f"; it looks like: {', '.join(matches)}"
+        problems[dataset] = message
+
+    if problems:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"message": "Files do not match the expected reports", "problems": problems}
+        )
@@ -0,0 +1,159 @@
+# data_loader_api/app/responses.py
+# Кодирование и сжатие ответов API.
+#
+# JSON кодируется orjson: UUID, даты и числа сериализуются в C без
+# jsonable_encoder и json.dumps. Строки курсора asyncpg кодируются пачкой одним
+# вызовом orjson.dumps (encode_rows).
+#
+# CompressionMiddleware сжимает ответы больше COMPRESS_MIN_BYTES в brotli или gzip,
+# выбирая по Accept-Encoding (с учётом q). Потоковые ответы (списки строк)
+# сжимаются по частям: каждая часть сразу уходит клиенту. brotli — необязательная
+# зависимость: без пакета Brotli ответы сжимаются только gzip.
+import zlib
+from typing import Optional
+
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import COMPRESS_MIN_BYTES, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Уже сжатые форматы и потоки событий не сжимаем
+EXCLUDED_CONTENT_TYPES = (
+    "text/event-stream",
+    "application/zip",
+    "application/gzip",
+    "application/vnd.openxmlformats-officedocument",
+)
+
+
+def encode_rows(rows: list) -> bytes:
+    """Строки asyncpg как элементы JSON-массива через запятую (без скобок) — одним вызовом orjson."""
+    return orjson.dumps([dict(row) for row in rows])[1:-1]
+
+
+def supported_encodings() -> tuple:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Кодировка с наибольшим q из Accept-Encoding; при равных q — br, затем gzip."""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _GzipCompressor:
+    def __init__(self):
+        # wbits=31 — формат gzip (заголовок и контрольная сумма)
+        self._compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        body = self._compressor.compress(data)
+        return body + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        body = self._compressor.process(data)
+        return body + (self._compressor.finish() if final else self._compressor.flush())
+
+
+COMPRESSORS = {"gzip": _GzipCompressor, "br": _BrotliCompressor}
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+
+class _CompressingSend:
+    """send для одного ответа: решает по первой части тела, сжимать ли ответ."""
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message: Message = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message):
+        if message["type"] == "http.response.start":
+            # Заголовки отправляются вместе с первой частью тела
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            self.passthrough = (
+                "content-encoding" in headers
+                or headers.get("content-type", "").startswith(EXCLUDED_CONTENT_TYPES)
+                or (not more_body and len(body) < self.minimum_size)
+            )
+            if not self.passthrough:
+                self.compressor = COMPRESSORS[self.encoding]()
+                headers["Content-Encoding"] = self.encoding
+                headers.add_vary_header("Accept-Encoding")
+                # Сжатое представление побайтно отличается — ETag становится слабым (как в nginx)
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    body = self.compressor.compress(body, final=True)
+                    headers["Content-Length"] = str(len(body))
+                    await self.send(start)
+                    await self.send({"type": "http.response.body", "body": body})
+                    return
+            await self.send(start)
+
+        if self.passthrough:
+            await self.send(message)
+            return
+        await self.send({
+            "type": "http.response.body",
+            "body": self.compressor.compress(body, final=not more_body),
+            "more_body": more_body,
+        })
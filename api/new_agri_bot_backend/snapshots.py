@@ -0,0 +1,184 @@
+# data_loader_api/app/snapshots.py
+# Архив снимков загруженных данных.
+#
+# После каждой успешной загрузки очищенные DataFrame по наборам данных
+# (результат разбора отчётов 1С) сохраняются в SNAPSHOT_DIR как Parquet (zstd):
+#   SNAPSHOT_DIR/<snapshot_id>/manifest.json — задача, подразделение, хеши файлов, количество строк
+#   SNAPSHOT_DIR/<snapshot_id>/<dataset>.parquet
+# snapshot_id = <время загрузки>_<id задачи>, id задачи — хеш содержимого файлов.
+#
+# Восстановление (откат на вчерашние данные или повтор загрузки для замеров)
+# не разбирает Excel: строки таблиц строятся из снимка и пишутся через COPY (loader.py).
+# Восстанавливаются только строки подразделения, которому принадлежит снимок.
+#
+# Команды Piccolo:
+#   piccolo new_agri_bot_backend list_snapshots
+#   piccolo new_agri_bot_backend restore_snapshot <snapshot_id или id задачи>
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from fastapi import HTTPException, status
+
+from .config import DATASETS, SNAPSHOT_DIR, SNAPSHOT_KEEP
+from .divisions import default_division
+from .jobs import job_path, input_path, job_division, division_lock
+
+MANIFEST_NAME = "manifest.json"
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_snapshot(job: dict) -> str:
+    """
+    Копирует очищенные DataFrame задачи (контрольные точки в Parquet) в архив снимков.
+    Вызывается после успешной загрузки, до удаления контрольных точек.
+    """
+    created_at = time.time()
+    snapshot_id = f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(created_at))}_{job['job_id']}"
+    snapshot_dir = os.path.join(SNAPSHOT_DIR, snapshot_id)
+    tmp_dir = snapshot_dir + ".tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    for dataset in DATASETS:
+        shutil.copyfile(
+            job_path(job["job_id"], "datasets", f"{dataset}.parquet"),
+            os.path.join(tmp_dir, f"{dataset}.parquet"),
+        )
+    manifest = {
+        "snapshot_id": snapshot_id,
+        "job_id": job["job_id"],
+        "division": job_division(job),
+        "created_at": created_at,
+        "file_formats": job["file_formats"],
+        # Хеши исходных файлов — по ним видно, из каких выгрузок 1С сделан снимок
+        "content_sha256": {dataset: _file_sha256(input_path(job, dataset)) for dataset in DATASETS},
+        "rows": {dataset: job["stages"].get(f"parse_{dataset}", {}).get("rows") for dataset in DATASETS},
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    # Снимок появляется в архиве целиком или не появляется совсем
+    os.replace(tmp_dir, snapshot_dir)
+    print(f"Snapshot written: {snapshot_id}")
+
+    prune_snapshots()
+    return snapshot_id
+
+
+def list_snapshot_manifests() -> list:
+    """Манифесты всех снимков, от новых к старым."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    manifests = []
+    for name in os.listdir(SNAPSHOT_DIR):
+        try:
+            with open(os.path.join(SNAPSHOT_DIR, name, MANIFEST_NAME), encoding="utf-8") as f:
+                manifests.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return sorted(manifests, key=lambda m: m["created_at"], reverse=True)
+
+
+def prune_snapshots():
+    """Оставляет SNAPSHOT_KEEP последних снимков (0 — хранить все)."""
+    if SNAPSHOT_KEEP <= 0:
+        return
+    for manifest in list_snapshot_manifests()[SNAPSHOT_KEEP:]:
+        shutil.rmtree(os.path.join(SNAPSHOT_DIR, manifest["snapshot_id"]), ignore_errors=True)
+        print(f"Old snapshot removed: {manifest['snapshot_id']}")
+
+
+def find_snapshot(key: str) -> dict:
+    """
+    Снимок по snapshot_id или самый свежий снимок задачи с id key (или однозначным
+    префиксом id). 409, если префикс подходит к снимкам нескольких задач.
+    """
+    manifests = list_snapshot_manifests()
+    for manifest in manifests:
+        if manifest["snapshot_id"] == key:
+            return manifest
+    job_ids = {manifest["job_id"] for manifest in manifests if manifest["job_id"].startswith(key)}
+    if key in job_ids:
+        job_ids = {key}
+    if len(job_ids) > 1:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Snapshot key {key} is ambiguous, it matches jobs {sorted(job_ids)}",
+        )
+    for manifest in manifests:
+        if manifest["job_id"] in job_ids:
+            return manifest
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Snapshot not found: {key}")
+
+
+def restore_snapshot_sync(key: str) -> dict:
+    """
+    Загружает снимок в PostgreSQL: строки таблиц строятся из сохранённых
+    DataFrame и пишутся через COPY. Возвращает длительность этапов.
+    Подразделение снимка занимается как задачей загрузки: 409, если его данные
+    сейчас загружаются.
+    """
+    # ingest импортирует этот модуль, поэтому импорт внутри функции
+    from .ingest import TABLES, build_table_frames, read_frame, timed_stage
+    from .loader import load_tables_graph
+
+    manifest = find_snapshot(key)
+    snapshot_dir = os.path.join(SNAPSHOT_DIR, manifest["snapshot_id"])
+    # Снимки, сделанные до разделения на подразделения, — подразделения по умолчанию
+    division = manifest.get("division") or default_division()
+    timings = {}
+    with division_lock(f"restore_{manifest['snapshot_id']}", division["code"]):
+        with timed_stage(timings, "read_snapshot"):
+            frames = {dataset: read_frame(os.path.join(snapshot_dir, f"{dataset}.parquet")) for dataset in DATASETS}
+        with timed_stage(timings, "build_tables"):
+            table_frames = build_table_frames(frames, division)
+        with timed_stage(timings, "load_tables"):
+            report = asyncio.run(load_tables_graph(TABLES, table_frames.__getitem__, division_code=division["code"]))
+    timings["load_critical_path"] = report["critical_path_seconds"]
+    print(f"Snapshot {manifest['snapshot_id']} restored: {timings}")
+    return {
+        "snapshot_id": manifest["snapshot_id"],
+        "job_id": manifest["job_id"],
+        "division": division["code"],
+        "tables": {name: info["rows"] for name, info in report["tables"].items()},
+        "timings": timings,
+    }
+
+
+# --- Команды Piccolo (см. piccolo_app.py) ---
+
+def list_snapshots():
+    """Показать архив снимков загруженных данных."""
+    manifests = list_snapshot_manifests()
+    if not manifests:
+        print(f"No snapshots in {SNAPSHOT_DIR}")
+    for manifest in manifests:
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(manifest["created_at"]))
+        rows = ", ".join(f"{dataset}={count}" for dataset, count in manifest["rows"].items())
+        division = (manifest.get("division") or {}).get("code", "-")
+        print(f"{manifest['snapshot_id']}  {created}  {division}  {rows}")
+
+
+def restore_snapshot(snapshot: str):
+    """
+    Загрузить снимок в базу данных без разбора Excel.
+
+    :param snapshot:
+        snapshot_id или id задачи загрузки либо однозначный префикс id
+        (берётся самый свежий снимок задачи).
+    """
+    try:
+        result = restore_snapshot_sync(snapshot)
+    except HTTPException as e:
+        print(e.detail)
+        return
+    print(json.dumps(result, ensure_ascii=False, indent=2))
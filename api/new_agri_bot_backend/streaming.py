@@ -0,0 +1,390 @@
+# data_loader_api/app/streaming.py
+# Потоковая загрузка строк напрямую из 1С (без выгрузки в Excel).
+#
+# POST /stream/{dataset}?division=<код> принимает тело в формате NDJSON:
+# одна строка отчёта — один JSON-объект с теми же именами колонок, что и
+# в process_* (ingest.py), например для payment:
+#   {"contract_supplement": "...", "contract_type": "...", "prepayment_amount": 1200.5, ...}
+#
+# Поддерживается только NDJSON: Arrow IPC потребовал бы синхронного чтения
+# тела целиком через pyarrow, что противоречит потоковой обработке.
+#
+# Строки проверяются и приводятся к строкам таблицы БД по мере получения тела
+# запроса и пишутся через COPY пачками по STREAM_BATCH_ROWS — без pandas и без
+# буферизации всего тела. Вся загрузка набора данных — одна транзакция:
+# строки подразделения удаляются в начале, читатели видят старые данные до
+# COMMIT, а при ошибке в любой строке или обрыве соединения ничего не меняется.
+#
+# Производные таблицы (SubmissionCoverage, Shortage, MovedProgress) после
+# загрузки пересчитываются в фоне по данным подразделения из БД.
+# Загрузка и пересчёт идут под занятым подразделением (jobs.claim_division, см.
+# main.py): задача загрузки, восстановление снимка или другой поток того же
+# подразделения в это время получают 409, а не удаляют строки параллельно.
+import asyncio
+import datetime
+import json
+import time
+import uuid
+from typing import AsyncIterator
+
+import asyncpg
+from fastapi import HTTPException, status
+
+from .config import DATABASE_URL, STREAM_BATCH_ROWS, STREAM_MAX_LINE_BYTES
+from .database import acquire_connection, get_engine
+from .generation import bump_generation
+from .loader import table_columns, upsert_records, copy_table
+from .tables import (
+    ProductGuide, Remains, AvailableStock, Submissions, Payment, MovedData,
+    SubmissionCoverage, Shortage, MovedProgress, PRODUCT_ID_NAMESPACE,
+)
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(row: dict, column: str) -> str:
+    value = row.get(column)
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list, bool)):
+        raise RowError(f"{column}: expected a string, got {type(value).__name__}")
+    return str(value)
+
+
+def _number(row: dict, column: str) -> float:
+    """Число как в ingest.to_number: "1 234,5" из 1С тоже число, пустое и нечисловое — 0."""
+    value = row.get(column)
+    if value is None:
+        return 0.0
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise RowError(f"{column}: expected a number, got {type(value).__name__}")
+    if isinstance(value, str):
+        value = value.replace("\u00a0", "").replace(" ", "").replace(",", ".")
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def _date(value: str):
+    for date_format in ("%Y-%m-%d", "%d.%m.%Y", "%Y-%m-%dT%H:%M:%S", "%d.%m.%Y %H:%M:%S"):
+        try:
+            return datetime.datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _product_name(row: dict) -> str:
+    return f"{row['nomenclature'].rstrip()} {row['party_sign'].rstrip()} {row['buying_season'].rstrip()}".rstrip()
+
+
+def _texts(row: dict, columns: list) -> dict:
+    return {column: _text(row, column) for column in columns}
+
+
+# --- Строки отчёта -> строки таблиц (те же преобразования, что в process_* и build_table_frames) ---
+
+def _submissions_row(row: dict, division: dict) -> dict:
+    values = _texts(row, [
+        "division", "manager", "company_group", "client", "contract_supplement",
+        "parent_element", "manufacturer", "active_ingredient", "nomenclature",
+        "party_sign", "buying_season", "line_of_business", "period",
+        "shipping_warehouse", "document_status", "delivery_status",
+        "shipping_address", "transport",
+    ])
+    values.update({column: _number(row, column) for column in ["plan", "fact", "different"]})
+    if values["party_sign"] == "Закупівля поточного сезону":
+        values["party_sign"] = " "
+    values["product"] = _product_name(values)
+    values["contract_supplement"] = values["contract_supplement"][23:34]
+    values["active_substance"] = values["active_ingredient"]
+    return values
+
+
+def _av_stock_row(row: dict, division: dict) -> dict:
+    values = _texts(row, [
+        "nomenclature", "party_sign", "buying_season", "division",
+        "line_of_business", "active_substance",
+    ])
+    values["available"] = _number(row, "available")
+    values["product"] = _product_name(values)
+    return values
+
+
+def _remains_row(row: dict, division: dict):
+    values = _texts(row, [
+        "line_of_business", "warehouse", "parent_element", "nomenclature",
+        "party_sign", "buying_season", "nomenclature_series", "mtn", "origin_country",
+        "germination", "crop_year", "active_substance", "certificate",
+        "certificate_start_date", "certificate_end_date",
+    ])
+    # Как в divisions.filter_remains: только склады и направления подразделения
+    if division["lines_of_business"] and values["line_of_business"] not in division["lines_of_business"]:
+        return None
+    if division["warehouses"] and values["warehouse"] not in division["warehouses"]:
+        return None
+    values.update({column: _number(row, column) for column in ["buh", "skl"]})
+    # В таблице Remains эти колонки строковые
+    values.update({column: str(_number(row, column)) for column in ["weight", "quantity_per_pallet"]})
+    values["product"] = _product_name(values)
+    return values
+
+
+def _payment_row(row: dict, division: dict) -> dict:
+    values = _texts(row, ["contract_supplement", "contract_type"])
+    values.update({column: _number(row, column) for column in [
+        "prepayment_amount", "amount_of_credit", "prepayment_percentage",
+        "loan_percentage", "planned_amount", "planned_amount_excluding_vat",
+        "actual_sale_amount", "actual_payment_amount",
+    ]})
+    return values
+
+
+def _moved_data_row(row: dict, division: dict) -> dict:
+    values = {column: _text(row, column).strip() for column in [
+        "order", "line_of_business", "product", "party_sign", "period", "contract",
+    ]}
+    values["date"] = _date(_text(row, "date"))
+    # В таблице MovedData количества строковые
+    values.update({column: str(_number(row, column)) for column in ["qt_order", "qt_moved"]})
+    return values
+
+
+# dataset -> (таблица, преобразование строки отчёта, ссылается ли таблица на ProductGuide)
+STREAM_DATASETS = {
+    "submissions": (Submissions, _submissions_row, True),
+    "av_stock": (AvailableStock, _av_stock_row, True),
+    "remains": (Remains, _remains_row, True),
+    "payment": (Payment, _payment_row, False),
+    "moved_data": (MovedData, _moved_data_row, False),
+}
+
+# Допустимые колонки строки отчёта: то, что читают преобразования выше
+STREAM_COLUMNS = {
+    "submissions": {
+        "division", "manager", "company_group", "client", "contract_supplement",
+        "parent_element", "manufacturer", "active_ingredient", "nomenclature",
+        "party_sign", "buying_season", "line_of_business", "period",
+        "shipping_warehouse", "document_status", "delivery_status",
+        "shipping_address", "transport", "plan", "fact", "different",
+    },
+    "av_stock": {
+        "nomenclature", "party_sign", "buying_season", "division",
+        "line_of_business", "active_substance", "available",
+    },
+    "remains": {
+        "line_of_business", "warehouse", "parent_element", "nomenclature",
+        "party_sign", "buying_season", "nomenclature_series", "mtn", "origin_country",
+        "germination", "crop_year", "quantity_per_pallet", "active_substance", "certificate",
+        "certificate_start_date", "certificate_end_date", "buh", "skl", "weight", "storage",
+    },
+    "payment": {
+        "contract_supplement", "contract_type", "prepayment_amount",
+        "amount_of_credit", "prepayment_percentage", "loan_percentage",
+        "planned_amount", "planned_amount_excluding_vat", "actual_sale_amount",
+        "actual_payment_amount",
+    },
+    "moved_data": {
+        "order", "date", "line_of_business", "product", "qt_order",
+        "qt_moved", "party_sign", "period", "contract",
+    },
+}
+
+# Производные таблицы, которые зависят от набора данных
+DERIVED_TABLES = {
+    "submissions": ["submission_coverage", "shortage"],
+    "remains": ["submission_coverage", "shortage"],
+    "moved_data": ["moved_progress"],
+}
+
+
+async def ndjson_lines(body: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+    """(номер строки, байты строки) из потока тела запроса, пустые строки пропускаются."""
+    buffer = bytearray()
+    line_number = 0
+    async for chunk in body:
+        buffer.extend(chunk)
+        *lines, rest = buffer.split(b"\n")
+        buffer = bytearray(rest)
+        if len(buffer) > STREAM_MAX_LINE_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Line {line_number + len(lines) + 1} is longer than {STREAM_MAX_LINE_BYTES} bytes",
+            )
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, line
+    if buffer.strip():
+        yield line_number + 1, bytes(buffer)
+
+
+def parse_row(dataset: str, line: bytes, division: dict):
+    """Строка NDJSON -> значения строки таблицы. None — строка отфильтрована."""
+    try:
+        row = json.loads(line)
+    except ValueError as e:
+        raise RowError(f"invalid JSON: {e}")
+    if not isinstance(row, dict):
+        raise RowError("expected a JSON object")
+    unknown = row.keys() - STREAM_COLUMNS[dataset]
+    if unknown:
+        raise RowError(f"unknown columns: {', '.join(sorted(unknown))}")
+    return STREAM_DATASETS[dataset][1](row, division)
+
+
+async def _write_batch(connection: asyncpg.Connection, dataset: str, batch: list, seen_products: dict):
+    table, _, references_products = STREAM_DATASETS[dataset]
+    columns = table_columns(table)
+    if references_products:
+        # Новые продукты пачки — в общий справочник (id = uuid5 от названия, как в ingest.product_ids)
+        new_products = {}
+        for values in batch:
+            if values["product"] not in seen_products:
+                product_id = uuid.uuid5(PRODUCT_ID_NAMESPACE, values["product"])
+                seen_products[values["product"]] = product_id
+                new_products[values["product"]] = (
+                    product_id, values["product"], values["line_of_business"], values["active_substance"],
+                )
+        if new_products:
+            await upsert_records(
+                connection, ProductGuide, ["id", "product", "line_of_business", "active_substance"],
+                list(new_products.values()), "product",
+            )
+        for values in batch:
+            values["product"] = seen_products[values["product"]]
+    records = [tuple(values.get(column) for column in columns) for values in batch]
+    await connection.copy_records_to_table(table._meta.tablename, records=records, columns=columns)
+
+
+async def stream_dataset(dataset: str, division: dict, body: AsyncIterator[bytes]) -> dict:
+    """
+    Заменяет строки набора данных подразделения строками из потока NDJSON.
+    422 с номером строки, если строка не проходит проверку (ничего не меняется).
+    """
+    if dataset not in STREAM_DATASETS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown dataset: {dataset}")
+    table = STREAM_DATASETS[dataset][0]
+    start = time.perf_counter()
+    rows = skipped = batches = 0
+    seen_products = {}
+
+    # Соединение из пула приложения: загрузка может идти дольше DB_QUERY_TIMEOUT_SECONDS,
+    # но каждый отдельный запрос (пачка COPY) укладывается в него
+    async with acquire_connection() as connection:
+        async with connection.transaction():
+            await connection.execute(
+                f'DELETE FROM "{table._meta.tablename}" WHERE division_code = $1', division["code"]
+            )
+            batch = []
+            async for line_number, line in ndjson_lines(body):
+                try:
+                    values = parse_row(dataset, line, division)
+                except RowError as e:
+                    raise HTTPException(
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Line {line_number}: {e}"
+                    )
+                if values is None:
+                    skipped += 1
+                    continue
+                values["id"] = uuid.uuid4()
+                values["division_code"] = division["code"]
+                batch.append(values)
+                if len(batch) >= STREAM_BATCH_ROWS:
+                    await _write_batch(connection, dataset, batch, seen_products)
+                    rows += len(batch)
+                    batches += 1
+                    batch = []
+            if batch:
+                await _write_batch(connection, dataset, batch, seen_products)
+                rows += len(batch)
+                batches += 1
+        await bump_generation(connection)
+
+    seconds = time.perf_counter() - start
+    result = {
+        "dataset": dataset,
+        "division": division["code"],
+        "rows": rows,
+        "skipped_rows": skipped,
+        "batches": batches,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds) if seconds else None,
+        "derived_tables": DERIVED_TABLES.get(dataset, []),
+    }
+    print(f"Stream loaded: {result}")
+    return result
+
+
+async def _fetch_frame(pool: asyncpg.Pool, columns: list, query: str, *args, numeric: tuple = ()):
+    import pandas as pd
+
+    records = await pool.fetch(query, *args)
+    frame = pd.DataFrame([tuple(record) for record in records], columns=columns)
+    # У пустого результата все колонки object — числовым колонкам задаём тип явно
+    return frame.astype({column: float for column in numeric})
+
+
+async def refresh_derived_tables(dataset: str, division_code: str):
+    """
+    Пересчитывает производные таблицы подразделения по данным из БД после
+    потоковой загрузки (та же логика, что в build_table_frames).
+    """
+    from .allocation import allocate_stock, build_shortages
+    from .progress import build_moved_progress
+
+    derived = DERIVED_TABLES.get(dataset)
+    if not derived:
+        return
+    start = time.perf_counter()
+    # Пул приложения (database.py); вне приложения — временный пул
+    pool = get_engine().pool
+    own_pool = pool is None
+    if own_pool:
+        pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=2)
+    try:
+        frames = {}
+        if "submission_coverage" in derived:
+            submissions = await _fetch_frame(
+                pool,
+                ["id", "product", "manager", "client", "contract_supplement", "period",
+                 "delivery_status", "document_status", "different"],
+                'SELECT id, product, manager, client, contract_supplement, period, delivery_status, '
+                'document_status, different FROM "submissions" WHERE division_code = $1',
+                division_code,
+                numeric=("different",),
+            )
+            remains = await _fetch_frame(
+                pool, ["product", "skl"], 'SELECT product, skl FROM "remains" WHERE division_code = $1', division_code,
+                numeric=("skl",),
+            )
+            product_guide = await _fetch_frame(pool, ["id", "product"], 'SELECT id, product FROM "product_guide"')
+            frames["submission_coverage"] = await asyncio.to_thread(allocate_stock, submissions, remains)
+            frames["shortage"] = await asyncio.to_thread(build_shortages, submissions, remains, product_guide)
+        if "moved_progress" in derived:
+            moved = await _fetch_frame(
+                pool,
+                ["order", "contract", "date", "qt_order", "qt_moved"],
+                'SELECT "order", contract, date, qt_order, qt_moved FROM "moved_data" WHERE division_code = $1',
+                division_code,
+            )
+            frames["moved_progress"] = await asyncio.to_thread(build_moved_progress, moved)
+
+        tables = {"submission_coverage": SubmissionCoverage, "shortage": Shortage, "moved_progress": MovedProgress}
+        for name, frame in frames.items():
+            frame.insert(0, "id", [uuid.uuid4() for _ in range(len(frame))])
+            frame.insert(1, "division_code", division_code)
+            await copy_table(pool, tables[name], frame, division_code)
+        async with pool.acquire() as connection:
+            await bump_generation(connection)
+    except Exception as e:
+        print(f"Derived tables were not refreshed after stream of {dataset} ({division_code}): {e}")
+        return
+    finally:
+        if own_pool:
+            await pool.close()
+    print(f"Derived tables {derived} refreshed for {division_code} in {time.perf_counter() - start:.3f}s")
+
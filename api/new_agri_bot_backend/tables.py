@@ -1,19 +1,39 @@
+import uuid
+
 from piccolo.table import Table
 from piccolo.columns import (
     Varchar,
     UUID,
     ForeignKey,
     Date,
-    DoublePrecision, BigInt, Boolean, Timestamptz,
+    DoublePrecision, BigInt, Boolean, Timestamptz, Integer, Text, JSONB,
 )
 
+from .config import DEFAULT_DIVISION
+
+# id продукта = uuid5(PRODUCT_ID_NAMESPACE, название): ProductGuide общий для всех
+# подразделений и дополняется при каждой загрузке, поэтому один и тот же продукт
+# в выгрузках разных подразделений должен получать один и тот же id
+PRODUCT_ID_NAMESPACE = uuid.UUID("31bcb88c-e20a-4ceb-a7be-f86285f01abe")
 
 
 
 
+
+class Division(Table):
+    """Подразделение: склады и направления для фильтрации отчётов, менеджеры для уведомлений (см. divisions.py)."""
+    id = UUID(primary_key=True)
+    code = Varchar(length=32, unique=True)
+    name = Varchar()
+    warehouses = JSONB(default=[])
+    lines_of_business = JSONB(default=[])
+    managers = JSONB(default={})  # ФИО -> Telegram ID
+
+
+# Общий для всех подразделений справочник: id = uuid5(product), см. ingest.product_ids
 class ProductGuide(Table):
     id = UUID(primary_key=True)
-    product = Varchar(null=False)
+    product = Varchar(null=False, unique=True)
     line_of_business = Varchar(null=True)
     active_substance = Varchar(null=True)
 
@@ -22,6 +42,7 @@ class ProductGuide(Table):
 
 class Remains(Table):
     id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default=DEFAULT_DIVISION, index=True)
     line_of_business = Varchar(null=False)
     warehouse = Varchar(null=True)
     parent_element = Varchar(null=True)
@@ -46,6 +67,7 @@ class Remains(Table):
 
 class Submissions(Table):
     id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default=DEFAULT_DIVISION, index=True)
     division = Varchar(null=True)
     manager = Varchar(null=True)
     company_group = Varchar(null=True)
@@ -72,6 +94,7 @@ class Submissions(Table):
 
 class AvailableStock(Table):
     id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default=DEFAULT_DIVISION, index=True)
     nomenclature = Varchar(null=True)
     party_sign = Varchar(null=True)
     buying_season = Varchar(null=True)
@@ -81,6 +104,38 @@ class AvailableStock(Table):
     product = ForeignKey(references=ProductGuide)
 
 
+class SubmissionCoverage(Table):
+    """Покрытие утверждённой заявки складским остатком (считается при загрузке, см. allocation.py)."""
+    id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default=DEFAULT_DIVISION, index=True)
+    submission = ForeignKey(references=Submissions, index=True)
+    product = ForeignKey(references=ProductGuide, index=True)
+    manager = Varchar(null=True, index=True)
+    client = Varchar(null=True)
+    contract_supplement = Varchar(null=True, index=True)
+    period = Varchar(null=True)
+    priority = Integer()
+    stock = DoublePrecision()
+    demand = DoublePrecision()
+    allocated = DoublePrecision()
+    shortfall = DoublePrecision()
+    coverage = Varchar(length=16)
+
+
+class Shortage(Table):
+    """Продукты, где спрос утверждённых заявок больше складского остатка (считается при загрузке)."""
+    id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default=DEFAULT_DIVISION, index=True)
+    product = ForeignKey(references=ProductGuide)
+    product_name = Varchar()
+    skl = DoublePrecision()
+    demand = DoublePrecision()
+    deficit = DoublePrecision(index=True)
+    submissions_count = Integer()
+    managers = Text()
+    clients = Text()
+
+
 class ProductUnderSubmissions(Table):
     id = UUID(primary_key=True)
     product = ForeignKey(references=ProductGuide)
@@ -89,6 +144,7 @@ class ProductUnderSubmissions(Table):
 
 class MovedData(Table):
     id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default=DEFAULT_DIVISION, index=True)
     product = Varchar()
     contract = Varchar(null=True)
     date = Date()
@@ -100,6 +156,20 @@ class MovedData(Table):
     order = Varchar()
 
 
+class MovedProgress(Table):
+    """Прогресс перемещения по заказу или договору (свёртка MovedData при загрузке, см. progress.py)."""
+    id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default=DEFAULT_DIVISION, index=True)
+    kind = Varchar(length=16)  # "order" или "contract"
+    key = Varchar(index=True)  # номер заказа или договор
+    contract = Varchar(null=True)
+    lines = Integer()
+    ordered = DoublePrecision()
+    moved = DoublePrecision()
+    percent = DoublePrecision()
+    last_move_date = Date(null=True, default=None)
+
+
 class MovedNot(Table):
     id = UUID(primary_key=True)
     product = Varchar()
@@ -110,6 +180,7 @@ class MovedNot(Table):
 
 class Payment(Table):
     id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default=DEFAULT_DIVISION, index=True)
     contract_supplement = Varchar()
     contract_type = Varchar()
     prepayment_amount = DoublePrecision()
@@ -130,3 +201,116 @@ class Users(Table):
     registration_date=Timestamptz()
     last_activity_date=Timestamptz()
 
+
+# --- История для анализа трендов (заполняется backfill.py по архивным выгрузкам) ---
+
+class RemainsHistory(Table):
+    id = UUID(primary_key=True)
+    snapshot_date = Date(index=True)
+    line_of_business = Varchar(null=True)
+    warehouse = Varchar(null=True)
+    parent_element = Varchar(null=True)
+    nomenclature = Varchar(null=True)
+    party_sign = Varchar(null=True)
+    buying_season = Varchar(null=True)
+    nomenclature_series = Varchar(null=True)
+    mtn = Varchar(null=True)
+    origin_country = Varchar(null=True)
+    germination = Varchar(null=True)
+    crop_year = Varchar(null=True)
+    quantity_per_pallet = DoublePrecision()
+    active_substance = Varchar(null=True)
+    certificate = Varchar(null=True)
+    certificate_start_date = Varchar(null=True)
+    certificate_end_date = Varchar(null=True)
+    buh = DoublePrecision()
+    skl = DoublePrecision()
+    weight = DoublePrecision()
+    product = Varchar(null=True)
+
+
+class SubmissionsHistory(Table):
+    id = UUID(primary_key=True)
+    snapshot_date = Date(index=True)
+    division = Varchar(null=True)
+    manager = Varchar(null=True)
+    company_group = Varchar(null=True)
+    client = Varchar(null=True)
+    contract_supplement = Varchar(null=True)
+    parent_element = Varchar(null=True)
+    manufacturer = Varchar(null=True)
+    active_ingredient = Varchar(null=True)
+    nomenclature = Varchar(null=True)
+    party_sign = Varchar(null=True)
+    buying_season = Varchar(null=True)
+    line_of_business = Varchar(null=True)
+    period = Varchar(null=True)
+    shipping_warehouse = Varchar(null=True)
+    document_status = Varchar(null=True)
+    delivery_status = Varchar(null=True)
+    shipping_address = Varchar(null=True)
+    transport = Varchar(null=True)
+    plan = DoublePrecision()
+    fact = DoublePrecision()
+    different = DoublePrecision()
+    product = Varchar(null=True)
+
+
+class AvailableStockHistory(Table):
+    id = UUID(primary_key=True)
+    snapshot_date = Date(index=True)
+    nomenclature = Varchar(null=True)
+    party_sign = Varchar(null=True)
+    buying_season = Varchar(null=True)
+    division = Varchar(null=True)
+    line_of_business = Varchar(null=True)
+    active_substance = Varchar(null=True)
+    available = DoublePrecision()
+    product = Varchar(null=True)
+
+
+class PaymentHistory(Table):
+    id = UUID(primary_key=True)
+    snapshot_date = Date(index=True)
+    contract_supplement = Varchar(null=True)
+    contract_type = Varchar(null=True)
+    prepayment_amount = DoublePrecision()
+    amount_of_credit = DoublePrecision()
+    prepayment_percentage = DoublePrecision()
+    loan_percentage = DoublePrecision()
+    planned_amount = DoublePrecision()
+    planned_amount_excluding_vat = DoublePrecision()
+    actual_sale_amount = DoublePrecision()
+    actual_payment_amount = DoublePrecision()
+
+
+class MovedDataHistory(Table):
+    id = UUID(primary_key=True)
+    snapshot_date = Date(index=True)
+    order = Varchar(null=True)
+    date = Varchar(null=True)
+    line_of_business = Varchar(null=True)
+    product = Varchar(null=True)
+    qt_order = DoublePrecision()
+    qt_moved = DoublePrecision()
+    party_sign = Varchar(null=True)
+    period = Varchar(null=True)
+    contract = Varchar(null=True)
+
+
+class HistoryLoad(Table):
+    """Дни архива, уже загруженные в историю (для продолжения backfill)."""
+    id = UUID(primary_key=True)
+    snapshot_date = Date(unique=True)
+    source = Varchar()
+    datasets = Varchar()
+    rows = Integer()
+    seconds = DoublePrecision()
+    loaded_at = Timestamptz()
+
+
+class DataGeneration(Table):
+    """Поколение данных: одна строка, счётчик увеличивается после каждой загрузки (см. generation.py)."""
+    id = Integer(primary_key=True)
+    generation = BigInt(default=0)
+    updated_at = Timestamptz()
@@ -0,0 +1,266 @@
+# data_loader_api/app/uploads.py
+# Возобновляемая (chunked) загрузка Excel/CSV-файлов.
+#
+# Протокол:
+#   1. POST /uploads/ — создаём сессию загрузки: перечисляем наборы данных,
+#      имена файлов и их размеры. В ответ получаем upload_id.
+#   2. PUT /uploads/{upload_id}/{dataset}?offset=N — отправляем кусок файла.
+#      Кусок дописывается в спул-файл на диске. offset должен совпадать
+#      с количеством уже полученных байт, иначе возвращается 409 и текущее
+#      смещение — клиент продолжает с него после обрыва связи.
+#   3. GET /uploads/{upload_id} — узнаём, сколько байт каждого файла уже получено.
+#   4. POST /uploads/{upload_id}/finalize — передаём sha256 каждого файла.
+#      Хеши проверяются, и обработка запускается только когда ВСЕ файлы
+#      набора получены полностью. Сессия удаляется, только когда задача
+#      обработки создана: после отказа (422, 409, 503) finalize можно повторить
+#      без повторной загрузки файлов.
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Dict, Tuple
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+
+from .config import DATASETS, UPLOAD_SPOOL_DIR, UPLOAD_SESSION_TTL_HOURS
+
+MANIFEST_NAME = "manifest.json"
+
+# Поддерживаемые форматы файлов по расширению
+FILE_FORMATS = {".xlsx": "xlsx", ".xls": "xlsx", ".csv": "csv", ".tsv": "csv"}
+
+# Блокировки на (upload_id, dataset), чтобы два параллельных PUT
+# не писали в один и тот же спул-файл одновременно. Удаляются вместе с сессией
+_chunk_locks: Dict[tuple, asyncio.Lock] = {}
+
+
+class UploadFileInfo(BaseModel):
+    filename: str
+    size: int
+
+
+class UploadSessionCreate(BaseModel):
+    files: Dict[str, UploadFileInfo]
+
+
+class UploadFinalize(BaseModel):
+    sha256: Dict[str, str]
+
+
+def file_format_from_name(filename: str):
+    """Формат файла ("xlsx" или "csv") по расширению. None — формат не поддерживается."""
+    return FILE_FORMATS.get(os.path.splitext(filename or "")[1].lower())
+
+
+def _session_dir(upload_id: str) -> str:
+    return os.path.join(UPLOAD_SPOOL_DIR, upload_id)
+
+
+def _spool_path(upload_id: str, dataset: str) -> str:
+    return os.path.join(_session_dir(upload_id), f"{dataset}.part")
+
+
+def _write_manifest(manifest: dict):
+    path = os.path.join(_session_dir(manifest["upload_id"]), MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _drop_chunk_locks(upload_id: str):
+    for key in [k for k in _chunk_locks if k[0] == upload_id]:
+        _chunk_locks.pop(key, None)
+
+
+def cleanup_expired_sessions():
+    """Удаляет незавершённые сессии старше UPLOAD_SESSION_TTL_HOURS."""
+    if not os.path.isdir(UPLOAD_SPOOL_DIR):
+        return
+    deadline = time.time() - UPLOAD_SESSION_TTL_HOURS * 3600
+    for upload_id in os.listdir(UPLOAD_SPOOL_DIR):
+        manifest_path = os.path.join(_session_dir(upload_id), MANIFEST_NAME)
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                created_at = json.load(f)["created_at"]
+        except (OSError, ValueError, KeyError):
+            continue
+        if created_at < deadline:
+            shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+            _drop_chunk_locks(upload_id)
+            print(f"Expired upload session removed: {upload_id}")
+
+
+def create_session(request: UploadSessionCreate) -> dict:
+    """Создаёт новую сессию загрузки и пустые спул-файлы для каждого набора данных."""
+    missing = [name for name in DATASETS if name not in request.files]
+    unknown = [name for name in request.files if name not in DATASETS]
+    if missing or unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Upload must contain exactly these datasets: {DATASETS}. "
+                   f"Missing: {missing}, unknown: {unknown}."
+        )
+    for name, info in request.files.items():
+        if file_format_from_name(info.filename) is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid file type for {name}. Only .xlsx, .xls, .csv or .tsv files are allowed."
+            )
+        if info.size <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid size for {name}: {info.size}."
+            )
+
+    cleanup_expired_sessions()
+
+    upload_id = uuid.uuid4().hex
+    os.makedirs(_session_dir(upload_id), exist_ok=True)
+    manifest = {
+        "upload_id": upload_id,
+        "created_at": time.time(),
+        "files": {name: info.model_dump() for name, info in request.files.items()},
+    }
+    for name in request.files:
+        open(_spool_path(upload_id, name), "wb").close()
+    _write_manifest(manifest)
+    return manifest
+
+
+def load_session(upload_id: str) -> dict:
+    # upload_id попадает в путь на диске, поэтому принимаем только hex
+    if not upload_id.isalnum():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    try:
+        with open(os.path.join(_session_dir(upload_id), MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except OSError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+
+
+def session_status(manifest: dict) -> dict:
+    """Сколько байт каждого файла уже получено. Размер спул-файла — единственный источник правды."""
+    upload_id = manifest["upload_id"]
+    datasets = {}
+    for name, info in manifest["files"].items():
+        received = os.path.getsize(_spool_path(upload_id, name))
+        datasets[name] = {
+            "filename": info["filename"],
+            "size": info["size"],
+            "received": received,
+            "complete": received == info["size"],
+        }
+    return {
+        "upload_id": upload_id,
+        "complete": all(d["complete"] for d in datasets.values()),
+        "datasets": datasets,
+    }
+
+
+async def append_chunk(upload_id: str, dataset: str, offset: int, chunks: AsyncIterator[bytes]) -> dict:
+    """Дописывает тело запроса в спул-файл набора данных, начиная с offset."""
+    manifest = load_session(upload_id)
+    if dataset not in manifest["files"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown dataset {dataset}")
+    size = manifest["files"][dataset]["size"]
+    path = _spool_path(upload_id, dataset)
+
+    lock = _chunk_locks.setdefault((upload_id, dataset), asyncio.Lock())
+    async with lock:
+        received = os.path.getsize(path)
+        if offset != received:
+            # Клиент должен продолжить с того места, где остановился сервер
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"message": "Offset mismatch", "dataset": dataset, "received": received}
+            )
+        # Пишем по мере получения: если соединение оборвётся на середине,
+        # уже полученные байты останутся в спуле и докачка продолжится с них.
+        # Запись на диск идёт в потоке, чтобы не останавливать цикл событий
+        f = await asyncio.to_thread(open, path, "ab")
+        try:
+            async for chunk in chunks:
+                if received + len(chunk) > size:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Chunk exceeds declared size of {dataset} ({size} bytes)"
+                    )
+                await asyncio.to_thread(f.write, chunk)
+                received += len(chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+
+    return {"dataset": dataset, "received": received, "size": size, "complete": received == size}
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def finalize_session(upload_id: str, hashes: Dict[str, str]) -> Tuple[Dict[str, bytes], Dict[str, str]]:
+    """
+    Проверяет, что все файлы получены полностью и их sha256 совпадают.
+    Возвращает содержимое и формат файлов по наборам данных. Сессия не удаляется:
+    её удаляет remove_session, когда обработка запущена.
+    """
+    manifest = load_session(upload_id)
+    # Пока файлы хешируются и читаются, PUT того же набора не может их дописать
+    async with AsyncExitStack() as stack:
+        for name in sorted(manifest["files"]):
+            await stack.enter_async_context(_chunk_locks.setdefault((upload_id, name), asyncio.Lock()))
+        # Хеширование и чтение больших файлов — в потоке, вне цикла событий
+        return await asyncio.to_thread(_verify_session, manifest, hashes)
+
+
+def _verify_session(manifest: dict, hashes: Dict[str, str]) -> Tuple[Dict[str, bytes], Dict[str, str]]:
+    upload_id = manifest["upload_id"]
+    current = session_status(manifest)
+
+    incomplete = [name for name, d in current["datasets"].items() if not d["complete"]]
+    if incomplete:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Upload is not complete", "incomplete": incomplete, "status": current}
+        )
+
+    mismatched = []
+    for name in manifest["files"]:
+        expected = hashes.get(name, "").lower()
+        actual = _file_sha256(_spool_path(upload_id, name))
+        if expected != actual:
+            mismatched.append(name)
+            # Битый файл нужно перезалить целиком — обнуляем его спул
+            open(_spool_path(upload_id, name), "wb").close()
+    if mismatched:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"message": "SHA-256 mismatch, re-upload these datasets", "datasets": mismatched}
+        )
+
+    contents = {}
+    for name in manifest["files"]:
+        with open(_spool_path(upload_id, name), "rb") as f:
+            contents[name] = f.read()
+    file_formats = {name: file_format_from_name(info["filename"]) for name, info in manifest["files"].items()}
+    return contents, file_formats
+
+
+def delete_session(upload_id: str):
+    load_session(upload_id)
+    remove_session(upload_id)
+
+
+def remove_session(upload_id: str):
+    """Удаляет спул сессии (уже удалённая сессия — не ошибка)."""
+    shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+    _drop_chunk_locks(upload_id)
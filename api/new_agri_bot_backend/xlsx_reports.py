@@ -0,0 +1,260 @@
+# data_loader_api/app/xlsx_reports.py
+# Отчёты XLSX для пользователей Excel: заявки по менеджеру, остатки по складу, дефицит.
+#
+# Файл строится в отдельном процессе (пул REPORT_WORKERS процессов), чтобы запись
+# XLSX не занимала GIL процесса API. Процесс читает строки серверным курсором
+# asyncpg пачками и пишет их xlsxwriter в режиме constant_memory: каждая строка
+# сразу сбрасывается на диск, память не зависит от размера отчёта.
+#
+# Готовые файлы кешируются в REPORT_CACHE_DIR/g<поколение>/ по отчёту, подразделению
+# и фильтрам: до следующей загрузки данных повторное скачивание отдаёт готовый файл.
+# Каталоги прошлых поколений удаляются при построении отчёта нового поколения, но
+# не сразу: файл из них может ещё отдаваться (FileResponse) или строиться по запросу,
+# пришедшему до загрузки данных. Удаляется только каталог поколения старше текущего,
+# в котором ничего не строится и ничего не появлялось REPORT_GENERATION_GRACE_SECONDS.
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+
+import asyncpg
+from fastapi import HTTPException, status
+
+from .config import (
+    DATABASE_URL, REPORT_CACHE_DIR, REPORT_WORKERS, REPORT_GENERATION_GRACE_SECONDS, EXPORT_CURSOR_PREFETCH,
+)
+from .listing import filter_conditions
+
+# Excel: 1 048 576 строк на лист, одна занята заголовком
+XLSX_MAX_ROWS = 1048575
+
+# Отчёт -> таблица, обязательные и необязательные фильтры (параметр -> колонка),
+# колонки (колонка -> заголовок) и сортировка
+REPORTS = {
+    "submissions_by_manager": {
+        "title": "Заявки менеджера",
+        "table": "submissions",
+        "required": {"manager": "manager"},
+        "filters": {"line_of_business": "line_of_business", "document_status": "document_status"},
+        "columns": {
+            "client": "Клієнт",
+            "contract_supplement": "Доповнення до договору",
+            "nomenclature": "Номенклатура",
+            "party_sign": "Ознака партії",
+            "buying_season": "Сезон закупівлі",
+            "line_of_business": "Напрямок",
+            "period": "Період",
+            "shipping_warehouse": "Склад відвантаження",
+            "document_status": "Статус документа",
+            "delivery_status": "Статус доставки",
+            "plan": "План",
+            "fact": "Факт",
+            "different": "Різниця",
+        },
+        "order_by": ["client", "contract_supplement", "nomenclature"],
+    },
+    "remains_by_warehouse": {
+        "title": "Залишки складу",
+        "table": "remains",
+        "required": {"warehouse": "warehouse"},
+        "filters": {"line_of_business": "line_of_business"},
+        "columns": {
+            "line_of_business": "Напрямок",
+            "nomenclature": "Номенклатура",
+            "party_sign": "Ознака партії",
+            "buying_season": "Сезон закупівлі",
+            "nomenclature_series": "Серія",
+            "crop_year": "Рік врожаю",
+            "germination": "Схожість",
+            "active_substance": "Діюча речовина",
+            "buh": "Бух. залишок",
+            "skl": "Скл. залишок",
+        },
+        "order_by": ["line_of_business", "nomenclature"],
+    },
+    "shortages": {
+        "title": "Дефіцит",
+        "table": "shortage",
+        "required": {},
+        "filters": {},
+        "columns": {
+            "product_name": "Продукт",
+            "skl": "Скл. залишок",
+            "demand": "Попит",
+            "deficit": "Дефіцит",
+            "submissions_count": "Заявок",
+            "managers": "Менеджери",
+            "clients": "Клієнти",
+        },
+        "order_by": ["deficit DESC"],
+    },
+}
+
+# Отчёты, которые уже строятся в этом процессе: путь файла -> задача построения.
+# Задача не привязана к запросу: если клиент, запросивший отчёт первым, отключился,
+# остальные запросы всё равно получают файл
+_building: Dict[str, asyncio.Task] = {}
+_pool = None
+
+
+def _report_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=REPORT_WORKERS)
+    return _pool
+
+
+def shutdown_report_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+def report_filters(report: str, params: Dict[str, str]) -> Dict[str, str]:
+    """Фильтры отчёта из параметров запроса: 404 для неизвестного отчёта, 400 для лишних или пропущенных."""
+    if report not in REPORTS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown report: {report}")
+    definition = REPORTS[report]
+    allowed = {**definition["required"], **definition["filters"]}
+    unknown = set(params) - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown filters for {report}: {sorted(unknown)}. Allowed: {sorted(allowed)}",
+        )
+    missing = [name for name in definition["required"] if not params.get(name)]
+    if missing:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Report {report} requires {missing}")
+    return {name: params[name] for name in sorted(params)}
+
+
+def report_query(report: str, division_code: str, filters: Dict[str, str]):
+    definition = REPORTS[report]
+    listing = {"filters": {**definition["required"], **definition["filters"]}}
+    conditions, args = filter_conditions(listing, division_code, filters)
+    columns = ", ".join(f'"{column}"' for column in definition["columns"])
+    order_by = ", ".join(definition["order_by"])
+    query = (
+        f'SELECT {columns} FROM "{definition["table"]}" '
+        f'WHERE {" AND ".join(conditions)} ORDER BY {order_by}'
+    )
+    return query, args
+
+
+def report_path(generation: int, report: str, division_code: str, filters: Dict[str, str]) -> str:
+    key = "&".join(f"{name}={value}" for name, value in filters.items())
+    digest = hashlib.sha256(f"{report}|{division_code}|{key}".encode()).hexdigest()[:16]
+    return os.path.join(REPORT_CACHE_DIR, f"g{generation}", f"{report}_{division_code}_{digest}.xlsx")
+
+
+async def _write_report(report: str, query: str, args: list, path: str) -> int:
+    # xlsxwriter нужен только процессам пула, процессу API его импорт не нужен
+    import xlsxwriter
+    definition = REPORTS[report]
+    headers = list(definition["columns"].values())
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
+        sheet = workbook.add_worksheet(definition["title"][:31])
+        header_format = workbook.add_format({"bold": True, "bg_color": "#D9E1F2", "border": 1})
+        number_format = workbook.add_format({"num_format": "#,##0.000"})
+        for col, header in enumerate(headers):
+            sheet.set_column(col, col, max(12, min(40, len(header) + 4)))
+        sheet.write_row(0, 0, headers, header_format)
+        sheet.freeze_panes(1, 0)
+
+        rows_written = 0
+        connection = await asyncpg.connect(DATABASE_URL)
+        try:
+            async with connection.transaction(isolation="repeatable_read", readonly=True):
+                cursor = await connection.cursor(query, *args)
+                while True:
+                    rows = await cursor.fetch(EXPORT_CURSOR_PREFETCH)
+                    if not rows:
+                        break
+                    if rows_written + len(rows) > XLSX_MAX_ROWS:
+                        raise ValueError(f"Report has more than {XLSX_MAX_ROWS} rows, use /export/ instead")
+                    for row in rows:
+                        rows_written += 1
+                        for col, value in enumerate(row):
+                            if isinstance(value, float):
+                                sheet.write_number(rows_written, col, value, number_format)
+                            elif value is not None:
+                                sheet.write_string(rows_written, col, str(value))
+        finally:
+            await connection.close()
+        sheet.autofilter(0, 0, max(rows_written, 1), len(headers) - 1)
+    finally:
+        workbook.close()
+    return rows_written
+
+
+def build_report_file(report: str, query: str, args: list, path: str) -> int:
+    """Строит файл отчёта в процессе пула: запись во временный файл и атомарная замена."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        rows = asyncio.run(_write_report(report, query, args, tmp_path))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+
+def _remove_old_generations(generation: int, building: set):
+    """Удаляет каталоги поколений старше generation, кроме строящихся и недавно использованных."""
+    deadline = time.time() - REPORT_GENERATION_GRACE_SECONDS
+    for name in os.listdir(REPORT_CACHE_DIR):
+        path = os.path.join(REPORT_CACHE_DIR, name)
+        if not (name.startswith("g") and name[1:].isdigit()) or int(name[1:]) >= generation or path in building:
+            continue
+        try:
+            # mtime каталога меняется, когда в нём появляется новый файл отчёта
+            if os.path.getmtime(path) > deadline:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        print(f"Report cache generation removed: {name}")
+
+
+async def _build_report(report: str, division_code: str, filters: Dict[str, str], generation: int, path: str) -> str:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        building = {os.path.dirname(other) for other in _building}
+        await asyncio.to_thread(_remove_old_generations, generation, building)
+        query, args = report_query(report, division_code, filters)
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(
+                _report_pool(), build_report_file, report, query, args, path
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        print(f"Report {report} ({division_code}, {filters}) built: {rows} rows -> {path}")
+        return path
+    finally:
+        _building.pop(path, None)
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Все запросы отчёта могли отключиться; без этого ошибка логируется как "never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+async def get_report_file(report: str, division_code: str, params: Dict[str, str], generation: int) -> str:
+    """Путь к готовому файлу отчёта: из кеша поколения или построенный в пуле процессов."""
+    filters = report_filters(report, params)
+    generation = generation or 0
+    path = report_path(generation, report, division_code, filters)
+    if os.path.exists(path):
+        return path
+    # Тот же отчёт уже строится по другому запросу — ждём его построения
+    task = _building.get(path)
+    if task is None:
+        task = asyncio.create_task(_build_report(report, division_code, filters, generation, path))
+        task.add_done_callback(_retrieve_exception)
+        _building[path] = task
+    # Отмена запроса (клиент отключился) не отменяет построение
+    return await asyncio.shield(task)
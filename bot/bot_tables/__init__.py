@@ -3,8 +3,11 @@ from .tables import (
     Remains,
     Submissions,
     AvailableStock,
+    SubmissionCoverage,
+    Shortage,
     ProductUnderSubmissions,
     MovedData,
+    MovedProgress,
     MovedNot,
     Payment,
 )
@@ -14,8 +17,11 @@ __all__ = [
     "Remains",
     "Submissions",
     "AvailableStock",
+    "SubmissionCoverage",
+    "Shortage",
     "ProductUnderSubmissions",
     "MovedData",
+    "MovedProgress",
     "MovedNot",
     "Payment",
 ]
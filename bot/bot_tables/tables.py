@@ -5,6 +5,8 @@ from piccolo.columns import (
     ForeignKey,
     Date,
     DoublePrecision,
+    Integer,
+    Text,
 )
 
 
@@ -22,6 +24,7 @@ class ProductGuide(Table):
 
 class Remains(Table):
     id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default="kharkiv", index=True)
     line_of_business = Varchar(null=False)
     warehouse = Varchar(null=True)
     parent_element = Varchar(null=True)
@@ -46,6 +49,7 @@ class Remains(Table):
 
 class Submissions(Table):
     id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default="kharkiv", index=True)
     division = Varchar(null=True)
     manager = Varchar(null=True)
     company_group = Varchar(null=True)
@@ -81,6 +85,36 @@ class AvailableStock(Table):
     product = ForeignKey(references=ProductGuide)
 
 
+class SubmissionCoverage(Table):
+    id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default="kharkiv", index=True)
+    submission = ForeignKey(references=Submissions, index=True)
+    product = ForeignKey(references=ProductGuide, index=True)
+    manager = Varchar(null=True, index=True)
+    client = Varchar(null=True)
+    contract_supplement = Varchar(null=True, index=True)
+    period = Varchar(null=True)
+    priority = Integer()
+    stock = DoublePrecision()
+    demand = DoublePrecision()
+    allocated = DoublePrecision()
+    shortfall = DoublePrecision()
+    coverage = Varchar(length=16)
+
+
+class Shortage(Table):
+    id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default="kharkiv", index=True)
+    product = ForeignKey(references=ProductGuide)
+    product_name = Varchar()
+    skl = DoublePrecision()
+    demand = DoublePrecision()
+    deficit = DoublePrecision(index=True)
+    submissions_count = Integer()
+    managers = Text()
+    clients = Text()
+
+
 class ProductUnderSubmissions(Table):
     id = UUID(primary_key=True)
     product = ForeignKey(references=ProductGuide)
@@ -100,6 +134,19 @@ class MovedData(Table):
     order = Varchar()
 
 
+class MovedProgress(Table):
+    id = UUID(primary_key=True)
+    division_code = Varchar(length=32, default="kharkiv", index=True)
+    kind = Varchar(length=16)
+    key = Varchar(index=True)
+    contract = Varchar(null=True)
+    lines = Integer()
+    ordered = DoublePrecision()
+    moved = DoublePrecision()
+    percent = DoublePrecision()
+    last_move_date = Date(null=True, default=None)
+
+
 class MovedNot(Table):
     id = UUID(primary_key=True)
     product = Varchar()
@@ -9,6 +9,9 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from bot.utils.db.get_products import get_products, get_product_by_id
 from bot.utils.db.get_remains import get_remains
 from bot.utils.db.get_submissions import get_submissions
+from bot.utils.db.get_coverage import get_submission_coverage
+from bot.utils.db.get_shortages import get_shortages, SHORTAGES_PAGE_SIZE
+from bot.utils.db.get_moved_progress import get_moved_progress
 
 import aiohttp
 import re
@@ -37,12 +40,15 @@ class BotStates(StatesGroup):
     waiting_for_product_selection = State()
     waiting_for_submissions_nomenclature = State()
     waiting_for_submissions_product_selection = State()
+    waiting_for_moved_query = State()
 
 class RegistrationStates(StatesGroup):
     waiting_for_fio = State()
 
 # URL бэкенда для проверки логина (в docker-compose обычно eridon_api:8000)
 API_BASE_URL = os.getenv("API_BASE_URL", "http://eridon_api:8000")
+# Общий секрет с API: подтверждать коды входа может только бот (заголовок X-Bot-Token)
+BOT_API_TOKEN = os.getenv("BOT_API_TOKEN", "")
 
 # Основное меню и команды
 @router.message(CommandStart())
@@ -180,7 +186,8 @@ async def verify_login_token(message: types.Message, token: str, telegram_id: in
         async with aiohttp.ClientSession() as session:
             url = f"{API_BASE_URL}/auth/confirm-login-token"
             payload = {"token": token, "telegram_id": telegram_id}
-            async with session.post(url, json=payload, timeout=5) as resp:
+            headers = {"X-Bot-Token": BOT_API_TOKEN}
+            async with session.post(url, json=payload, headers=headers, timeout=5) as resp:
                 if resp.status == 200:
                     data = await resp.json()
                     if data.get("success"):
@@ -257,6 +264,8 @@ async def cmd_set_default_commands(message: types.Message):
     default_commands = [
         BotCommand(command="remains", description="📦 Залишки"),
         BotCommand(command="orders", description="📄 Заявки на товар"),
+        BotCommand(command="shortages", description="⚠️ Дефіцит товару"),
+        BotCommand(command="moved", description="🚚 Переміщення по заказу"),
         # BotCommand(command="help", description="❓ Получить помощь"),
         # BotCommand(command="settings", description="⚙️ Изменить настройки"),
         # BotCommand(command="about", description="ℹ️ О боте"),
@@ -583,6 +592,17 @@ async def process_product_selection(callback_query: types.CallbackQuery,
         pass
 
 
+def format_coverage(coverage) -> str:
+    """Текст покрытия заявки складским остатком (таблица SubmissionCoverage)."""
+    if not coverage:
+        return "—"
+    if coverage['coverage'] == "full":
+        return "✅ повністю"
+    if coverage['coverage'] == "partial":
+        return f"⚠️ частково ({coverage['allocated']:.2f} з {coverage['demand']:.2f})"
+    return "❌ не забезпечено"
+
+
 # Поиск заявок (`/orders`)
 @router.message(Command("orders"))
 async def cmd_submissions_start(message: types.Message, state: FSMContext):
@@ -665,6 +685,10 @@ async def process_submissions_product_selection(
             return
 
         submissions_data = await get_submissions(product_entry[0]['id'])
+        # Покрытие заявок складским остатком считается при загрузке данных
+        coverage_by_submission = {
+            c['submission']: c for c in await get_submission_coverage(product_entry[0]['id'])
+        }
 
         response_parts = []
         if submissions_data:
@@ -676,7 +700,8 @@ async def process_submissions_product_selection(
                     f"  - Контрагент: {s['client']}\n"
                     f"  - Менеджер: {s['manager']}\n"
                     f"  - Доповнення: {s['contract_supplement']}\n"
-                    f"  - Кількість: {s['different']}\n\n"
+                    f"  - Кількість: {s['different']}\n"
+                    f"  - Забезпечення: {format_coverage(coverage_by_submission.get(s['id']))}\n\n"
                 )
         else:
             response_parts.append(
@@ -740,6 +765,10 @@ async def show_submissions_for_product(callback_query: types.CallbackQuery,
             return
 
         submissions_data = await get_submissions(product_entry[0]['id'])
+        # Покрытие заявок складским остатком считается при загрузке данных
+        coverage_by_submission = {
+            c['submission']: c for c in await get_submission_coverage(product_entry[0]['id'])
+        }
 
         response_parts = []
         if submissions_data:
@@ -751,7 +780,8 @@ async def show_submissions_for_product(callback_query: types.CallbackQuery,
                     f"  - Контрагент: {s['client']}\n"
                     f"  - Менеджер: {s['manager']}\n"
                     f"  - Доповнення: {s['contract_supplement']}\n"
-                    f"  - Кількість: {s['different']}\n\n"
+                    f"  - Кількість: {s['different']}\n"
+                    f"  - Забезпечення: {format_coverage(coverage_by_submission.get(s['id']))}\n\n"
                 )
         else:
             response_parts.append(
@@ -786,4 +816,102 @@ async def echo_message(message: types.Message):
             "Сюди приходять тільки оповіщення. Спілкування в цьому чаті неможливе.",
             parse_mode=ParseMode.HTML)
     # Игнорируем всё остальное (сервисные сообщения, медиа без текста и т.д.)
-    return
\ No newline at end of file
+    return
+
+
+# Отчёт о дефиците (`/shortages`): считается при загрузке данных, здесь только постраничный вывод
+async def render_shortages_page(page: int):
+    shortages, total = await get_shortages(page)
+    pages = max(1, (total + SHORTAGES_PAGE_SIZE - 1) // SHORTAGES_PAGE_SIZE)
+
+    if not shortages:
+        return "✅ Дефіциту немає: залишків вистачає на всі затверджені заявки.", None
+
+    response_parts = [f"⚠️ <b>Дефіцит товару</b> (сторінка {page} з {pages})\n\n"]
+    for s in shortages:
+        response_parts.append(
+            f"<b>{s['product_name']}</b>\n"
+            f"  - Склад: <code>{s['skl']:.2f}</code>\n"
+            f"  - Під заявками: <code>{s['demand']:.2f}</code> ({s['submissions_count']} заявок)\n"
+            f"  - Дефіцит: <code>{s['deficit']:.2f}</code>\n"
+            f"  - Менеджери: {s['managers']}\n"
+            f"  - Контрагенти: {s['clients']}\n\n"
+        )
+    final_response = "".join(response_parts)
+    if len(final_response) > 4000:
+        final_response = final_response[:4000] + "…"
+
+    builder = InlineKeyboardBuilder()
+    if page > 1:
+        builder.button(text="⬅️ Назад", callback_data=f"shortages_page:{page - 1}")
+    if page < pages:
+        builder.button(text="Далі ➡️", callback_data=f"shortages_page:{page + 1}")
+    return final_response, builder.as_markup()
+
+
+@router.message(Command("shortages"))
+async def cmd_shortages(message: types.Message, state: FSMContext):
+    await state.clear()
+    try:
+        text, markup = await render_shortages_page(1)
+        await message.answer(text, reply_markup=markup, parse_mode=ParseMode.HTML)
+    except Exception as e:
+        print(f"Ошибка при получении дефицита: {e}")
+        await message.answer(
+            f"Сталася помилка під час отримання дефіциту. Спробуйте ще раз. Помилка: <code>{e}</code>",
+            parse_mode=ParseMode.HTML)
+
+
+@router.callback_query(lambda c: c.data and c.data.startswith('shortages_page:'))
+async def process_shortages_page(callback_query: types.CallbackQuery):
+    await callback_query.answer()
+    page = int(callback_query.data.split(':')[1])
+    try:
+        text, markup = await render_shortages_page(page)
+        await callback_query.message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
+    except Exception as e:
+        print(f"Ошибка при получении дефицита: {e}")
+        await callback_query.message.answer(
+            f"Сталася помилка під час отримання дефіциту. Спробуйте ще раз. Помилка: <code>{e}</code>",
+            parse_mode=ParseMode.HTML)
+
+
+# Прогресс перемещения по номеру заказа или договору (`/moved`)
+@router.message(Command("moved"))
+async def cmd_moved_start(message: types.Message, state: FSMContext):
+    await message.answer("Будь ласка, вкажіть номер заказу або договір:")
+    await state.set_state(BotStates.waiting_for_moved_query)
+
+
+@router.message(BotStates.waiting_for_moved_query)
+async def process_moved_query(message: types.Message, state: FSMContext):
+    query = (message.text or "").strip()
+    if not query:
+        await message.answer("Ви нічого не ввели. Будь ласка, вкажіть номер заказу або договір.")
+        return
+    await state.clear()
+
+    try:
+        progress_rows = await get_moved_progress(query)
+        if not progress_rows:
+            await message.answer(
+                f"Не знайдено заказ або договір: <b>{query}</b>.", parse_mode=ParseMode.HTML)
+            return
+
+        kind_labels = {"order": "Заказ", "contract": "Договір"}
+        response_parts = []
+        for p in progress_rows:
+            last_move = p['last_move_date'].strftime('%d.%m.%Y') if p['last_move_date'] else "—"
+            response_parts.append(
+                f"🚚 <b>{kind_labels.get(p['kind'], p['kind'])}: {p['key']}</b>\n"
+                f"  - Договір: {p['contract']}\n"
+                f"  - Замовлено: <code>{p['ordered']:.2f}</code>\n"
+                f"  - Переміщено: <code>{p['moved']:.2f}</code> ({p['percent']:.1f}%)\n"
+                f"  - Останнє переміщення: {last_move}\n\n"
+            )
+        await message.answer("".join(response_parts), parse_mode=ParseMode.HTML)
+    except Exception as e:
+        print(f"Ошибка при поиске перемещений: {e}")
+        await message.answer(
+            f"Сталася помилка під час пошуку переміщень. Спробуйте ще раз. Помилка: <code>{e}</code>",
+            parse_mode=ParseMode.HTML)
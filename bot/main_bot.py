@@ -36,6 +36,8 @@ async def set_new_commands(bot: Bot):
     new_commands = [
         BotCommand(command="remains", description="📦 Залишки"),
         BotCommand(command="orders", description="📄 Заявки на товар"),
+        BotCommand(command="shortages", description="⚠️ Дефіцит товару"),
+        BotCommand(command="moved", description="🚚 Переміщення по заказу"),
         BotCommand(command="admin", description="🛠️ Меню адміна"),
         # BotCommand(command="help", description="❓ Получить помощь"),
         # BotCommand(command="settings", description="⚙️ Изменить настройки"),
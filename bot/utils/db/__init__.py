@@ -0,0 +1,4 @@
+import os
+
+# Подразделение, данные которого показывает бот (код подразделения в API, колонка division_code)
+BOT_DIVISION = os.getenv("BOT_DIVISION", "kharkiv")
@@ -0,0 +1,6 @@
+from bot.bot_tables import SubmissionCoverage
+from bot.utils.db import BOT_DIVISION
+
+async def get_submission_coverage(id_product: str, division: str = BOT_DIVISION):
+    coverage = await SubmissionCoverage.select().where((SubmissionCoverage.product==id_product)&(SubmissionCoverage.division_code==division)).order_by(SubmissionCoverage.priority)
+    return coverage
\ No newline at end of file
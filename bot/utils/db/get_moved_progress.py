@@ -0,0 +1,6 @@
+from bot.bot_tables import MovedProgress
+from bot.utils.db import BOT_DIVISION
+
+async def get_moved_progress(query: str, division: str = BOT_DIVISION):
+    progress = await MovedProgress.select().where((MovedProgress.key==query.strip())&(MovedProgress.division_code==division)).order_by(MovedProgress.kind, ascending=False)
+    return progress
\ No newline at end of file
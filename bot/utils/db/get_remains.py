@@ -1,5 +1,6 @@
 from bot.bot_tables import Remains
+from bot.utils.db import BOT_DIVISION
 
-async def get_remains(id_product: str):
-    remains = await Remains.select().where(Remains.product==id_product)
+async def get_remains(id_product: str, division: str = BOT_DIVISION):
+    remains = await Remains.select().where((Remains.product==id_product)&(Remains.division_code==division))
     return remains
\ No newline at end of file
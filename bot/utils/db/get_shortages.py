@@ -0,0 +1,9 @@
+from bot.bot_tables import Shortage
+from bot.utils.db import BOT_DIVISION
+
+SHORTAGES_PAGE_SIZE = 10
+
+async def get_shortages(page: int, division: str = BOT_DIVISION):
+    total = await Shortage.count().where(Shortage.division_code==division)
+    shortages = await Shortage.select().where(Shortage.division_code==division).order_by(Shortage.deficit, ascending=False).limit(SHORTAGES_PAGE_SIZE).offset((page - 1) * SHORTAGES_PAGE_SIZE)
+    return shortages, total
\ No newline at end of file
@@ -1,5 +1,6 @@
 from bot.bot_tables import Submissions
+from bot.utils.db import BOT_DIVISION
 
-async def get_submissions(id_product: str):
-    submissions = await Submissions.select().where((Submissions.product==id_product)&(Submissions.different>0)&(Submissions.document_status=="затверджено"))
+async def get_submissions(id_product: str, division: str = BOT_DIVISION):
+    submissions = await Submissions.select().where((Submissions.product==id_product)&(Submissions.different>0)&(Submissions.document_status=="затверджено")&(Submissions.division_code==division))
     return submissions
\ No newline at end of file